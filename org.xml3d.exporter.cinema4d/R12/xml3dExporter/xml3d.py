@@ -24,752 +24,186 @@
 # 
 #####################################################################################
 
+import array
+
 try:
-	from xml.dom.minidom import Document, Element, Childless, Text, _write_data
+	from xml.dom.minidom import Document, Element, Node, Childless, _write_data
 except:
-	print "\nError! Could not find XML modules!"
-
-class XML3DDocument( Document ):
-	""" An XML3D Document ( xml3d.org ) """
-
-	def createXml3dElement( self, id_ = None, height_ = None, width_ = None, activeView_ = None ):
-		#print 'Creating element  xml3d'
-		e = _Xml3dElement( id_, height_, width_, activeView_ )
-		e.ownerDocument = self
-		return e
-		
-	def createDataElement( self, id_ = None, map_ = None, expose_ = None, src_ = None, script_ = None ):
-		#print 'Creating element  data'
-		e = _DataElement( id_, map_, expose_, src_, script_ )
-		e.ownerDocument = self
-		return e
-		
-	def createDefsElement( self, id_ = None ):
-		#print 'Creating element  defs'
-		e = _DefsElement( id_ )
-		e.ownerDocument = self
-		return e
-		
-	def createGroupElement( self, id_ = None, visible_ = None, transform_ = None, shader_ = None ):
-		#print 'Creating element  group'
-		e = _GroupElement( id_, visible_, transform_, shader_ )
-		e.ownerDocument = self
-		return e
-		
-	def createMeshElement( self, id_ = None, visible_ = None, type_ = None, src_ = None ):
-		#print 'Creating element  mesh'
-		e = _MeshElement( id_, visible_, type_, src_ )
-		e.ownerDocument = self
-		return e
-		
-	def createTransformElement( self, id_ = None, translation_ = None, scale_ = None, rotation_ = None, center_ = None, scaleOrientation_ = None ):
-		#print 'Creating element  transform'
-		e = _TransformElement( id_, translation_, scale_, rotation_, center_, scaleOrientation_ )
-		e.ownerDocument = self
-		return e
-		
-	def createShaderElement( self, id_ = None, script_ = None, src_ = None ):
-		#print 'Creating element  shader'
-		e = _ShaderElement( id_, script_, src_ )
-		e.ownerDocument = self
-		return e
-		
-	def createLightElement( self, id_ = None, visible_ = None, shader_ = None, global_ = None, intensity_ = None ):
-		#print 'Creating element  light'
-		e = _LightElement( id_, visible_, shader_, global_, intensity_ )
-		e.ownerDocument = self
-		return e
-		
-	def createLightshaderElement( self, id_ = None, script_ = None, src_ = None ):
-		#print 'Creating element  lightshader'
-		e = _LightshaderElement( id_, script_, src_ )
-		e.ownerDocument = self
-		return e
-		
-	def createScriptElement( self, id_ = None, src_ = None, type_ = None ):
-		#print 'Creating element  script'
-		e = _ScriptElement( id_, src_, type_ )
-		e.ownerDocument = self
-		return e
-		
-	def createFloatElement( self, id_ = None, name_ = None ):
-		#print 'Creating element  float'
-		e = _FloatElement( id_, name_ )
-		e.ownerDocument = self
-		return e
-		
-	def createFloat2Element( self, id_ = None, name_ = None ):
-		#print 'Creating element  float2'
-		e = _Float2Element( id_, name_ )
-		e.ownerDocument = self
-		return e
-		
-	def createFloat3Element( self, id_ = None, name_ = None ):
-		#print 'Creating element  float3'
-		e = _Float3Element( id_, name_ )
-		e.ownerDocument = self
-		return e
-		
-	def createFloat4Element( self, id_ = None, name_ = None ):
-		#print 'Creating element  float4'
-		e = _Float4Element( id_, name_ )
-		e.ownerDocument = self
-		return e
-		
-	def createFloat4x4Element( self, id_ = None, name_ = None ):
-		#print 'Creating element  float4x4'
-		e = _Float4x4Element( id_, name_ )
-		e.ownerDocument = self
-		return e
-		
-	def createIntElement( self, id_ = None, name_ = None ):
-		#print 'Creating element  int'
-		e = _IntElement( id_, name_ )
-		e.ownerDocument = self
-		return e
-		
-	def createBoolElement( self, id_ = None, name_ = None ):
-		#print 'Creating element  bool'
-		e = _BoolElement( id_, name_ )
-		e.ownerDocument = self
-		return e
-		
-	def createTextureElement( self, id_ = None, name_ = None, type_ = None, filterMin_ = None, filterMag_ = None, filterMip_ = None, wrapS_ = None, wrapT_ = None, wrapU_ = None, borderColor_ = None ):
-		#print 'Creating element  texture'
-		e = _TextureElement( id_, name_, type_, filterMin_, filterMag_, filterMip_, wrapS_, wrapT_, wrapU_, borderColor_ )
-		e.ownerDocument = self
-		return e
-		
-	def createImgElement( self, id_ = None, src_ = None ):
-		#print 'Creating element  img'
-		e = _ImgElement( id_, src_ )
-		e.ownerDocument = self
-		return e
-		
-	def createViewElement( self, id_ = None, visible_ = None, position_ = None, orientation_ = None, fieldOfView_ = None ):
-		#print 'Creating element  view'
-		e = _ViewElement( id_, visible_, position_, orientation_, fieldOfView_ )
-		e.ownerDocument = self
-		return e
-		
-class _XML3DElement( Element ):
-	""" A XML3DBaseType Element """
+	print("\nError! Could not find XML modules!")
 
-	_id = None
-
-	def __init__( self, name, id_ = None, class_ = None, style_ = None):
-		Element.__init__( self, name )
-		self._id = id_
-		if not (self._id == None):
-			self.setAttribute( "id", self._id )
-
-
-class _Xml3dElement( _XML3DElement ):
-	""" A xml3d Element """
-	_height = None	 
-	_width = None	 
-	_activeView = None	 
-
-	def __init__( self, id_, height_, width_, activeView_ ):
-		_XML3DElement.__init__( self, "xml3d", id_ )
-		#print ("Setting height: " + str(height_))
-		self._height = height_
-		#print ("Setting width: " + str(width_))
-		self._width = width_
-		#print ("Setting activeView: " + str(activeView_))
-		self._activeView = activeView_
-		if not (self._height == None):
-			self.setAttribute( "height", self._height )
-		if not (self._width == None):
-			self.setAttribute( "width", self._width )
-		if not (self._activeView == None):
-			self.setAttribute( "activeView", self._activeView )
-		
-	def setHeight( self, value ):
-		self._height = value
-		self.setAttribute( "height", self._height )
-		return
-		
-	def setWidth( self, value ):
-		self._width = value
-		self.setAttribute( "width", self._width )
-		return
-		
-	def setActiveView( self, value ):
-		self._activeView = value
-		self.setAttribute( "activeView", self._activeView )
-		return
-
-class _DataElement( _XML3DElement ):
-	""" A data Element """
-	_map = None	 
-	_expose = None	 
-	_src = None	 
-	_script = None	 
-
-	def __init__( self, id_, map_, expose_, src_, script_ ):
-		_XML3DElement.__init__( self, "data", id_ )
-		#print ("Setting map: " + str(map_))
-		self._map = map_
-		#print ("Setting expose: " + str(expose_))
-		self._expose = expose_
-		#print ("Setting src: " + str(src_))
-		self._src = src_
-		#print ("Setting script: " + str(script_))
-		self._script = script_
-		if not (self._map == None):
-			self.setAttribute( "map", self._map )
-		if not (self._expose == None):
-			self.setAttribute( "expose", self._expose )
-		if not (self._src == None):
-			self.setAttribute( "src", self._src )
-		if not (self._script == None):
-			self.setAttribute( "script", self._script )
-		
-	def setMap( self, value ):
-		self._map = value
-		self.setAttribute( "map", self._map )
-		return
-		
-	def setExpose( self, value ):
-		self._expose = value
-		self.setAttribute( "expose", self._expose )
-		return
-		
-	def setSrc( self, value ):
-		self._src = value
-		self.setAttribute( "src", self._src )
-		return
-		
-	def setScript( self, value ):
-		self._script = value
-		self.setAttribute( "script", self._script )
-		return
-
-class _DefsElement( _XML3DElement ):
-	""" A defs Element """
-
-	def __init__( self, id_ ):
-		_XML3DElement.__init__( self, "defs", id_ )
-
-class _GroupElement( _XML3DElement ):
-	""" A group Element """
-	_visible = None	 
-	_transform = None	 
-	_shader = None	 
-
-	def __init__( self, id_, visible_, transform_, shader_ ):
-		_XML3DElement.__init__( self, "group", id_ )
-		#print ("Setting visible: " + str(visible_))
-		self._visible = visible_
-		#print ("Setting transform: " + str(transform_))
-		self._transform = transform_
-		#print ("Setting shader: " + str(shader_))
-		self._shader = shader_
-		if not (self._visible == None):
-			self.setAttribute( "visible", self._visible )
-		if not (self._transform == None):
-			self.setAttribute( "transform", self._transform )
-		if not (self._shader == None):
-			self.setAttribute( "shader", self._shader )
-		
-	def setVisible( self, value ):
-		self._visible = value
-		self.setAttribute( "visible", self._visible )
-		return
-		
-	def setTransform( self, value ):
-		self._transform = value
-		self.setAttribute( "transform", self._transform )
-		return
-		
-	def setShader( self, value ):
-		self._shader = value
-		self.setAttribute( "shader", self._shader )
-		return
-
-class _MeshElement( _XML3DElement ):
-	""" A mesh Element """
-	_visible = None	 
-	_type = None	 
-	_src = None	 
-
-	def __init__( self, id_, visible_, type_, src_ ):
-		_XML3DElement.__init__( self, "mesh", id_ )
-		#print ("Setting visible: " + str(visible_))
-		self._visible = visible_
-		#print ("Setting type: " + str(type_))
-		self._type = type_
-		#print ("Setting src: " + str(src_))
-		self._src = src_
-		if not (self._visible == None):
-			self.setAttribute( "visible", self._visible )
-		if not (self._type == None):
-			self.setAttribute( "type", self._type )
-		if not (self._src == None):
-			self.setAttribute( "src", self._src )
-		
-	def setVisible( self, value ):
-		self._visible = value
-		self.setAttribute( "visible", self._visible )
-		return
-		
-	def setType( self, value ):
-		self._type = value
-		self.setAttribute( "type", self._type )
-		return
-		
-	def setSrc( self, value ):
-		self._src = value
-		self.setAttribute( "src", self._src )
-		return
-
-class _TransformElement( _XML3DElement ):
-	""" A transform Element """
-	_translation = None	 
-	_scale = None	 
-	_rotation = None	 
-	_center = None	 
-	_scaleOrientation = None	 
-
-	def __init__( self, id_, translation_, scale_, rotation_, center_, scaleOrientation_ ):
-		_XML3DElement.__init__( self, "transform", id_ )
-		#print ("Setting translation: " + str(translation_))
-		self._translation = translation_
-		#print ("Setting scale: " + str(scale_))
-		self._scale = scale_
-		#print ("Setting rotation: " + str(rotation_))
-		self._rotation = rotation_
-		#print ("Setting center: " + str(center_))
-		self._center = center_
-		#print ("Setting scaleOrientation: " + str(scaleOrientation_))
-		self._scaleOrientation = scaleOrientation_
-		if not (self._translation == None):
-			self.setAttribute( "translation", self._translation )
-		if not (self._scale == None):
-			self.setAttribute( "scale", self._scale )
-		if not (self._rotation == None):
-			self.setAttribute( "rotation", self._rotation )
-		if not (self._center == None):
-			self.setAttribute( "center", self._center )
-		if not (self._scaleOrientation == None):
-			self.setAttribute( "scaleOrientation", self._scaleOrientation )
-		
-	def setTranslation( self, value ):
-		self._translation = value
-		self.setAttribute( "translation", self._translation )
-		return
-		
-	def setScale( self, value ):
-		self._scale = value
-		self.setAttribute( "scale", self._scale )
-		return
-		
-	def setRotation( self, value ):
-		self._rotation = value
-		self.setAttribute( "rotation", self._rotation )
-		return
-		
-	def setCenter( self, value ):
-		self._center = value
-		self.setAttribute( "center", self._center )
-		return
-		
-	def setScaleOrientation( self, value ):
-		self._scaleOrientation = value
-		self.setAttribute( "scaleOrientation", self._scaleOrientation )
-		return
-
-class _ShaderElement( _XML3DElement ):
-	""" A shader Element """
-	_script = None	 
-	_src = None	 
-
-	def __init__( self, id_, script_, src_ ):
-		_XML3DElement.__init__( self, "shader", id_ )
-		#print ("Setting script: " + str(script_))
-		self._script = script_
-		#print ("Setting src: " + str(src_))
-		self._src = src_
-		if not (self._script == None):
-			self.setAttribute( "script", self._script )
-		if not (self._src == None):
-			self.setAttribute( "src", self._src )
-		
-	def setScript( self, value ):
-		self._script = value
-		self.setAttribute( "script", self._script )
-		return
-		
-	def setSrc( self, value ):
-		self._src = value
-		self.setAttribute( "src", self._src )
-		return
-
-class _LightElement( _XML3DElement ):
-	""" A light Element """
-	_visible = None	 
-	_shader = None	 
-	_global = None	 
-	_intensity = None	 
-
-	def __init__( self, id_, visible_, shader_, global_, intensity_ ):
-		_XML3DElement.__init__( self, "light", id_ )
-		#print ("Setting visible: " + str(visible_))
-		self._visible = visible_
-		#print ("Setting shader: " + str(shader_))
-		self._shader = shader_
-		#print ("Setting global: " + str(global_))
-		self._global = global_
-		#print ("Setting intensity: " + str(intensity_))
-		self._intensity = intensity_
-		if not (self._visible == None):
-			self.setAttribute( "visible", self._visible )
-		if not (self._shader == None):
-			self.setAttribute( "shader", self._shader )
-		if not (self._global == None):
-			self.setAttribute( "global", self._global )
-		if not (self._intensity == None):
-			self.setAttribute( "intensity", self._intensity )
-		
-	def setVisible( self, value ):
-		self._visible = value
-		self.setAttribute( "visible", self._visible )
-		return
-		
-	def setShader( self, value ):
-		self._shader = value
-		self.setAttribute( "shader", self._shader )
-		return
-		
-	def setGlobal( self, value ):
-		self._global = value
-		self.setAttribute( "global", self._global )
-		return
-		
-	def setIntensity( self, value ):
-		self._intensity = value
-		self.setAttribute( "intensity", self._intensity )
-		return
-
-class _LightshaderElement( _XML3DElement ):
-	""" A lightshader Element """
-	_script = None	 
-	_src = None	 
-
-	def __init__( self, id_, script_, src_ ):
-		_XML3DElement.__init__( self, "lightshader", id_ )
-		#print ("Setting script: " + str(script_))
-		self._script = script_
-		#print ("Setting src: " + str(src_))
-		self._src = src_
-		if not (self._script == None):
-			self.setAttribute( "script", self._script )
-		if not (self._src == None):
-			self.setAttribute( "src", self._src )
-		
-	def setScript( self, value ):
-		self._script = value
-		self.setAttribute( "script", self._script )
-		return
-		
-	def setSrc( self, value ):
-		self._src = value
-		self.setAttribute( "src", self._src )
-		return
-
-class _ScriptElement( _XML3DElement ):
-	""" A script Element """
-	_src = None	 
-	_type = None	 
-
-	def __init__( self, id_, src_, type_ ):
-		_XML3DElement.__init__( self, "script", id_ )
-		#print ("Setting src: " + str(src_))
-		self._src = src_
-		#print ("Setting type: " + str(type_))
-		self._type = type_
-		if not (self._src == None):
-			self.setAttribute( "src", self._src )
-		if not (self._type == None):
-			self.setAttribute( "type", self._type )
-		
-	def setSrc( self, value ):
-		self._src = value
-		self.setAttribute( "src", self._src )
-		return
-		
-	def setType( self, value ):
-		self._type = value
-		self.setAttribute( "type", self._type )
-		return
-
-class _FloatElement( _XML3DElement ):
-	""" A float Element """
-	_name = None	 
-
-	def __init__( self, id_, name_ ):
-		_XML3DElement.__init__( self, "float", id_ )
-		#print ("Setting name: " + str(name_))
-		self._name = name_
-		if not (self._name == None):
-			self.setAttribute( "name", self._name )
-		
-	def setName( self, value ):
-		self._name = value
-		self.setAttribute( "name", self._name )
-		return
-
-class _Float2Element( _XML3DElement ):
-	""" A float2 Element """
-	_name = None	 
-
-	def __init__( self, id_, name_ ):
-		_XML3DElement.__init__( self, "float2", id_ )
-		#print ("Setting name: " + str(name_))
-		self._name = name_
-		if not (self._name == None):
-			self.setAttribute( "name", self._name )
-		
-	def setName( self, value ):
-		self._name = value
-		self.setAttribute( "name", self._name )
-		return
-
-class _Float3Element( _XML3DElement ):
-	""" A float3 Element """
-	_name = None	 
-
-	def __init__( self, id_, name_ ):
-		_XML3DElement.__init__( self, "float3", id_ )
-		#print ("Setting name: " + str(name_))
-		self._name = name_
-		if not (self._name == None):
-			self.setAttribute( "name", self._name )
-		
-	def setName( self, value ):
-		self._name = value
-		self.setAttribute( "name", self._name )
-		return
-
-class _Float4Element( _XML3DElement ):
-	""" A float4 Element """
-	_name = None	 
-
-	def __init__( self, id_, name_ ):
-		_XML3DElement.__init__( self, "float4", id_ )
-		#print ("Setting name: " + str(name_))
-		self._name = name_
-		if not (self._name == None):
-			self.setAttribute( "name", self._name )
-		
-	def setName( self, value ):
-		self._name = value
-		self.setAttribute( "name", self._name )
-		return
-
-class _Float4x4Element( _XML3DElement ):
-	""" A float4x4 Element """
-	_name = None	 
-
-	def __init__( self, id_, name_ ):
-		_XML3DElement.__init__( self, "float4x4", id_ )
-		#print ("Setting name: " + str(name_))
-		self._name = name_
-		if not (self._name == None):
-			self.setAttribute( "name", self._name )
-		
-	def setName( self, value ):
-		self._name = value
-		self.setAttribute( "name", self._name )
-		return
-
-class _IntElement( _XML3DElement ):
-	""" A int Element """
-	_name = None	 
-
-	def __init__( self, id_, name_ ):
-		_XML3DElement.__init__( self, "int", id_ )
-		#print ("Setting name: " + str(name_))
-		self._name = name_
-		if not (self._name == None):
-			self.setAttribute( "name", self._name )
-		
-	def setName( self, value ):
-		self._name = value
-		self.setAttribute( "name", self._name )
-		return
-
-class _BoolElement( _XML3DElement ):
-	""" A bool Element """
-	_name = None	 
-
-	def __init__( self, id_, name_ ):
-		_XML3DElement.__init__( self, "bool", id_ )
-		#print ("Setting name: " + str(name_))
-		self._name = name_
-		if not (self._name == None):
-			self.setAttribute( "name", self._name )
-		
-	def setName( self, value ):
-		self._name = value
-		self.setAttribute( "name", self._name )
-		return
-
-class _TextureElement( _XML3DElement ):
-	""" A texture Element """
-	_name = None	 
-	_type = None	 
-	_filterMin = None	 
-	_filterMag = None	 
-	_filterMip = None	 
-	_wrapS = None	 
-	_wrapT = None	 
-	_wrapU = None	 
-	_borderColor = None	 
-
-	def __init__( self, id_, name_, type_, filterMin_, filterMag_, filterMip_, wrapS_, wrapT_, wrapU_, borderColor_ ):
-		_XML3DElement.__init__( self, "texture", id_ )
-		#print ("Setting name: " + str(name_))
-		self._name = name_
-		#print ("Setting type: " + str(type_))
-		self._type = type_
-		#print ("Setting filterMin: " + str(filterMin_))
-		self._filterMin = filterMin_
-		#print ("Setting filterMag: " + str(filterMag_))
-		self._filterMag = filterMag_
-		#print ("Setting filterMip: " + str(filterMip_))
-		self._filterMip = filterMip_
-		#print ("Setting wrapS: " + str(wrapS_))
-		self._wrapS = wrapS_
-		#print ("Setting wrapT: " + str(wrapT_))
-		self._wrapT = wrapT_
-		#print ("Setting wrapU: " + str(wrapU_))
-		self._wrapU = wrapU_
-		#print ("Setting borderColor: " + str(borderColor_))
-		self._borderColor = borderColor_
-		if not (self._name == None):
-			self.setAttribute( "name", self._name )
-		if not (self._type == None):
-			self.setAttribute( "type", self._type )
-		if not (self._filterMin == None):
-			self.setAttribute( "filterMin", self._filterMin )
-		if not (self._filterMag == None):
-			self.setAttribute( "filterMag", self._filterMag )
-		if not (self._filterMip == None):
-			self.setAttribute( "filterMip", self._filterMip )
-		if not (self._wrapS == None):
-			self.setAttribute( "wrapS", self._wrapS )
-		if not (self._wrapT == None):
-			self.setAttribute( "wrapT", self._wrapT )
-		if not (self._wrapU == None):
-			self.setAttribute( "wrapU", self._wrapU )
-		if not (self._borderColor == None):
-			self.setAttribute( "borderColor", self._borderColor )
-		
-	def setName( self, value ):
-		self._name = value
-		self.setAttribute( "name", self._name )
-		return
-		
-	def setType( self, value ):
-		self._type = value
-		self.setAttribute( "type", self._type )
-		return
-		
-	def setFilterMin( self, value ):
-		self._filterMin = value
-		self.setAttribute( "filterMin", self._filterMin )
-		return
-		
-	def setFilterMag( self, value ):
-		self._filterMag = value
-		self.setAttribute( "filterMag", self._filterMag )
-		return
-		
-	def setFilterMip( self, value ):
-		self._filterMip = value
-		self.setAttribute( "filterMip", self._filterMip )
-		return
-		
-	def setWrapS( self, value ):
-		self._wrapS = value
-		self.setAttribute( "wrapS", self._wrapS )
-		return
-		
-	def setWrapT( self, value ):
-		self._wrapT = value
-		self.setAttribute( "wrapT", self._wrapT )
-		return
-		
-	def setWrapU( self, value ):
-		self._wrapU = value
-		self.setAttribute( "wrapU", self._wrapU )
-		return
-		
-	def setBorderColor( self, value ):
-		self._borderColor = value
-		self.setAttribute( "borderColor", self._borderColor )
-		return
-
-class _ImgElement( _XML3DElement ):
-	""" A img Element """
-	_src = None	 
-
-	def __init__( self, id_, src_ ):
-		_XML3DElement.__init__( self, "img", id_ )
-		#print ("Setting src: " + str(src_))
-		self._src = src_
-		if not (self._src == None):
-			self.setAttribute( "src", self._src )
-		
-	def setSrc( self, value ):
-		self._src = value
-		self.setAttribute( "src", self._src )
-		return
-
-class _ViewElement( _XML3DElement ):
-	""" A view Element """
-	_visible = None	 
-	_position = None	 
-	_orientation = None	 
-	_fieldOfView = None	 
+try:
+	from StringIO import StringIO
+except ImportError:
+	from io import StringIO
+
+# number of values formatted at once by NumericArray
+ARRAY_CHUNK_SIZE = 4096
+
+# Element table: tag name, suffix of the create method and attributes besides
+# the id, in the order of the create method's parameters
+SCHEMA = (
+	( "xml3d",       "Xml3d",       ( "height", "width", "activeView" ) ),
+	( "data",        "Data",        ( "map", "expose", "src", "script", "compute" ) ),
+	( "defs",        "Defs",        () ),
+	( "group",       "Group",       ( "visible", "transform", "shader" ) ),
+	( "mesh",        "Mesh",        ( "visible", "type", "src" ) ),
+	( "transform",   "Transform",   ( "translation", "scale", "rotation", "center", "scaleOrientation" ) ),
+	( "shader",      "Shader",      ( "script", "src" ) ),
+	( "light",       "Light",       ( "visible", "shader", "global", "intensity" ) ),
+	( "lightshader", "Lightshader", ( "script", "src" ) ),
+	( "script",      "Script",      ( "src", "type" ) ),
+	( "float",       "Float",       ( "name", ) ),
+	( "float2",      "Float2",      ( "name", ) ),
+	( "float3",      "Float3",      ( "name", ) ),
+	( "float4",      "Float4",      ( "name", ) ),
+	( "float4x4",    "Float4x4",    ( "name", ) ),
+	( "int",         "Int",         ( "name", ) ),
+	( "bool",        "Bool",        ( "name", ) ),
+	( "texture",     "Texture",     ( "name", "type", "filterMin", "filterMag", "filterMip", "wrapS", "wrapT", "wrapU", "borderColor" ) ),
+	( "img",         "Img",         ( "src", ) ),
+	( "view",        "View",        ( "visible", "position", "orientation", "fieldOfView" ) ),
+)
+
+# tag name -> attributes including the id
+ATTRIBUTES = {}
+for tagName, suffix, attributes in SCHEMA:
+	ATTRIBUTES[tagName] = ( "id", ) + attributes
+
+def _inlinesText():
+	""" True if minidom writes a single text child on the line of its element,
+	as Python 2.7 does. Python 2.6 writes it on a line of its own. """
+	doc = Document()
+	e = doc.createElement( "a" )
+	e.appendChild( doc.createTextNode( "b" ) )
+	out = StringIO()
+	e.writexml( out, "", " ", "\n" )
+	return out.getvalue() == "<a>b</a>\n"
+
+INLINE_TEXT = _inlinesText()
+
+class XML3DElement( Element ):
+	""" An XML3D element of any type. Attributes are kept as plain strings in
+	the dictionary values instead of DOM attribute nodes, which are only a
+	cost for elements that are written once and never queried. """
+
+	def __init__( self, tagName ):
+		Element.__init__( self, tagName )
+		self.values = {}
+
+	def setAttribute( self, name, value ):
+		self.values[ name ] = value
+
+	def getAttribute( self, name ):
+		return self.values.get( name, "" )
+
+	def hasAttribute( self, name ):
+		return name in self.values
+
+	def removeAttribute( self, name ):
+		del self.values[ name ]
+
+	def writexml( self, writer, indent = "", addindent = "", newl = "" ):
+		# same output as Element.writexml of the running Python, attributes
+		# sorted by name
+		writer.write( indent + "<" + self.tagName )
+		names = list( self.values.keys() )
+		names.sort()
+		for name in names:
+			writer.write( " %s=\"" % name )
+			_write_data( writer, self.values[ name ] )
+			writer.write( "\"" )
+		if self.childNodes:
+			writer.write( ">" )
+			if INLINE_TEXT and len( self.childNodes ) == 1 and self.childNodes[ 0 ].nodeType == Node.TEXT_NODE:
+				self.childNodes[ 0 ].writexml( writer, "", "", "" )
+			else:
+				writer.write( newl )
+				for node in self.childNodes:
+					node.writexml( writer, indent + addindent, addindent, newl )
+				writer.write( indent )
+			writer.write( "</%s>%s" % ( self.tagName, newl ) )
+		else:
+			writer.write( "/>%s" % newl )
+
+def _createSetter( name ):
+	def setter( self, value ):
+		if not name in ATTRIBUTES[self.tagName]:
+			raise AttributeError( "%s has no attribute %s" % ( self.tagName, name ) )
+		self.setAttribute( name, value )
+	setter.__name__ = "set" + name[0].upper() + name[1:]
+	return setter
+
+def _createFactory( tagName, suffix ):
+	names = ATTRIBUTES[tagName]
+	def create( self, *args, **kwargs ):
+		if len( args ) > len( names ):
+			raise TypeError( "create%sElement takes at most %d arguments" % ( suffix, len( names ) ) )
+		values = list( args ) + [ None ] * ( len( names ) - len( args ) )
+		for key in kwargs:
+			if not key.endswith( "_" ) or not key[:-1] in names:
+				raise TypeError( "create%sElement got an unexpected keyword argument %s" % ( suffix, key ) )
+			values[ names.index( key[:-1] ) ] = kwargs[ key ]
+		e = XML3DElement( tagName )
+		e.ownerDocument = self
+		for i in range( len( names ) ):
+			if not ( values[ i ] == None ):
+				e.setAttribute( names[ i ], values[ i ] )
+		return e
+	create.__name__ = "create%sElement" % suffix
+	create.__doc__ = "Create a %s element, parameters: %s" % ( tagName, ", ".join( [ name + "_" for name in names ] ) )
+	return create
 
-	def __init__( self, id_, visible_, position_, orientation_, fieldOfView_ ):
-		_XML3DElement.__init__( self, "view", id_ )
-		#print ("Setting visible: " + str(visible_))
-		self._visible = visible_
-		#print ("Setting position: " + str(position_))
-		self._position = position_
-		#print ("Setting orientation: " + str(orientation_))
-		self._orientation = orientation_
-		#print ("Setting fieldOfView: " + str(fieldOfView_))
-		self._fieldOfView = fieldOfView_
-		if not (self._visible == None):
-			self.setAttribute( "visible", self._visible )
-		if not (self._position == None):
-			self.setAttribute( "position", self._position )
-		if not (self._orientation == None):
-			self.setAttribute( "orientation", self._orientation )
-		if not (self._fieldOfView == None):
-			self.setAttribute( "fieldOfView", self._fieldOfView )
-		
-	def setVisible( self, value ):
-		self._visible = value
-		self.setAttribute( "visible", self._visible )
-		return
-		
-	def setPosition( self, value ):
-		self._position = value
-		self.setAttribute( "position", self._position )
-		return
-		
-	def setOrientation( self, value ):
-		self._orientation = value
-		self.setAttribute( "orientation", self._orientation )
-		return
-		
-	def setFieldOfView( self, value ):
-		self._fieldOfView = value
-		self.setAttribute( "fieldOfView", self._fieldOfView )
-		return
+class XML3DDocument( Document ):
+	""" An XML3D Document ( xml3d.org ), the create methods are generated from
+	SCHEMA: create<Suffix>Element( self, id_ = None, <attribute>_ = None, ... ) """
+
+for tagName, suffix, attributes in SCHEMA:
+	setattr( XML3DDocument, "create%sElement" % suffix, _createFactory( tagName, suffix ) )
+	for name in ( "id", ) + attributes:
+		setattr( XML3DElement, "set" + name[0].upper() + name[1:], _createSetter( name ) )
+
+class NumericArray( Childless, Node ):
+	""" Text node with a list of numbers. The numbers are kept in an array
+	and only formatted while writing, a chunk at a time. They don't need to be
+	escaped. """
+	nodeType = Node.TEXT_NODE
+	nodeName = "#text"
+	attributes = None
+
+	def __init__( self, values, format = None ):
+		""" values: array.array, format: format of one number, by default %d
+		for integer arrays and %g for float arrays """
+		self.values = values
+		if format == None:
+			if values.typecode in "fd":
+				format = "%g"
+			else:
+				format = "%d"
+		self.format = format
+
+	def _get_data( self ):
+		return " ".join( [ self.format % value for value in self.values ] )
+
+	data = property( _get_data )
+	nodeValue = property( _get_data )
+
+	def writexml( self, writer, indent = "", addindent = "", newl = "" ):
+		writer.write( indent )
+		values = self.values
+		for start in range( 0, len( values ), ARRAY_CHUNK_SIZE ):
+			chunk = values[ start : start + ARRAY_CHUNK_SIZE ]
+			if start > 0:
+				writer.write( " " )
+			writer.write( " ".join( [ self.format ] * len( chunk ) ) % tuple( chunk ) )
+		writer.write( newl )
+
+def _createArrayNode( self, values, format = None ):
+	""" Create a NumericArray node, values is an array.array or a typecode
+	and a sequence as tuple ( typecode, values ) """
+	if not isinstance( values, array.array ):
+		values = array.array( values[ 0 ], values[ 1 ] )
+	node = NumericArray( values, format )
+	node.ownerDocument = self
+	return node
+
+XML3DDocument.createNumericArray = _createArrayNode
@@ -0,0 +1,207 @@
+######################################################################################
+#
+#  xml3dAnimation.py
+#
+#  Cinema4D to XML3D exporter plugin
+#
+#  Copyright (C) 2010 Saarland University
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+#####################################################################################
+
+"""
+Baking of sampled transformations into keyframe arrays.
+
+The exporter steps the document through the frames and passes the local
+transformation of every animated object to an AnimationSampler, already in
+XML3D's coordinate convention. Each object has three channels: translation,
+rotation as quaternion (x, y, z, w) and scale. Channels which don't change
+within the tolerance are written as a single value, of the others only the
+keys which can't be interpolated linearly from their neighbours are kept.
+
+Running the module directly prints the reduction and timing for synthetic
+animations.
+"""
+
+import array
+import math
+
+# name and number of components of the channels
+CHANNELS = (("translation", 3), ("rotation", 4), ("scale", 3))
+
+def quaternion(axis, angle):
+    """
+    @param axis: Normalized rotation axis
+    @param angle: Rotation angle in radians
+    @return: (x, y, z, w)
+    """
+    s = math.sin(0.5 * angle)
+    return (axis[0] * s, axis[1] * s, axis[2] * s, math.cos(0.5 * angle))
+
+def isConstant(values, size, tolerance):
+    """
+    @param values: Flat array with size components per frame
+    @return: True if no frame differs from the first one by more than
+    tolerance in any component
+    """
+    for i in range(size, len(values)):
+        if abs(values[i] - values[i % size]) > tolerance:
+            return False
+    return True
+
+def reduceKeys(times, values, size, tolerance):
+    """
+    Drop the keys of a channel which are redundant for linear interpolation.
+    The first and last key are always kept. A segment starting at a key is
+    extended as long as the line to the next frame passes all frames in
+    between within the tolerance. Every frame in between limits the slope
+    of that line to an interval, so only the intersection of the intervals
+    is kept and each frame is tested once.
+    @param times: Array of increasing frame times
+    @param values: Flat array with size components per frame
+    @return: (key times, key values) as arrays
+    """
+    infinity = float("inf")
+    keys = [0]
+    first = 0
+    low = [-infinity] * size
+    high = [infinity] * size
+    frame = 1
+    while frame < len(times):
+        dt = times[frame] - times[first]
+        fits = True
+        for c in range(size):
+            slope = (values[frame * size + c] - values[first * size + c]) / dt
+            if slope < low[c] or slope > high[c]:
+                fits = False
+                break
+        if not fits:
+            # the previous frame becomes a key and starts the next segment
+            first = frame - 1
+            keys.append(first)
+            low = [-infinity] * size
+            high = [infinity] * size
+            continue
+        for c in range(size):
+            d = values[frame * size + c] - values[first * size + c]
+            low[c] = max(low[c], (d - tolerance) / dt)
+            high[c] = min(high[c], (d + tolerance) / dt)
+        frame += 1
+    if len(times) > 1 and keys[-1] != len(times) - 1:
+        keys.append(len(times) - 1)
+
+    keyTimes = array.array('d')
+    keyValues = array.array('d')
+    for frame in keys:
+        keyTimes.append(times[frame])
+        keyValues.extend(values[frame * size : (frame + 1) * size])
+    return keyTimes, keyValues
+
+class AnimationSampler:
+    """
+    Collects the transformations of a fixed list of objects frame by frame
+    """
+    def __init__(self, count, tolerance = 0.0001):
+        """
+        @param count: Number of objects
+        @param tolerance: Maximum error of a component caused by dropping keys
+        """
+        self.tolerance = tolerance
+        self.times = array.array('d')
+        self.values = []
+        for i in range(count):
+            self.values.append([array.array('d') for channel in CHANNELS])
+
+    def addFrame(self, time, samples):
+        """
+        @param time: Time of the frame in seconds
+        @param samples: One (translation, axis, angle, scale) per object
+        """
+        self.times.append(time)
+        for i in range(len(samples)):
+            translation, axis, angle, scale = samples[i]
+            translations, rotations, scales = self.values[i]
+            translations.extend(translation)
+            q = quaternion(axis, angle)
+            # q and -q are the same rotation, keep consecutive keys in the same
+            # hemisphere so that they interpolate the short way
+            if len(rotations) > 0:
+                n = len(rotations)
+                if q[0] * rotations[n - 4] + q[1] * rotations[n - 3] + q[2] * rotations[n - 2] + q[3] * rotations[n - 1] < 0.0:
+                    q = (-q[0], -q[1], -q[2], -q[3])
+            rotations.extend(q)
+            scales.extend(scale)
+
+    def getKeys(self, index):
+        """
+        @param index: Index of the object in the samples
+        @return: List of (channel name, size, key times, key values) of the
+        channels which change
+        """
+        keys = []
+        for c in range(len(CHANNELS)):
+            name, size = CHANNELS[c]
+            values = self.values[index][c]
+            if not isConstant(values, size, self.tolerance):
+                keyTimes, keyValues = reduceKeys(self.times, values, size, self.tolerance)
+                keys.append((name, size, keyTimes, keyValues))
+        return keys
+
+    def getConstants(self, index):
+        """
+        @param index: Index of the object in the samples
+        @return: List of (channel name, size, value) of the channels which
+        don't change, the value is the one of the first frame
+        """
+        constants = []
+        for c in range(len(CHANNELS)):
+            name, size = CHANNELS[c]
+            values = self.values[index][c]
+            if isConstant(values, size, self.tolerance):
+                constants.append((name, size, values[:size]))
+        return constants
+
+def formattedSize(values):
+    """
+    @return: Number of characters of the values written with %g
+    """
+    size = 0
+    for v in values:
+        size += len("%g" % v) + 1
+    return size
+
+if __name__ == "__main__":
+    import time
+    print("%8s %8s %12s %12s %10s %10s" % ("objects", "frames", "values", "keys", "sample ms", "reduce ms"))
+    for count, frames in ((100, 100), (100, 500), (1000, 250)):
+        sampler = AnimationSampler(count)
+        start = time.time()
+        for frame in range(frames):
+            t = frame / 25.0
+            samples = []
+            for i in range(count):
+                # linear motion, eased rotation around y, constant scale
+                angle = math.pi * math.sin(0.5 * t + i)
+                samples.append(((i + 2.0 * t, 0.0, 0.0), (0.0, 1.0, 0.0), angle, (1.0, 1.0, 1.0)))
+            sampler.addFrame(t, samples)
+        sampled = time.time() - start
+        start = time.time()
+        keys = 0
+        for i in range(count):
+            for name, size, keyTimes, keyValues in sampler.getKeys(i):
+                keys += len(keyTimes)
+        reduced = time.time() - start
+        print("%8d %8d %12d %12d %10.1f %10.1f" % (count, frames, count * frames * 10, keys, 1000.0 * sampled, 1000.0 * reduced))
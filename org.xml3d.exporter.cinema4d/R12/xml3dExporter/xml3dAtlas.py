@@ -0,0 +1,165 @@
+######################################################################################
+#
+#  xml3dAtlas.py
+#
+#  Cinema4D to XML3D exporter plugin
+#
+#  Copyright (C) 2010 Saarland University
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+#####################################################################################
+
+"""
+Layout of texture atlases. Rectangles are placed on shelves sorted by
+decreasing height (next-fit decreasing height); when an atlas is full a new
+one is started. The module only computes the layout and the texture
+coordinate transformation, the images are composed by the exporter.
+
+Running the module directly prints the packing efficiency and time for
+random texture sizes.
+"""
+
+import math
+
+class Atlas:
+    """
+    Placement of textures in one atlas image
+    """
+    def __init__(self, maxWidth, maxHeight):
+        self.maxWidth = maxWidth
+        self.maxHeight = maxHeight
+        self.width = 0
+        self.height = 0
+        self.placements = {}
+        self.shelfY = 0
+        self.shelfHeight = 0
+        self.cursorX = 0
+
+    def insert(self, index, width, height, padding):
+        """
+        Place a rectangle on the current or on a new shelf
+        @param index: Key of the rectangle in placements
+        @return: False if the atlas is full
+        """
+        w = width + 2 * padding
+        h = height + 2 * padding
+        x, y = self.cursorX, self.shelfY
+        if x + w > self.maxWidth:
+            x, y = 0, self.shelfY + self.shelfHeight
+        if y + h > self.maxHeight:
+            return False
+        if y != self.shelfY:
+            self.shelfY = y
+            self.shelfHeight = 0
+        self.placements[index] = (x + padding, y + padding, width, height)
+        self.cursorX = x + w
+        self.shelfHeight = max(self.shelfHeight, h)
+        self.width = max(self.width, self.cursorX)
+        self.height = max(self.height, y + h)
+        return True
+
+    def finish(self):
+        """
+        Round the size of the atlas up to powers of two
+        """
+        self.width = nextPowerOfTwo(self.width)
+        self.height = nextPowerOfTwo(self.height)
+
+    def efficiency(self):
+        """
+        @return: Fraction of the atlas covered by textures
+        """
+        used = 0
+        for index in self.placements:
+            x, y, w, h = self.placements[index]
+            used += w * h
+        return float(used) / (self.width * self.height)
+
+def nextPowerOfTwo(n):
+    p = 1
+    while p < n:
+        p *= 2
+    return p
+
+def packShelves(sizes, maxWidth, maxHeight, padding = 0):
+    """
+    Distribute rectangles over as few atlases as the shelf heuristic finds
+    @param sizes: List of (width, height)
+    @param maxWidth: Maximum width of an atlas
+    @param maxHeight: Maximum height of an atlas
+    @param padding: Border in pixels around every rectangle
+    @return: List of Atlas objects, the placements are keyed by the index
+    into sizes
+    """
+    order = sorted(range(len(sizes)), key=lambda i: (sizes[i][1], sizes[i][0]), reverse=True)
+
+    # Use a narrower atlas if the textures cover only a small part of it
+    area = 0
+    widest = 0
+    for width, height in sizes:
+        area += (width + 2 * padding) * (height + 2 * padding)
+        widest = max(widest, width + 2 * padding)
+    maxWidth = min(maxWidth, max(nextPowerOfTwo(int(math.sqrt(area))), nextPowerOfTwo(widest)))
+
+    atlases = []
+    current = None
+    for i in order:
+        width, height = sizes[i]
+        if width + 2 * padding > maxWidth or height + 2 * padding > maxHeight:
+            raise ValueError("Texture of size %dx%d does not fit into an atlas" % (width, height))
+        if current == None or not current.insert(i, width, height, padding):
+            current = Atlas(maxWidth, maxHeight)
+            atlases.append(current)
+            current.insert(i, width, height, padding)
+    for atlas in atlases:
+        atlas.finish()
+    return atlases
+
+def atlasTransform(placement, atlasWidth, atlasHeight):
+    """
+    Transformation of texture coordinates of a placed texture into atlas
+    space. Texture coordinates have their origin at the lower left corner,
+    placements at the upper left one.
+    @param placement: (x, y, width, height) in pixels
+    @return: (scaleU, scaleV, offsetU, offsetV)
+    """
+    x, y, w, h = placement
+    return (float(w) / atlasWidth, float(h) / atlasHeight,
+            float(x) / atlasWidth, 1.0 - float(y + h) / atlasHeight)
+
+def remapTexcoord(u, v, transform):
+    """
+    Map a texture coordinate into atlas space. Coordinates outside of the
+    texture are clamped to its border, as there is no wrapping in an atlas.
+    @param transform: Result of atlasTransform()
+    @return: (u, v)
+    """
+    u = min(max(u, 0.0), 1.0)
+    v = min(max(v, 0.0), 1.0)
+    return (transform[2] + u * transform[0], transform[3] + v * transform[1])
+
+if __name__ == "__main__":
+    import random
+    import time
+    random.seed(1)
+    print("%10s %10s %12s %10s" % ("textures", "atlases", "efficiency", "ms/atlas"))
+    for count in (16, 64, 256, 1024):
+        sizes = [(random.choice((32, 64, 128, 256)), random.choice((32, 64, 128, 256))) for i in range(count)]
+        start = time.time()
+        atlases = packShelves(sizes, 2048, 2048, 2)
+        elapsed = time.time() - start
+        efficiency = sum([atlas.efficiency() for atlas in atlases]) / len(atlases)
+        print("%10d %10d %11.1f%% %10.3f" % (count, len(atlases), 100.0 * efficiency, 1000.0 * elapsed / len(atlases)))
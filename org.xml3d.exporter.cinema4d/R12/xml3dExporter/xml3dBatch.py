@@ -0,0 +1,178 @@
+######################################################################################
+#
+#  xml3dBatch.py
+#
+#  Cinema4D to XML3D exporter plugin
+#
+#  Copyright (C) 2010 Saarland University
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+#####################################################################################
+
+"""
+State shared by the exports of a batch of documents: caches keyed by the
+content of what they store, so variants of a document reuse the processed
+meshes and textures of each other. The background writer serializing
+finished documents while the next one is built is used by single exports
+as well.
+
+The module does not depend on Cinema4D.
+"""
+
+import sys
+import threading
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+import xml3dTextures
+
+class ContentCache:
+    """
+    Dictionary of computed values keyed by a hash of their input. The time
+    it took to compute a value is stored with it, so the cache can tell how
+    much time the hits saved.
+    """
+    def __init__(self):
+        self.entries = {}
+        self.used = set()
+        self.hits = 0
+        self.misses = 0
+        self.saved = 0.0
+        self.overhead = 0.0
+
+    def get(self, key):
+        """
+        @return: Cached value or None
+        """
+        entry = self.entries.get(key)
+        if entry == None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.saved += entry[1]
+        self.used.add(key)
+        return entry[0]
+
+    def put(self, key, value, cost):
+        """
+        @param cost: Time it took to compute value
+        """
+        self.entries[key] = (value, cost)
+        self.used.add(key)
+
+    def prune(self):
+        """
+        Drop the entries which were neither read nor stored since the last
+        call, e.g. the meshes of a previous version of an edited object
+        """
+        for key in list(self.entries):
+            if key not in self.used:
+                del self.entries[key]
+        self.used = set()
+
+    def addOverhead(self, cost):
+        """
+        Account for the time spent on computing keys
+        """
+        self.overhead += cost
+
+class ExportCaches:
+    """
+    Caches of one batch export
+    """
+    def __init__(self):
+        self.meshes = ContentCache()
+        self.texturePipelines = {}
+
+    def getTexturePipeline(self, outputDirectory, urlPrefix, maxSize, resize):
+        """
+        Texture pipeline shared by all exports into the same folder with the
+        same settings. Textures processed for a previous document are known
+        to it and neither hashed nor copied again.
+        """
+        key = (outputDirectory, urlPrefix, maxSize)
+        if key not in self.texturePipelines:
+            self.texturePipelines[key] = xml3dTextures.TexturePipeline(outputDirectory, urlPrefix, maxSize, resize)
+        return self.texturePipelines[key]
+
+    def getSavedTime(self):
+        """
+        @return: Estimated time saved compared with independent exports, in
+        the unit the costs were given in
+        """
+        return self.meshes.saved - self.meshes.overhead
+
+def writeDocument(doc, filename, indent, addindent, newl):
+    out = open(filename, 'w')
+    try:
+        doc.writexml(out, indent, addindent, newl)
+    finally:
+        out.close()
+
+class BackgroundWriter:
+    """
+    Writes documents on worker threads while the exporter builds the next
+    one. At most capacity documents wait for a thread, submit() blocks until
+    there is room again, which bounds the memory held by finished documents.
+    The documents must not be changed once they are submitted.
+    """
+    def __init__(self, workers = 1, capacity = 2):
+        self.queue = queue.Queue(capacity)
+        self.errors = []
+        self.threads = []
+        for i in range(workers):
+            thread = threading.Thread(target=self.run)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def run(self):
+        while True:
+            job = self.queue.get()
+            if job == None:
+                return
+            # keep taking jobs after an error, so that submit() doesn't block
+            try:
+                writeDocument(*job)
+            except:
+                self.errors.append(sys.exc_info()[1])
+
+    def submit(self, doc, filename, indent = " ", addindent = " ", newl = "\n"):
+        """
+        Queue a document for writing, see Document.writexml(). An error of a
+        previously submitted document is raised here.
+        """
+        self.raiseError()
+        self.queue.put((doc, filename, indent, addindent, newl))
+
+    def raiseError(self):
+        if len(self.errors) > 0:
+            raise self.errors[0]
+
+    def close(self):
+        """
+        Wait until all documents are written and stop the threads. The first
+        error of the workers is raised here.
+        """
+        for thread in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+        self.raiseError()
@@ -0,0 +1,294 @@
+######################################################################################
+#
+#  xml3dBvh.py
+#
+#  Cinema4D to XML3D exporter plugin
+#
+#  Copyright (C) 2010 Saarland University
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+#####################################################################################
+
+"""
+Bounding volume hierarchy over the world space boxes of the exported
+meshes, so that a viewer can pick and cull without testing every mesh.
+
+The tree is built top down. A node is split at the best of a fixed number
+of planes along the longest axis of the centers of its boxes, chosen by the
+surface area heuristic. Sorting the boxes into the bins is linear, so the
+build takes O(n log n) for reasonably distributed boxes.
+
+The tree is stored as flat arrays in depth first order. Node i has the
+bounds bounds[6i : 6i + 6] (minimum x, y, z, maximum x, y, z) and the two
+integers nodes[2i], nodes[2i + 1] = (a, count). A leaf has count > 0 and
+refers to the items order[a : a + count]. An inner node has count == 0,
+its first child is node i + 1, the second one node a.
+
+Running the module directly builds and queries trees over synthetic boxes.
+"""
+
+import json
+import array
+
+LEAF_SIZE = 4
+BINS = 16
+
+def _area(minX, minY, minZ, maxX, maxY, maxZ):
+    dx = maxX - minX
+    dy = maxY - minY
+    dz = maxZ - minZ
+    return dx * dy + dy * dz + dz * dx
+
+def build(boxes, leafSize = LEAF_SIZE, bins = BINS):
+    """
+    @param boxes: Flat sequence with minimum x, y, z and maximum x, y, z of
+    every box
+    @param leafSize: Nodes with more boxes are split if the surface area
+    heuristic favours it, nodes with more than four times as many always
+    @param bins: Number of candidate planes per split plus one
+    @return: (bounds, nodes, order) as described above, order lists the box
+    indices in leaf order
+    """
+    count = len(boxes) // 6
+    lows = [boxes[c::6] for c in range(3)]
+    highs = [boxes[3 + c::6] for c in range(3)]
+    centers = [[0.5 * (l + h) for l, h in zip(lows[c], highs[c])] for c in range(3)]
+
+    bounds = array.array("d")
+    nodes = array.array("i")
+    order = []
+    if count == 0:
+        return bounds, nodes, order
+
+    # (box indices, node waiting for the index of its second child)
+    stack = [(list(range(count)), -1)]
+    while len(stack) > 0:
+        items, parent = stack.pop()
+        index = len(nodes) // 2
+        if parent >= 0:
+            nodes[2 * parent] = index
+        box = [min([lows[c][i] for i in items]) for c in range(3)] + [max([highs[c][i] for i in items]) for c in range(3)]
+        bounds.extend(box)
+
+        split = None
+        if len(items) > leafSize:
+            split = _split(items, centers, lows, highs, bins, _area(*box) * len(items), leafSize)
+        if split == None:
+            nodes.extend((len(order), len(items)))
+            order.extend(items)
+            continue
+        nodes.extend((0, 0))
+        # the first child is built right after its parent
+        stack.append((split[1], index))
+        stack.append((split[0], -1))
+    return bounds, nodes, order
+
+def _split(items, centers, lows, highs, bins, leafCost, leafSize):
+    """
+    @return: (first items, second items) or None if a leaf is cheaper
+    """
+    # longest axis of the centers
+    axis = 0
+    extent = -1.0
+    for c in range(3):
+        values = [centers[c][i] for i in items]
+        low = min(values)
+        high = max(values)
+        if high - low > extent:
+            axis = c
+            extent = high - low
+            offset = low
+    if extent <= 0.0:
+        # all centers coincide, only a leaf count limit helps
+        half = len(items) // 2
+        return items[:half], items[half:]
+
+    center = centers[axis]
+    scale = bins * 0.999999 / extent
+    binOf = [int((center[i] - offset) * scale) for i in items]
+    counts = [0] * bins
+    binBoxes = [None] * bins
+    for i, b in zip(items, binOf):
+        counts[b] += 1
+        box = binBoxes[b]
+        if box == None:
+            binBoxes[b] = [lows[0][i], lows[1][i], lows[2][i], highs[0][i], highs[1][i], highs[2][i]]
+        else:
+            for c in range(3):
+                if lows[c][i] < box[c]:
+                    box[c] = lows[c][i]
+                if highs[c][i] > box[3 + c]:
+                    box[3 + c] = highs[c][i]
+
+    # area and count of everything right of each plane
+    rightArea = [0.0] * bins
+    rightCount = [0] * bins
+    box = None
+    total = 0
+    for b in range(bins - 1, 0, -1):
+        box = _merge(box, binBoxes[b])
+        total += counts[b]
+        if box != None:
+            rightArea[b] = _area(*box)
+        rightCount[b] = total
+
+    best = None
+    bestCost = leafCost
+    box = None
+    total = 0
+    for b in range(1, bins):
+        box = _merge(box, binBoxes[b - 1])
+        total += counts[b - 1]
+        if total == 0 or rightCount[b] == 0:
+            continue
+        cost = _area(*box) * total + rightArea[b] * rightCount[b]
+        if cost < bestCost:
+            best = b
+            bestCost = cost
+    if best == None:
+        if len(items) <= 4 * leafSize:
+            return None
+        # a large leaf is worse for queries than a bad split
+        best = max(1, min(bins - 1, bins // 2))
+        while sum(counts[:best]) == 0:
+            best += 1
+    first = [i for i, b in zip(items, binOf) if b < best]
+    second = [i for i, b in zip(items, binOf) if b >= best]
+    if len(first) == 0 or len(second) == 0:
+        half = len(items) // 2
+        return items[:half], items[half:]
+    return first, second
+
+def _merge(box, other):
+    if other == None:
+        return box
+    if box == None:
+        return list(other)
+    return [min(box[0], other[0]), min(box[1], other[1]), min(box[2], other[2]),
+            max(box[3], other[3]), max(box[4], other[4]), max(box[5], other[5])]
+
+def queryBox(bounds, nodes, order, query):
+    """
+    @param query: (minimum x, y, z, maximum x, y, z)
+    @return: Items whose leaf boxes overlap the query box, a superset of the
+    boxes overlapping it
+    """
+    result = []
+    if len(nodes) == 0:
+        return result
+    stack = [0]
+    while len(stack) > 0:
+        index = stack.pop()
+        o = 6 * index
+        if bounds[o] > query[3] or bounds[o + 1] > query[4] or bounds[o + 2] > query[5] or \
+           bounds[o + 3] < query[0] or bounds[o + 4] < query[1] or bounds[o + 5] < query[2]:
+            continue
+        a = nodes[2 * index]
+        count = nodes[2 * index + 1]
+        if count > 0:
+            result.extend(order[a : a + count])
+        else:
+            stack.append(a)
+            stack.append(index + 1)
+    return result
+
+def _round(value, up):
+    """
+    Round to 6 significant digits, away from the inside of the box
+    """
+    rounded = float("%.6g" % value)
+    if up and rounded < value:
+        rounded = float("%.6g" % (value + abs(value) * 1e-5))
+    elif not up and rounded > value:
+        rounded = float("%.6g" % (value - abs(value) * 1e-5))
+    return rounded
+
+def serialize(ids, bounds, nodes, order):
+    """
+    @return: Dictionary for JSON, the bounds are rounded outwards to 6
+    significant digits
+    """
+    return {
+        "version" : 1,
+        "ids"     : [ids[i] for i in order],
+        "bounds"  : [_round(bounds[i], i % 6 >= 3) for i in range(len(bounds))],
+        "nodes"   : list(nodes) }
+
+def writeIndex(filename, ids, boxes, leafSize = LEAF_SIZE):
+    """
+    Build the tree and write it as JSON with the ids of the items, e.g. the
+    ids of the groups of the meshes
+    @param ids: One id per box
+    @param boxes: See build()
+    @return: Number of nodes
+    """
+    bounds, nodes, order = build(boxes, leafSize)
+    index = serialize(ids, bounds, nodes, order)
+    out = open(filename, "w")
+    try:
+        json.dump(index, out, separators=(",", ":"))
+    finally:
+        out.close()
+    return len(nodes) // 2
+
+if __name__ == "__main__":
+    import math
+    import time
+    import random
+
+    rand = random.Random(1)
+
+    def randomBoxes(count):
+        # clustered boxes of very different sizes, like objects in a scene
+        boxes = []
+        clusters = [(rand.uniform(-1000.0, 1000.0), rand.uniform(-50.0, 50.0), rand.uniform(-1000.0, 1000.0)) for i in range(20)]
+        for i in range(count):
+            cx, cy, cz = clusters[i % len(clusters)]
+            x = cx + rand.gauss(0.0, 100.0)
+            y = cy + rand.gauss(0.0, 10.0)
+            z = cz + rand.gauss(0.0, 100.0)
+            s = rand.expovariate(1.0)
+            boxes.extend((x - s, y - s, z - s, x + s, y + s, z + s))
+        return boxes
+
+    print("%8s %10s %12s %8s %12s %12s %10s" % ("boxes", "nodes", "build ms", "ns/nlogn", "query us", "linear us", "JSON KB"))
+    for count in (1000, 10000, 100000):
+        boxes = randomBoxes(count)
+        start = time.time()
+        bounds, nodes, order = build(boxes)
+        built = time.time() - start
+
+        # every box appears in exactly one leaf
+        assert sorted(order) == list(range(count))
+
+        queries = [randomBoxes(1) for i in range(200)]
+        queries = [(q[0] - 20.0, q[1] - 20.0, q[2] - 20.0, q[3] + 20.0, q[4] + 20.0, q[5] + 20.0) for q in queries]
+        start = time.time()
+        found = [queryBox(bounds, nodes, order, q) for q in queries]
+        queried = (time.time() - start) / len(queries)
+        start = time.time()
+        for q, candidates in zip(queries[:20], found[:20]):
+            overlapping = [i for i in range(count) if not (boxes[6 * i] > q[3] or boxes[6 * i + 1] > q[4] or boxes[6 * i + 2] > q[5] or
+                           boxes[6 * i + 3] < q[0] or boxes[6 * i + 4] < q[1] or boxes[6 * i + 5] < q[2])]
+            assert set(overlapping) <= set(candidates)
+        linear = (time.time() - start) / 20
+
+        index = serialize(["group_object_%d" % i for i in range(count)], bounds, nodes, order)
+        size = len(json.dumps(index, separators=(",", ":")))
+        assert all([index["bounds"][i] <= bounds[i] for i in range(0, len(bounds)) if i % 6 < 3])
+        assert all([index["bounds"][i] >= bounds[i] for i in range(0, len(bounds)) if i % 6 >= 3])
+        print("%8d %10d %12.1f %8.1f %12.1f %12.1f %10.1f" % (count, len(nodes) // 2, 1000.0 * built, 1e9 * built / (count * math.log(count, 2)),
+              1e6 * queried, 1e6 * linear, size / 1024.0))
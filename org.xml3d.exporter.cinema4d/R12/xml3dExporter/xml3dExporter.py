@@ -27,11 +27,31 @@
 import xml.dom.minidom
 import c4d
 import math
+import array
+import hashlib
+import os
+import json
 import sys
 import traceback
 import re
+import fnmatch
+import shutil
 from c4d import *
 from xml3d import *
+import xml3dMath
+import xml3dSimplify
+import xml3dTextures
+import xml3dAtlas
+import xml3dTraversal
+import xml3dPatch
+import xml3dAnimation
+import xml3dBatch
+import xml3dWatch
+import xml3dMemory
+import xml3dCodec
+import xml3dBvh
+import xml3dHull
+import xml3dNormals
 
 class XML3DExporter:
     """
@@ -46,7 +66,140 @@ class XML3DExporter:
         self.XML3D_EXPORT_STRATEGY_TAGGED   = 102901
         self.XML3D_EXPORT_STRATEGY_SELECTED = 102902
         self.XML3D_EXPORT_STRATEGY_TAGGED_S = 102903
-
+        self.XML3D_EXPORT_STRATEGY_PATCH    = 102904
+        self.XML3D_EXPORT_STRATEGY_BATCH    = 102905
+        self.XML3D_EXPORT_STRATEGY_WATCH    = 102906
+
+        # remove identity transforms and fold chains of plain null objects
+        self.flattenHierarchy = False
+        self.identityTransforms = set()
+        self.removedGroups = set()
+        self.composedMatrices = {}
+
+        # write transforms as float4x4 matrices instead of translation,
+        # scale and rotation attributes
+        self.matrixTransforms = False
+        self.pendingMatrices = []
+
+        # number of simplified versions written for meshes with more than
+        # lodPolygonThreshold polygons, each one has half the triangles of
+        # the previous one
+        self.lodLevels = 0
+        self.lodPolygonThreshold = 5000
+
+        # write the mesh data into separate files next to the scene and list
+        # them in a manifest ordered by their visual importance
+        self.externalGeometry = False
+        self.externalResources = []
+        self.defaultCameraPosition = None
+
+        # write bounding boxes and spheres for every data element and group
+        self.writeBounds = False
+        self.meshBounds = {}
+        self.subtreeBounds = {}
+
+        # copy the textures into the output folder under content-hash names,
+        # downscaled to textureMaxSize if it is not 0
+        self.processTextures = False
+        self.textureMaxSize = 0
+        self.texturePipeline = None
+        self.documentPath = ""
+
+        # pack the textures of small, not tiled materials with equal shader
+        # parameters into shared atlas images
+        self.atlasTextures = False
+        self.atlasMaxTextureSize = 256
+        self.atlasSize = 2048
+        self.atlasPadding = 2
+        self.atlasMaterials = {}
+        self.atlasUrls = {}
+
+        # write all instances of a single mesh as one mesh with an array of
+        # instance transforms instead of one group per instance
+        self.batchInstances = False
+        self.instanceLinks = {}
+        self.instanceBatches = {}
+        self.instanceBatchOrder = []
+
+        # give every written file a name containing the hash of its content
+        # and list them in a manifest, unchanged files keep their names
+        self.hashedNames = False
+        self.outputDirectory = ""
+        self.outputFiles = {}
+
+        # sample the local transformations of animated objects over the
+        # frame range (first, last), by default the document's one, and
+        # write them as keyframe arrays driving the objects' transformations
+        self.bakeAnimation = False
+        self.animationRange = None
+        self.animationTolerance = 0.0001
+        self.animatedNames = set()
+
+        # state shared by the documents of writeBatch(): content keyed caches
+        # and the threads writing the finished documents
+        self.caches = None
+        self.writer = None
+        self.writerThreads = 2
+
+        # format and write finished documents on a background thread while
+        # the next one is built, at most writerQueueSize documents wait
+        self.backgroundWriting = False
+        self.writerQueueSize = 2
+
+        # watch mode: the objects changed in the document are exported to
+        # fragment files, identified by their traversal index like the unique
+        # names are, see startWatch(). The clone of the last complete export
+        # and the ids written by it are kept.
+        self.watch = None
+        self.watchScene = None
+        self.watchSettings = None
+        self.watchVersion = 0
+        self.watchRawScene = None
+        self.watchIds = None
+        self.watchFragments = {}
+        self.patchIndices = None
+        self.patchedIds = []
+        self.patchMissing = set()
+
+        # free every document as soon as it is written and don't cache mesh
+        # data, at the cost of writing synchronously in batch exports
+        self.boundedMemory = False
+        # log the peak memory allocated by Python in every phase of write()
+        self.traceMemory = False
+        self.memoryLog = None
+
+        # write the arrays of every mesh quantized and compressed into a
+        # binary file OUTPUTBASE_data/NAME.x3dc, see xml3dCodec. XML3D clients
+        # need a decoder for the format registered by the page.
+        self.compressGeometry = False
+        self.positionBits = 14
+        self.normalBits = 8
+
+        # remove objects which are not rendered, by their render visibility,
+        # their layer or a disabled generator, and the objects of the layers
+        # matching one of the excludedLayers patterns before polygonizing
+        self.skipHidden = False
+        self.excludedLayers = []
+        self.hiddenNames = set()
+        self.linkedNames = set()
+        self.skippedObjects = 0
+        self.skippedPolygons = 0
+
+        # write a bounding volume hierarchy over the world space boxes of the
+        # meshes to OUTPUTBASE_bvh.json, referring to their groups
+        self.spatialIndex = False
+        self.spatialIds = []
+        self.spatialBoxes = []
+
+        # give meshes with an XML3DMouseEventTag a convex proxy of at most
+        # proxyMaxTriangles triangles, which is picked instead of the mesh
+        self.pickProxies = False
+        self.proxyMaxTriangles = 32
+
+        # compute normals for meshes without a Phong tag, smooth except for
+        # the edges whose polygons meet at more than creaseAngle degrees
+        self.generateNormals = False
+        self.creaseAngle = xml3dNormals.CREASE_ANGLE
 
     ############################################################################
     # UTILITY
@@ -61,10 +214,18 @@ class XML3DExporter:
         @param prefix: New name is given as: prefix_ASCENDING-NUMBER
         @param renameId: Unique number for renaming
         """
-        newName = "%s_%d_%s" % (prefix,renameId,self.mangleName(obj.GetName()))
+        newName = self.getUniqueName(prefix, renameId, obj.GetName())
         self.originalNames[newName] = obj.GetName()
         obj.SetName(newName)
 
+    def getUniqueName(self, prefix, renameId, name):
+        """
+        Name given by createUniqueAndValidName()
+        @param name: Original name
+        @return: prefix_ASCENDING-NUMBER_MANGLEDNAME
+        """
+        return "%s_%d_%s" % (prefix,renameId,self.mangleName(name))
+
     def createUniqueAndValidNames(self, obj, prefix, renameId):
         """
         XML3D doesn't allow non-unique node names - Cinema4D does. This method
@@ -74,11 +235,9 @@ class XML3DExporter:
         @param renameId: Unique number for renaming
         @return: Modified renameId
         """
-        while obj != None:
+        for obj in xml3dTraversal.walk(obj):
             self.createUniqueAndValidName(obj, prefix, renameId)
             renameId = renameId + 1
-            renameId = self.createUniqueAndValidNames(obj.GetDown(), prefix, renameId)
-            obj = obj.GetNext()
         return renameId
 
     def createProperFilename(self, filename):
@@ -96,28 +255,25 @@ class XML3DExporter:
         Find global ambient color and ambient strength
         @param obj: Start of hierarchical search
         """
-        while obj != None:
+        walker = xml3dTraversal.Traversal(obj)
+        for obj in walker:
             if obj.GetType() == c4d.Oenvironment:
                 objContainer = obj.GetDataInstance()
                 ambColor = obj[c4d.ENVIRONMENT_AMBIENT]
                 ambStrength = obj[c4d.ENVIRONMENT_AMBIENTSTRENGTH]
                 self.ambientWorld = ambColor * ambStrength
-                break
-            else:
-                self.findWorldAmbient(obj.GetDown())
-                obj = obj.GetNext()
+                walker.skipChildren()
+                walker.skipSiblings()
 
     def findTaggedObjects(self, obj):
         """
         """
         list = []
-        while obj != None:
+        for obj in xml3dTraversal.walk(obj):
             tag = self.findTagByName(obj, "XML3DMouseEventTag")
             if tag != None:
                 print("Found tagged object %s" % obj.GetName())
                 list.append(obj)
-            list.extend(self.findTaggedObjects(obj.GetDown()))
-            obj = obj.GetNext()
         return list
 
     def mangleName(self, name):
@@ -137,10 +293,8 @@ class XML3DExporter:
         done by mangleName().
         @param obj: Start of hierarchical whitespace elimination
         """
-        while obj != None:
+        for obj in xml3dTraversal.walk(obj):
             obj.SetName( self.mangleName(obj.GetName()) )
-            self.mangleObjectNames(obj.GetDown())
-            obj = obj.GetNext()
 
     def monochromaticTransform(self, rgb):
         """
@@ -166,7 +320,7 @@ class XML3DExporter:
         @return: XML3D element
         """
         group = self.doc.createGroupElement(self.getName(obj), \
-                "true", "#t_%s" % self.getName(obj))
+                "true", self.getTransformReference(obj))
         parent.appendChild(group)
         return group
 
@@ -178,67 +332,109 @@ class XML3DExporter:
         """
         return radians * 180.0 / math.pi
 
+    def createDataText(self, text):
+        """
+        Create the text node of a data element. Arrays of numbers are only
+        formatted while the document is written.
+        @param text: String or array.array
+        @return: Text node
+        """
+        if isinstance(text, array.array):
+            return self.doc.createNumericArray(text)
+        return self.doc.createTextNode(text)
+
     def createFloatTextElement(self, name, text, id = None):
         """
         Wrapper method for generating a XML3D float element
         @param name: Name of element
-        @param text: Will be attached to the the element as text node
+        @param text: Will be attached to the the element as text node, string
+        or array.array of numbers
         @param id: Optional field. ID of the XML3D element
         @return: XML3D element
         """
         element = self.doc.createFloatElement(id, name)
-        element.appendChild(self.doc.createTextNode(text))
+        element.appendChild(self.createDataText(text))
         return element
 
     def createFloat2TextElement(self, name, text, id = None):
         """
         Wrapper method for generating a XML3D float2 element
         @param name: Name of element
-        @param text: Will be attached to the the element as text node
+        @param text: Will be attached to the the element as text node, string
+        or array.array of numbers
         @param id: Optional field. ID of the XML3D element
         @return: XML3D element
         """
         element = self.doc.createFloat2Element(id, name)
-        element.appendChild(self.doc.createTextNode(text))
+        element.appendChild(self.createDataText(text))
         return element
 
     def createFloat3TextElement(self, name, text, id = None):
         """
         Wrapper method for generating a XML3D float3 element
         @param name: Name of element
-        @param text: Will be attached to the the element as text node
+        @param text: Will be attached to the the element as text node, string
+        or array.array of numbers
         @param id: Optional field. ID of the XML3D element
         @return: XML3D element
         """
         element = self.doc.createFloat3Element(id, name)
-        element.appendChild(self.doc.createTextNode(text))
+        element.appendChild(self.createDataText(text))
+        return element
+
+    def createFloat4TextElement(self, name, text, id = None):
+        """
+        Wrapper method for generating a XML3D float4 element
+        @param name: Name of element
+        @param text: Will be attached to the the element as text node, string
+        or array.array of numbers
+        @param id: Optional field. ID of the XML3D element
+        @return: XML3D element
+        """
+        element = self.doc.createFloat4Element(id, name)
+        element.appendChild(self.createDataText(text))
+        return element
+
+    def createFloat4x4TextElement(self, name, text, id = None):
+        """
+        Wrapper method for generating a XML3D float4x4 element
+        @param name: Name of element
+        @param text: Will be attached to the the element as text node, string
+        or array.array of numbers
+        @param id: Optional field. ID of the XML3D element
+        @return: XML3D element
+        """
+        element = self.doc.createFloat4x4Element(id, name)
+        element.appendChild(self.createDataText(text))
         return element
 
     def createIntTextElement(self, name, text, id = None):
         """
         Wrapper method for generating a XML3D int element
         @param name: Name of element
-        @param text: Will be attached to the the element as text node
+        @param text: Will be attached to the the element as text node, string
+        or array.array of numbers
         @param id: Optional field. ID of the XML3D element
         @return: XML3D element
         """
         element = self.doc.createIntElement(id, name)
-        element.appendChild(self.doc.createTextNode(text))
+        element.appendChild(self.createDataText(text))
         return element
 
     def createBoolTextElement(self, name, text, id = None):
         """
         Wrapper method for generating a XML3D bool element
         @param name: Name of element
-        @param text: Will be attached to the the element as text node
+        @param text: Will be attached to the the element as text node, string
+        or array.array of numbers
         @param id: Optional field. ID of the XML3D element
         @return: XML3D element
         """
         element = self.doc.createBoolElement(id, name)
-        element.appendChild(self.doc.createTextNode(text))
+        element.appendChild(self.createDataText(text))
         return element
 
-    def createShader(self, name, ambient, diffuseColor, emissiveColor, specularColor, shininess, transparency, reflective, texture = None):
+    def createShader(self, name, ambient, diffuseColor, emissiveColor, specularColor, shininess, transparency, reflective, texture = None, textureUrl = None):
         """
         Wrapper method for generating a XML3D shader element
         @param name: Name of element
@@ -250,6 +446,7 @@ class XML3DExporter:
         @param transparency: Transparency amount between 0-1
         @param reflective   : Reflectivity amount
         @param texture: Optional. Texture path
+        @param textureUrl: Optional. Image used instead of the texture's file
         @return: XML3D element
         """
         shaderElement = self.doc.createShaderElement("shader_%s" % name, "urn:xml3d:shader:phong")
@@ -263,7 +460,9 @@ class XML3DExporter:
 
         if texture != None and texture[c4d.BITMAPSHADER_FILENAME] != None:
             textureElement = self.doc.createTextureElement(None, "diffuseTexture")
-            textureElement.appendChild(self.doc.createImgElement(None, "tex/" + texture[c4d.BITMAPSHADER_FILENAME]))
+            if textureUrl == None:
+                textureUrl = self.getTextureUrl(texture[c4d.BITMAPSHADER_FILENAME])
+            textureElement.appendChild(self.doc.createImgElement(None, textureUrl))
             shaderElement.appendChild(textureElement)
         return shaderElement
 
@@ -344,6 +543,212 @@ class XML3DExporter:
 
         return materialName
 
+    def getShaderReference(self, materialName):
+        """
+        Reference to the shader of a material, atlased materials use the
+        shader of their atlas
+        @param materialName: Name as returned by getMaterialName()
+        @return: Reference string
+        """
+        if materialName in self.atlasMaterials:
+            return "#shader_%s" % self.atlasMaterials[materialName][0]
+        return "#shader_%s" % materialName
+
+    def setTexcoord(self, values, index, uvw, atlasTransform = None):
+        """
+        Store a texture coordinate in XML3D's convention in a flat array
+        @param values: array.array with two entries per vertex
+        @param index: Vertex index or None to append the coordinate
+        @param uvw: Cinema4D texture coordinate
+        @param atlasTransform: Optional. Mapping into an atlas, see
+        xml3dAtlas.atlasTransform()
+        """
+        u, v = uvw.x, 1.0 - uvw.y
+        if atlasTransform != None:
+            u, v = xml3dAtlas.remapTexcoord(u, v, atlasTransform)
+        if index == None:
+            values.extend((u, v))
+        else:
+            values[2 * index] = u
+            values[2 * index + 1] = v
+
+    def setVector3(self, values, index, vector):
+        """
+        Store a vector with swapped x and z axis in a flat array
+        @param values: array.array with three entries per vertex
+        @param index: Vertex index or None to append the vector
+        @param vector: Cinema4D vector
+        """
+        if index == None:
+            values.extend((vector.z, vector.y, vector.x))
+        else:
+            values[3 * index] = vector.z
+            values[3 * index + 1] = vector.y
+            values[3 * index + 2] = vector.x
+
+    def isSameVector(self, a, b):
+        """
+        Compare two vectors with the tolerance used for splitting vertices
+        @param a: Cinema4D vector
+        @param b: Cinema4D vector
+        @return: True if no component differs by more than 0.0001
+        """
+        return math.fabs(a.x - b.x) <= 0.0001 and math.fabs(a.y - b.y) <= 0.0001 and math.fabs(a.z - b.z) <= 0.0001
+
+    def gatherVertices(self, values, indices, size):
+        """
+        Copy the entries of some vertices from a flat array
+        @param values: array.array with size entries per vertex
+        @param indices: Vertex indices
+        @return: array.array of the same type
+        """
+        result = array.array(values.typecode)
+        for i in indices:
+            result.extend(values[size * i : size * i + size])
+        return result
+
+    #
+    ################################################################################################
+
+
+    ################################################################################################
+    # FLATTENING
+
+    def isIdentityMatrix(self, m, epsilon = 0.00001):
+        """
+        Check whether a Cinema4D matrix is the identity
+        @param m: Matrix to be checked
+        @param epsilon: Tolerance for each component
+        @return: True if m does not change any point
+        """
+        return math.fabs(m.off.x) <= epsilon and math.fabs(m.off.y) <= epsilon and math.fabs(m.off.z) <= epsilon and \
+               math.fabs(m.v1.x - 1.0) <= epsilon and math.fabs(m.v1.y) <= epsilon and math.fabs(m.v1.z) <= epsilon and \
+               math.fabs(m.v2.x) <= epsilon and math.fabs(m.v2.y - 1.0) <= epsilon and math.fabs(m.v2.z) <= epsilon and \
+               math.fabs(m.v3.x) <= epsilon and math.fabs(m.v3.y) <= epsilon and math.fabs(m.v3.z - 1.0) <= epsilon
+
+    def isDecomposableMatrix(self, m, epsilon = 0.00001):
+        """
+        Check whether a matrix can be written as translation, scale and rotation.
+        This is the case if the axes are orthogonal and not mirrored.
+        @param m: Matrix to be checked
+        @param epsilon: Tolerance for the dot products of the normalized axes
+        @return: True if m can be exported by writeTransform
+        """
+        v1 = m.v1.GetNormalized()
+        v2 = m.v2.GetNormalized()
+        v3 = m.v3.GetNormalized()
+        if math.fabs(v1 * v2) > epsilon or math.fabs(v1 * v3) > epsilon or math.fabs(v2 * v3) > epsilon:
+            return False
+        return (v1 % v2) * v3 > 0.0
+
+    def findInstanceLinks(self, obj, links):
+        """
+        Collect all objects referenced by instance objects
+        @param obj: Start of hierarchical search
+        @param links: List the linked objects are appended to
+        """
+        for obj in xml3dTraversal.walk(obj):
+            if obj.GetType() == c4d.Oinstance:
+                linkedObj = obj[c4d.INSTANCEOBJECT_LINK]
+                if linkedObj != None:
+                    links.append(linkedObj)
+
+    def collectObjectNames(self, obj, names):
+        """
+        Add the names of obj and all its descendants to a set
+        @param obj: Root of the subtree
+        @param names: Set of names
+        """
+        for obj in xml3dTraversal.walk(obj, False):
+            names.add(obj.GetName())
+
+    def isFoldableNull(self, obj, keptNames):
+        """
+        A null object can be folded if nobody refers to its group: it carries
+        no XML3DMouseEventTag, is not linked by an instance and is not needed
+        for the tagged or selected export.
+        @param obj: Object to be checked
+        @param keptNames: Names of objects which have to be kept
+        @return: True if the group of obj may be removed or merged
+        """
+        return obj.GetType() == c4d.Onull and \
+               obj.GetName() not in keptNames and \
+               self.findTagByName(obj, "XML3DMouseEventTag") == None
+
+    def computeFlattening(self, obj, keptNames):
+        """
+        Decide which transforms and null groups are redundant. Identity
+        transforms are not exported at all. Null objects with an identity
+        transform lose their group, the children are attached to the parent
+        group instead. A chain of foldable null objects, each being the only
+        child of the previous one, is merged into the first null of the chain
+        carrying the composed transformation.
+        @param obj: Start of hierarchical search
+        @param keptNames: Names of objects which have to be kept
+        """
+        for obj in xml3dTraversal.walk(obj):
+            name = obj.GetName()
+            if self.isIdentityMatrix(obj.GetMl()) and name not in self.animatedNames:
+                self.identityTransforms.add(name)
+            if name not in self.removedGroups and self.isFoldableNull(obj, keptNames):
+                matrix = obj.GetMl()
+                folded = False
+                child = obj.GetDown()
+                while child != None and child.GetNext() == None and self.isFoldableNull(child, keptNames):
+                    composed = matrix * child.GetMl()
+                    if not self.matrixTransforms and not self.isDecomposableMatrix(composed):
+                        break
+                    matrix = composed
+                    folded = True
+                    self.removedGroups.add(child.GetName())
+                    child = child.GetDown()
+                if self.isIdentityMatrix(matrix):
+                    self.removedGroups.add(name)
+                elif folded:
+                    self.composedMatrices[name] = matrix
+
+    def prepareFlattening(self, keptObjects):
+        """
+        Run the flattening analysis on the raw scene
+        @param keptObjects: Objects (and their ancestors) which must keep
+        their groups, e.g. the tagged or selected objects
+        """
+        self.identityTransforms = set()
+        self.removedGroups = set()
+        self.composedMatrices = {}
+        self.animatedNames = set()
+        if not self.flattenHierarchy:
+            return
+
+        keptNames = set()
+        for obj in keptObjects:
+            while obj != None:
+                keptNames.add(obj.GetName())
+                obj = obj.GetUp()
+        links = []
+        self.findInstanceLinks(self.rawScene.GetFirstObject(), links)
+        for linkedObj in links:
+            self.collectObjectNames(linkedObj, keptNames)
+        # animated objects need their own transformation
+        if self.bakeAnimation:
+            for obj in self.findAnimatedObjects(self.rawScene.GetFirstObject(), True):
+                self.animatedNames.add(obj.GetName())
+            keptNames.update(self.animatedNames)
+        self.computeFlattening(self.rawScene.GetFirstObject(), keptNames)
+        print("Flattening: %d identity transforms, %d null groups removed, %d transforms composed" % \
+              (len(self.identityTransforms), len(self.removedGroups), len(self.composedMatrices)))
+
+    def getTransformReference(self, obj):
+        """
+        Reference to the transformation of an object as used by groups
+        @param obj: Object
+        @return: '#t_NAME' or None if the transformation was not exported
+        """
+        name = self.getName(obj)
+        if name in self.identityTransforms and name not in self.composedMatrices:
+            return None
+        return "#t_%s" % name
+
     #
     ################################################################################################
 
@@ -391,6 +796,7 @@ class XML3DExporter:
         defElement = self.doc.createDefsElement()            
         parent.appendChild(defElement)
         self.writeTransformsAndLightAndPolys(defElement, scene.GetFirstObject())
+        self.writeMatrixTransforms()
         self.writeMaterials(defElement, scene.GetFirstMaterial())
         self.writeDefaultMaterial(defElement)
 
@@ -404,33 +810,146 @@ class XML3DExporter:
         @param parent: Parent object in graph
         @param obj: Start of hierarchical export
         """
-        while obj != None:
+        for obj in xml3dTraversal.walk(obj, continueSameLevel):
             self.statusPercent = self.statusPercent + self.timeStep
             c4d.StatusSetBar(int(self.statusPercent * 100.0 + 0.5))
             self.writeTransform(parent, obj)
+            # hidden objects kept for visible descendants are plain groups,
+            # only instances need their light or mesh
+            if obj.GetName() in self.hiddenNames and obj.GetName() not in self.linkedNames:
+                continue
             if obj.GetType() == c4d.Olight:
                 self.writeLightShader(parent, obj)
             else:
                 polyObj = self.polygonizedScene.SearchObject(obj.GetName())
                 if polyObj != None and polyObj.GetType() == c4d.Opolygon:
                     self.writeDataObject(parent, polyObj)
-            self.writeTransformsAndLightAndPolys(parent, obj.GetDown())
 
-            if continueSameLevel:
-                obj = obj.GetNext()
+
+    def isRenderVisible(self, obj, scene, parentVisible):
+        """
+        Render visibility of an object. Objects in a layer which is not
+        rendered or matches one of the excluded layer patterns and disabled
+        generators without children count as switched off.
+        @param obj: Object of the raw scene
+        @param scene: Document of obj
+        @param parentVisible: Render visibility of the parent
+        @return: True if the object is rendered
+        """
+        layer = obj.GetLayerObject(scene)
+        if layer != None:
+            layerData = obj.GetLayerData(scene)
+            if layerData != None and not layerData["render"]:
+                return False
+            while layer != None:
+                for pattern in self.excludedLayers:
+                    if fnmatch.fnmatch(layer.GetName(), pattern):
+                        return False
+                layer = layer.GetUp()
+        if not obj.GetDeformMode() and obj.GetDown() == None:
+            return False
+        mode = obj[c4d.ID_BASEOBJECT_VISIBILITY_RENDER]
+        if mode == c4d.MODE_ON:
+            return True
+        if mode == c4d.MODE_OFF:
+            return False
+        return parentVisible
+
+    def pruneHiddenObjects(self, scene):
+        """
+        Remove the subtrees which are not rendered from the raw scene, so
+        that they are neither polygonized nor converted. The visibility is
+        inherited from the parent unless an object switches it on or off.
+        A hidden object stays if a descendant is visible, it is written as a
+        plain group then, or if a visible instance links to it. The names of
+        the hidden objects are collected in hiddenNames, the ones of the
+        objects linked by visible instances in linkedNames.
+        @param scene: Raw scene
+        """
+        objects = []
+        visible = {}
+        # the loop of xml3dTraversal.walk(), each pushed sibling keeps the
+        # visibility of its parent
+        stack = []
+        obj = scene.GetFirstObject()
+        parentState = True
+        while obj is not None:
+            state = self.isRenderVisible(obj, scene, parentState)
+            visible[obj.GetName()] = state
+            objects.append(obj)
+            sibling = obj.GetNext()
+            child = obj.GetDown()
+            if child is not None:
+                if sibling is not None:
+                    stack.append((sibling, parentState))
+                obj = child
+                parentState = state
+            elif sibling is not None:
+                obj = sibling
+            elif stack:
+                obj, parentState = stack.pop()
             else:
                 obj = None
 
-
-    def writeParentTransforms(self, current, obj):
-        """
-        todo Add some comment here!
-        """
-        if obj != None :
-          parentObj = obj.GetUp()
-          if parentObj != None :
-              self.writeParentTransforms(current, parentObj)
-          self.writeTransform(current, obj)
+        # the objects linked by visible instances are needed in any case
+        linkedNames = self.linkedNames
+        for obj in objects:
+            if obj.GetType() == c4d.Oinstance and visible[obj.GetName()]:
+                linked = obj[c4d.INSTANCEOBJECT_LINK]
+                while linked != None and linked.GetName() not in linkedNames:
+                    for linkedObj in xml3dTraversal.walk(linked, False):
+                        linkedNames.add(linkedObj.GetName())
+                    if linked.GetType() != c4d.Oinstance:
+                        break
+                    linked = linked[c4d.INSTANCEOBJECT_LINK]
+
+        # children come before their parents going backwards
+        kept = set()
+        for obj in reversed(objects):
+            name = obj.GetName()
+            if visible[name] or name in linkedNames:
+                kept.add(name)
+            if name in kept:
+                if obj.GetUp() != None:
+                    kept.add(obj.GetUp().GetName())
+                if not visible[name]:
+                    self.hiddenNames.add(name)
+
+        self.skippedObjects = 0
+        self.skippedPolygons = 0
+        removed = []
+        for obj in objects:
+            if obj.GetName() in kept:
+                continue
+            self.skippedObjects += 1
+            if obj.GetType() == c4d.Opolygon:
+                self.skippedPolygons += obj.GetPolygonCount()
+            if obj.GetUp() == None or obj.GetUp().GetName() in kept:
+                removed.append(obj)
+        for obj in removed:
+            obj.Remove()
+
+    def writeParentTransforms(self, current, obj, written = None):
+        """
+        Write the transformations of obj and all its ancestors, starting at
+        the top of the hierarchy.
+        @param current: Parent object in graph
+        @param obj: Last object of the ancestor chain
+        @param written: Optional set of names whose transformation was
+        already written. Such ancestors (and therefore all ancestors above
+        them) are skipped, the set is updated.
+        """
+        chain = []
+        while obj != None:
+            if written != None:
+                if obj.GetName() in written:
+                    break
+                written.add(obj.GetName())
+            chain.append(obj)
+            obj = obj.GetUp()
+        chain.reverse()
+        for obj in chain:
+            self.writeTransform(current, obj)
 
 
     def writeTransform(self, parent, obj):
@@ -441,9 +960,29 @@ class XML3DExporter:
         @param parent: Parent object in graph
         @param obj: Start of hierarchical export
         """
-        ax, angle = c4d.utils.MatrixToRotAxis(c4d.utils.HPBToMatrix(obj.GetRelRot()))
-        pos = obj.GetRelPos()
-        sca = obj.GetRelScale()
+        name = self.getName(obj)
+        if name in self.removedGroups:
+            return
+        if self.matrixTransforms:
+            if name in self.composedMatrices:
+                m = self.composedMatrices[name]
+            elif name in self.identityTransforms:
+                return
+            else:
+                m = obj.GetMl()
+            self.pendingMatrices.append((parent, name, self.matrixToTuple(m)))
+            return
+        if name in self.composedMatrices:
+            m = self.composedMatrices[name]
+            ax, angle = c4d.utils.MatrixToRotAxis(m.GetNormalized())
+            pos = m.off
+            sca = Vector(m.v1.GetLength(), m.v2.GetLength(), m.v3.GetLength())
+        elif name in self.identityTransforms:
+            return
+        else:
+            ax, angle = c4d.utils.MatrixToRotAxis(c4d.utils.HPBToMatrix(obj.GetRelRot()))
+            pos = obj.GetRelPos()
+            sca = obj.GetRelScale()
 
         epsilon = 0.00001
         isTranslated = math.fabs(pos.x) > epsilon or math.fabs(pos.y) > epsilon or math.fabs(pos.z) > epsilon
@@ -459,9 +998,159 @@ class XML3DExporter:
             scaleStr = "%g %g %g" % (sca.z,sca.y,sca.x)
         if isRotated:
             rotateStr = "%g %g %g %g" % (-ax.z,-ax.y,-ax.x,angle)
-        transform = self.doc.createTransformElement("t_" + self.getName(obj),translateStr, scaleStr, rotateStr)
+        transform = self.doc.createTransformElement("t_" + name,translateStr, scaleStr, rotateStr)
         parent.appendChild(transform)
 
+    def matrixToTuple(self, m):
+        """
+        Convert a Cinema4D matrix to the tuple representation used by xml3dMath
+        @param m: Cinema4D matrix
+        @return: (off.x, off.y, off.z, v1.x, ..., v3.z)
+        """
+        return (m.off.x, m.off.y, m.off.z, m.v1.x, m.v1.y, m.v1.z, \
+                m.v2.x, m.v2.y, m.v2.z, m.v3.x, m.v3.y, m.v3.z)
+
+    def findAnimatedObjects(self, obj, continueSameLevel):
+        """
+        @param obj: Start of hierarchical search
+        @param continueSameLevel: Search the siblings following obj, too
+        @return: List of objects with animation tracks
+        """
+        animated = []
+        for obj in xml3dTraversal.walk(obj, continueSameLevel):
+            if obj.GetFirstCTrack() != None:
+                animated.append(obj)
+        return animated
+
+    def writeAnimations(self, parent, selectedObjects, sameLevel):
+        """
+        Bake the local transformations of the animated objects into data
+        elements anim_NAME. They contain the key times and values of the
+        channels which change, e.g. 'translationKey' and 'translation', and
+        the value of the constant ones. Rotations are quaternions. The
+        document time is stepped once per frame and all objects are sampled
+        in the same pass.
+        The transformation t_NAME written by writeTransform() is replaced by
+        a data element computing the transformation from the keys at the
+        time 'key' of the data element animationTime, see
+        createAnimatedTransform(). A page plays the animation by setting
+        that value in seconds, it starts at the time of the document.
+        @param parent: Parent object in graph, contains the transformations
+        @param selectedObjects: Exported objects
+        @param sameLevel: Export the siblings of the objects, too
+        """
+        objects = []
+        for selectedObject in selectedObjects:
+            for obj in self.findAnimatedObjects(selectedObject, sameLevel):
+                if self.getName(obj) not in self.removedGroups:
+                    objects.append(obj)
+        if len(objects) == 0:
+            return
+
+        scene = self.rawScene
+        fps = scene.GetFps()
+        if self.animationRange != None:
+            first, last = self.animationRange
+        else:
+            first, last = scene.GetMinTime().GetFrame(fps), scene.GetMaxTime().GetFrame(fps)
+        currentTime = scene.GetTime()
+
+        start = c4d.GeGetMilliSeconds()
+        sampler = xml3dAnimation.AnimationSampler(len(objects), self.animationTolerance)
+        for frame in xrange(first, last + 1):
+            scene.SetTime(c4d.BaseTime(frame, fps))
+            scene.ExecutePasses(None, True, True, True, c4d.BUILDFLAGS_0)
+            samples = []
+            for obj in objects:
+                ax, angle = c4d.utils.MatrixToRotAxis(c4d.utils.HPBToMatrix(obj.GetRelRot()))
+                pos = obj.GetRelPos()
+                sca = obj.GetRelScale()
+                samples.append(((pos.z, pos.y, pos.x), (-ax.z, -ax.y, -ax.x), angle, (sca.z, sca.y, sca.x)))
+            sampler.addFrame(float(frame) / fps, samples)
+        scene.SetTime(currentTime)
+        scene.ExecutePasses(None, True, True, True, c4d.BUILDFLAGS_0)
+        sampled = c4d.GeGetMilliSeconds() - start
+
+        transforms = {}
+        for element in parent.childNodes:
+            if element.nodeType == element.ELEMENT_NODE and element.getAttribute("id").startswith("t_"):
+                transforms[element.getAttribute("id")] = element
+
+        timeData = self.doc.createDataElement("animationTime")
+        timeData.appendChild(self.createFloatTextElement("key", "%g" % currentTime.Get()))
+        parent.appendChild(timeData)
+        keys = 0
+        size = 0
+        for i in xrange(len(objects)):
+            name = self.getName(objects[i])
+            channels = sampler.getKeys(i)
+            if len(channels) == 0 or not "t_" + name in transforms:
+                continue
+            data = self.doc.createDataElement("anim_" + name)
+            data.appendChild(self.doc.createDataElement(None, None, None, "#animationTime"))
+            for channel, components, keyTimes, keyValues in channels:
+                data.appendChild(self.createFloatTextElement(channel + "Key", keyTimes))
+                if components == 4:
+                    data.appendChild(self.createFloat4TextElement(channel, keyValues))
+                else:
+                    data.appendChild(self.createFloat3TextElement(channel, keyValues))
+                keys += len(keyTimes)
+                size += xml3dAnimation.formattedSize(keyTimes) + xml3dAnimation.formattedSize(keyValues)
+            for channel, components, value in sampler.getConstants(i):
+                if components == 4:
+                    data.appendChild(self.createFloat4TextElement(channel, value))
+                else:
+                    data.appendChild(self.createFloat3TextElement(channel, value))
+            parent.appendChild(data)
+            parent.replaceChild(self.createAnimatedTransform(name, channels), transforms["t_" + name])
+        print("Animation frames %d-%d: %d objects sampled in %gms, %d of %d keys kept, %d bytes" % \
+              (first, last, len(objects), sampled, keys, 3 * len(objects) * (last - first + 1), size))
+
+    def createAnimatedTransform(self, name, channels):
+        """
+        Data element t_NAME providing the float4x4 'transform' of an animated
+        object, which groups reference like any transformation, also in
+        matrix mode. Every changing channel is interpolated between its keys
+        in anim_NAME by a nested compute, the constant ones are passed
+        through.
+        @param name: Name of the object
+        @param channels: Changing channels, see AnimationSampler.getKeys()
+        @return: XML3D element
+        """
+        transform = self.doc.createDataElement("t_" + name, compute_ = "transform = xflow.createTransform({translation: translation, rotation: rotation, scale: scale})")
+        inner = transform
+        for channel, components, keyTimes, keyValues in channels:
+            if components == 4:
+                operator = "xflow.slerpKeys"
+            else:
+                operator = "xflow.lerpKeys"
+            data = self.doc.createDataElement(compute_ = "%s = %s(%sKey, %s, key)" % (channel, operator, channel, channel))
+            inner.appendChild(data)
+            inner = data
+        inner.appendChild(self.doc.createDataElement(None, None, None, "#anim_" + name))
+        return transform
+
+    def writeMatrixTransforms(self):
+        """
+        Write all transformations collected by writeTransform() in matrix
+        mode. The matrices are converted to the XML3D coordinate system in
+        one step and written as data element providing a float4x4 named
+        'transform', which can be referenced by groups just like a transform
+        element. Identity matrices are written as empty transform element.
+        """
+        if len(self.pendingMatrices) == 0:
+            return
+        matrices = xml3dMath.convertMatrices([entry[2] for entry in self.pendingMatrices])
+        for i in range(len(matrices)):
+            parent, name, raw = self.pendingMatrices[i]
+            if xml3dMath.isIdentity(matrices[i]):
+                parent.appendChild(self.doc.createTransformElement("t_" + name))
+            else:
+                data = self.doc.createDataElement("t_" + name)
+                data.appendChild(self.createFloat4x4TextElement("transform", xml3dMath.formatMatrix(matrices[i])))
+                parent.appendChild(data)
+        self.pendingMatrices = []
+
     def writeLightShader(self, parent, obj):
         """
         Write light shader
@@ -500,29 +1189,213 @@ class XML3DExporter:
             lightShaderElement.appendChild(self.createFloatTextElement("beamWidth", "%g" % self.convertRadians(obj[c4d.LIGHT_DETAILS_INNERANGLE])))
             lightShaderElement.appendChild(self.createFloatTextElement("cutOffAngle", "%g" % self.convertRadians(obj[c4d.LIGHT_DETAILS_OUTERANGLE])))
 
+    def getTextureUrl(self, filename):
+        """
+        URL of a texture as written into the scene
+        @param filename: File name of the bitmap shader
+        @return: Processed file if the texture stage is enabled, else the file
+        name in the 'tex' folder
+        """
+        if self.texturePipeline != None:
+            source = xml3dTextures.resolveTexturePath(filename, self.getTextureSearchPaths())
+            if source != None and self.texturePipeline.getUrl(source) != None:
+                return self.texturePipeline.getUrl(source)
+        return "tex/" + filename
+
+    def getTextureSearchPaths(self):
+        """
+        Directories searched for textures with relative file names
+        """
+        return [self.documentPath, os.path.join(self.documentPath, "tex")]
+
+    def prepareTextures(self, obj):
+        """
+        Pass over the material graph to process the textures of all used
+        materials before the shaders are written.
+        @param obj: First material
+        """
+        self.collectTextures(obj)
+        self.texturePipeline.process()
+
+    def collectTextures(self, obj):
+        """
+        Add the bitmaps of all used materials to the texture pipeline
+        @param obj: Start of hierarchical traversal
+        """
+        for obj in xml3dTraversal.walk(obj):
+            texture = obj[c4d.MATERIAL_COLOR_SHADER]
+            if obj.GetName() in self.usedMaterials and obj.GetName() not in self.atlasMaterials and texture != None and texture[c4d.BITMAPSHADER_FILENAME] != None:
+                source = xml3dTextures.resolveTexturePath(texture[c4d.BITMAPSHADER_FILENAME], self.getTextureSearchPaths())
+                if source != None:
+                    self.texturePipeline.add(source)
+                else:
+                    print("Texture %s not found" % texture[c4d.BITMAPSHADER_FILENAME])
+
+    def resizeTexture(self, source, target, maxSize):
+        """
+        Downscale an image so that its width and height are at most maxSize.
+        Called by the texture pipeline from the main thread.
+        @param source: Image file
+        @param target: Output file, same format as source
+        @param maxSize: Maximum width and height
+        @return: False if the image was not written and has to be copied
+        """
+        extension = os.path.splitext(target)[1].lower()
+        if extension == ".png":
+            format = c4d.FILTER_PNG
+        elif extension == ".jpg" or extension == ".jpeg":
+            format = c4d.FILTER_JPG
+        else:
+            return False
+
+        bmp = c4d.bitmaps.BaseBitmap()
+        if bmp.InitWith(source)[0] != c4d.IMAGERESULT_OK:
+            return False
+        width = bmp.GetBw()
+        height = bmp.GetBh()
+        if width <= maxSize and height <= maxSize:
+            return False
+
+        scale = float(maxSize) / max(width, height)
+        scaled = c4d.bitmaps.BaseBitmap()
+        scaled.Init(max(1, int(width * scale)), max(1, int(height * scale)))
+        bmp.ScaleIt(scaled, 256, True, False)
+        return scaled.Save(target, format) == c4d.IMAGERESULT_OK
+
+    def prepareAtlases(self, directory, baseName):
+        """
+        Pack the textures of qualifying materials into atlas images. Materials
+        qualify if their bitmap has no alpha channel and is not larger than
+        atlasMaxTextureSize and all texture tags using them have UVW
+        projection without tiling, offset or scale. Only materials with equal
+        shader parameters share an atlas, so that each atlas needs one shader.
+        @param directory: Folder of the atlas images
+        @param baseName: Prefix of the atlas file names
+        """
+        candidates = {}
+        rejected = set()
+        self.collectAtlasCandidates(self.rawScene.GetFirstObject(), candidates, rejected)
+
+        groups = {}
+        for materialName in candidates:
+            if materialName in rejected:
+                continue
+            material = candidates[materialName]
+            bmp = self.loadAtlasBitmap(material)
+            if bmp != None:
+                signature = self.getShaderSignature(material)
+                groups.setdefault(signature, []).append((materialName, material, bmp))
+
+        for signature in groups:
+            entries = groups[signature]
+            if len(entries) < 2:
+                continue
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            atlases = xml3dAtlas.packShelves([(bmp.GetBw(), bmp.GetBh()) for name, material, bmp in entries], self.atlasSize, self.atlasSize, self.atlasPadding)
+            for atlas in atlases:
+                start = c4d.GeGetMilliSeconds()
+                atlasName = "atlas_%d" % len(self.atlasUrls)
+                image = c4d.bitmaps.BaseBitmap()
+                image.Init(atlas.width, atlas.height)
+                for index in atlas.placements:
+                    x, y, w, h = atlas.placements[index]
+                    self.blitTexture(image, entries[index][2], x, y)
+                    self.atlasMaterials[entries[index][0]] = (atlasName, xml3dAtlas.atlasTransform(atlas.placements[index], atlas.width, atlas.height))
+                filename = "%s_%s.png" % (baseName, atlasName)
+                if image.Save(os.path.join(directory, filename), c4d.FILTER_PNG) != c4d.IMAGERESULT_OK:
+                    print("Unable to write atlas %s" % filename)
+                elif self.hashedNames:
+                    filename = os.path.basename(self.hashOutputFile(os.path.join(directory, filename)))
+                self.atlasUrls[atlasName] = "tex/" + filename
+                print("Atlas %s: %d textures, %dx%d, %.1f%% used, %gms" % (atlasName, len(atlas.placements), atlas.width, atlas.height, 100.0 * atlas.efficiency(), c4d.GeGetMilliSeconds() - start))
+
+    def collectAtlasCandidates(self, obj, candidates, rejected):
+        """
+        Find the materials referenced by texture tags and reject those whose
+        texture coordinates can't be mapped into an atlas
+        @param obj: Start of hierarchical traversal
+        @param candidates: Dictionary of material name -> material
+        @param rejected: Set of material names
+        """
+        for obj in xml3dTraversal.walk(obj):
+            tag = self.findTag(obj, c4d.Ttexture)
+            if tag != None and tag.GetMaterial() != None:
+                materialName = self.getName(tag.GetMaterial())
+                candidates[materialName] = tag.GetMaterial()
+                if tag[c4d.TEXTURETAG_PROJECTION] != c4d.TEXTURETAG_PROJECTION_UVW or tag[c4d.TEXTURETAG_TILE] or \
+                   tag[c4d.TEXTURETAG_OFFSETX] != 0.0 or tag[c4d.TEXTURETAG_OFFSETY] != 0.0 or \
+                   tag[c4d.TEXTURETAG_LENGTHX] != 1.0 or tag[c4d.TEXTURETAG_LENGTHY] != 1.0 or \
+                   materialName == "envMapMat":
+                    rejected.add(materialName)
+
+    def loadAtlasBitmap(self, material):
+        """
+        Load the diffuse bitmap of a material if it is small enough for an atlas
+        @param material: Material
+        @return: BaseBitmap or None
+        """
+        texture = material[c4d.MATERIAL_COLOR_SHADER]
+        if texture == None or texture[c4d.BITMAPSHADER_FILENAME] == None:
+            return None
+        source = xml3dTextures.resolveTexturePath(texture[c4d.BITMAPSHADER_FILENAME], self.getTextureSearchPaths())
+        if source == None:
+            return None
+        bmp = c4d.bitmaps.BaseBitmap()
+        if bmp.InitWith(source)[0] != c4d.IMAGERESULT_OK:
+            return None
+        if bmp.GetBw() > self.atlasMaxTextureSize or bmp.GetBh() > self.atlasMaxTextureSize or bmp.GetInternalChannel() != None:
+            return None
+        return bmp
+
+    def getShaderSignature(self, material):
+        """
+        Shader parameters of a material except for the texture
+        @return: String, equal for materials that can share a shader
+        """
+        ambient, diffuseColor, emissiveColor, specularColor, shininess, transparency, reflective, texture = self.getMaterialParameters(material)
+        return "%g %g %g %g %g %g %g %g %g %g %g %g %g %g" % (ambient, diffuseColor.x, diffuseColor.y, diffuseColor.z,
+                                                               emissiveColor.x, emissiveColor.y, emissiveColor.z,
+                                                               specularColor.x, specularColor.y, specularColor.z,
+                                                               shininess, transparency, reflective, material[c4d.MATERIAL_COLOR_TEXTURESTRENGTH])
+
+    def blitTexture(self, image, bmp, x, y):
+        """
+        Copy a bitmap into an atlas image. The padding around it repeats the
+        border pixels, so that filtering doesn't pick up the neighbors.
+        @param image: Atlas image
+        @param bmp: Texture
+        @param x: Left border of the texture in the atlas
+        @param y: Upper border of the texture in the atlas
+        """
+        width = bmp.GetBw()
+        height = bmp.GetBh()
+        padding = self.atlasPadding
+        for j in xrange(-padding, height + padding):
+            sj = min(max(j, 0), height - 1)
+            for i in xrange(-padding, width + padding):
+                si = min(max(i, 0), width - 1)
+                r, g, b = bmp.GetPixel(si, sj)
+                image.SetPixel(x + i, y + j, r, g, b)
+
     def writeMaterials(self, parent, obj):
         """
         The method traverses the material graph and exports all materials.
         @param parent: Parent object in graph
         @param obj: Start of hierarchical export
         """
-        while obj != None:
+        for obj in xml3dTraversal.walk(obj):
             self.statusPercent = self.statusPercent + self.timeStep
             c4d.StatusSetBar(int(self.statusPercent * 100.0 + 0.5))
             self.writeMaterial(parent, obj)
-            self.writeMaterials(parent, obj.GetDown())
-            obj = obj.GetNext()
 
-    def writeMaterial(self, parent, obj):
+    def getMaterialParameters(self, obj):
         """
-        Write single material.
-        @param parent: Parent object in graph
+        Read the shader parameters of a material
         @param obj: Material
+        @return: (ambient, diffuseColor, emissiveColor, specularColor,
+        shininess, transparency, reflective, texture)
         """
-        if obj == None:
-            print ("Object is none Cannot export material")
-            return
-
         ambient = self.monochromaticTransform(self.ambientWorld)
         diffuseColor = Vector(0.5,0.5,0.5)
         emissiveColor = Vector(0.0,0.0,0.0)
@@ -552,13 +1425,32 @@ class XML3DExporter:
             else:
                 diffuseColor = Vector(1,1,1)
 
+        return (ambient, diffuseColor, emissiveColor, specularColor, shininess, transparency, reflective, texture)
+
+    def writeMaterial(self, parent, obj):
+        """
+        Write single material.
+        @param parent: Parent object in graph
+        @param obj: Material
+        """
+        if obj == None:
+            print ("Object is none Cannot export material")
+            return
+
+        ambient, diffuseColor, emissiveColor, specularColor, shininess, transparency, reflective, texture = self.getMaterialParameters(obj)
+
         materialName = obj.GetName()
         # see if materials is used at all
         if materialName in self.usedMaterials:
+            # atlased materials share the shader of their atlas
+            if materialName in self.atlasMaterials:
+                materialName = self.atlasMaterials[materialName][0]
             # check if material is not exported already
-            if self.usedMaterials[materialName] < 2:
+            if self.usedMaterials.get(materialName, 0) < 2:
                 if obj.GetName() == "envMapMat":
                     parent.appendChild(self.createEnvShader(self.getName(obj), texture))
+                elif materialName in self.atlasUrls:
+                    parent.appendChild(self.createShader(materialName, ambient, diffuseColor, emissiveColor, specularColor, shininess, transparency, reflective, texture, self.atlasUrls[materialName]))
                 else:
                     parent.appendChild(self.createShader(self.getName(obj), ambient, diffuseColor, emissiveColor, specularColor, shininess, transparency, reflective, texture))
                 self.usedMaterials[materialName] = 2
@@ -577,6 +1469,10 @@ class XML3DExporter:
         shininess = 0.2
         transparency = 0.0
         parent.appendChild(self.createShader("defaultMaterial",ambient,diffuseColor,emissiveColor,specularColor,shininess,transparency,reflective))
+        if self.pickProxies:
+            # fully transparent, so that the proxies are drawn into the
+            # picking buffer only
+            parent.appendChild(self.createShader("pickProxy",0.0,diffuseColor,emissiveColor,specularColor,shininess,1.0,0.0))
 
     def writeDataObject(self, parent, obj):
         """
@@ -588,24 +1484,142 @@ class XML3DExporter:
         2.2. Update variable numVertices
         2.3. Correct vertex indices of polygon array
         2.4. Rebuild sharing faces data structure
-        3. Create phong normals and search for uvw tag
+        3. Create phong normals, or crease angle normals with generateNormals
+        if the mesh has no Phong tag, and search for uvw tag
         4. Iterate over vertices and check if all faces sharing current vertex:
         - Have same normal
         - Have same texture coordinate (if uvwTag was found)
         5. If both criteria are matched: Export vertex, normal and texture
         coordinate together with single index. Otherwise split face and
-        duplicate data.
+        duplicate data, with generated normals one copy of the vertex per
+        distinct normal and texture coordinate.
         6. Insert data into document
+        In a batch export, the arrays of steps 1 to 5 are shared through the
+        mesh cache by all meshes with the same content.
         @param parent: Parent object in graph
         @param obj: Mesh
         """
         materialName = self.getMaterialName(obj)
         self.usedMaterials[materialName] = 1
+        atlasTransform = None
+        if materialName in self.atlasMaterials:
+            atlasTransform = self.atlasMaterials[materialName][1]
 
         # Create group
+        container = parent
+        if self.externalGeometry and not self.compressGeometry:
+            container = self.createExternalContainer()
         group = self.doc.createDataElement("data_"+self.getName(obj))
-        parent.appendChild(group)
+        container.appendChild(group)
+
+        mesh = self.getMeshData(obj, atlasTransform)
+        if mesh != None:
+            triangles, vertexList, normalList, texcoordList, bounds, sphere = mesh
+
+            # Insert into document
+            if self.compressGeometry:
+                group.appendChild(self.writeCompressedData(obj, triangles, vertexList, normalList, texcoordList))
+            else:
+                group.appendChild(self.createIntTextElement("index", triangles))
+                group.appendChild(self.createFloat3TextElement("position", vertexList))
+                if normalList != None:
+                    group.appendChild(self.createFloat3TextElement("normal", normalList))
+                if texcoordList != None:
+                    group.appendChild(self.createFloat2TextElement("texcoord", texcoordList))
+
+            if self.writeBounds:
+                self.meshBounds[self.getName(obj)] = bounds
+                self.writeBoundsData(group, bounds, sphere)
+
+            if self.lodLevels > 0 and obj.GetPolygonCount() > self.lodPolygonThreshold:
+                positions = [ (vertexList[i], vertexList[i + 1], vertexList[i + 2]) for i in xrange(0, len(vertexList), 3) ]
+                self.writeLevelsOfDetail(container, obj, positions, triangles, vertexList, normalList, texcoordList)
 
+        if self.externalGeometry and not self.compressGeometry:
+            self.writeExternalData(parent, container, obj)
+
+    def getMeshData(self, obj, atlasTransform):
+        """
+        Processed arrays of a mesh, taken from the mesh cache in a batch export
+        @param obj: Mesh
+        @param atlasTransform: Mapping of the texture coordinates or None
+        @return: See computeMeshData()
+        """
+        key = None
+        if self.caches != None and not self.boundedMemory:
+            start = c4d.GeGetMilliSeconds()
+            key = self.getMeshKey(obj, atlasTransform)
+            self.caches.meshes.addOverhead(c4d.GeGetMilliSeconds() - start)
+            mesh = self.caches.meshes.get(key)
+            if mesh != None:
+                return mesh
+        start = c4d.GeGetMilliSeconds()
+        mesh = self.computeMeshData(obj, atlasTransform)
+        if key != None and mesh != None:
+            self.caches.meshes.put(key, mesh, c4d.GeGetMilliSeconds() - start)
+        return mesh
+
+    def getMeshKey(self, obj, atlasTransform):
+        """
+        Hash of everything computeMeshData() reads from a mesh
+        @param obj: Mesh
+        @param atlasTransform: Mapping of the texture coordinates or None
+        @return: Hex digest
+        """
+        values = array.array('d')
+        for p in obj.GetAllPoints():
+            values.extend((p.x, p.y, p.z))
+        indices = array.array('i')
+        for p in obj.GetAllPolygons():
+            indices.extend((p.a, p.b, p.c, p.d))
+        normals = obj.CreatePhongNormals()
+        if normals != None:
+            for n in normals:
+                values.extend((n.x, n.y, n.z))
+        elif self.generateNormals:
+            values.append(self.creaseAngle)
+        uvwTag = self.findTag(obj, c4d.Tuvw)
+        textureTag = self.findTag(obj, c4d.Ttexture)
+        lengths = None
+        if uvwTag != None:
+            if textureTag != None:
+                lengths = (textureTag[c4d.TEXTURETAG_LENGTHX], textureTag[c4d.TEXTURETAG_LENGTHY])
+            for i in xrange(obj.GetPolygonCount()):
+                uvw = uvwTag.GetSlow(i)
+                for corner in ("a", "b", "c", "d"):
+                    values.extend((uvw[corner].x, uvw[corner].y, uvw[corner].z))
+        sha = hashlib.sha1()
+        sha.update("%d %d %r %r %r %r %r" % (len(values), len(indices), normals != None, self.generateNormals, lengths, atlasTransform, self.writeBounds))
+        sha.update(values.tostring())
+        sha.update(indices.tostring())
+        return sha.hexdigest()
+
+    def createCreaseNormals(self, vertices, polygons):
+        """
+        Normals of a mesh without Phong tag, see xml3dNormals
+        @param vertices: Points of the mesh without the isolated ones
+        @param polygons: Polygons indexing vertices
+        @return: List of vectors in the layout of CreatePhongNormals()
+        """
+        points = array.array('d')
+        for vertex in vertices:
+            points.extend((vertex.x, vertex.y, vertex.z))
+        indices = array.array('i')
+        for p in polygons:
+            indices.extend((p.a, p.b, p.c, p.d))
+        values = xml3dNormals.cornerNormals(points, indices, self.creaseAngle)
+        return [Vector(values[k], values[k + 1], values[k + 2]) for k in xrange(0, len(values), 3)]
+
+    def computeMeshData(self, obj, atlasTransform):
+        """
+        Steps 1 to 5 of writeDataObject()
+        @param obj: Mesh
+        @param atlasTransform: Mapping of the texture coordinates or None
+        @return: (triangles, vertexList, normalList, texcoordList, bounds,
+        sphere) or None for meshes without polygons. The lists are flat
+        arrays in XML3D coordinates, normalList and texcoordList may be None.
+        bounds and sphere are only computed with writeBounds.
+        """
         # Extract mesh
         polyCount = obj.GetPolygonCount()
         polygonIndices = obj.GetAllPolygons()
@@ -651,6 +1665,9 @@ class XML3DExporter:
                     sharingFaces[p.d].append(i)
 
         normals = obj.CreatePhongNormals()
+        generatedNormals = normals == None and self.generateNormals
+        if generatedNormals:
+            normals = self.createCreaseNormals(vertices, polygonIndices)
         uvwTag = self.findTag(obj, c4d.Tuvw)
         textureTag = self.findTag(obj, c4d.Ttexture)
         if uvwTag != None:
@@ -666,8 +1683,8 @@ class XML3DExporter:
 
         #normals = None
         if normals != None:
-            normalList = [ None for i in xrange(numVertices) ]
-            texcoordList = [ None for i in xrange(numVertices) ]
+            normalList = array.array('d', [0.0]) * (3 * numVertices)
+            texcoordList = array.array('d', [0.0]) * (2 * numVertices)
             for i in range(0, numVertices):
                 equal = True
                 curNormal = None
@@ -719,16 +1736,16 @@ class XML3DExporter:
                 if equal:
                     if curNormal == None:
                         print ("curNormal == None!!")
-                    normalList[i] = ("%g %g %g " % (curNormal.z,curNormal.y,curNormal.x))
+                    self.setVector3(normalList, i, curNormal)
                     if uvwTag != None:
-                        texcoordList[i] = ("%g %g" % (curUVW.x,1.0-curUVW.y))
+                        self.setTexcoord(texcoordList, i, curUVW, atlasTransform)
                 # Normals and/or tex coords are not equal for all sharing faces.
                 # The vertex needs to be split up, so that each sharing face
                 # gets its own vertex.
-                else:
+                elif not generatedNormals:
                     if curNormal == None:
                         print ("curNormal == None!!")
-                    normalList[i] = ("%g %g %g " % (curNormal.z,curNormal.y,curNormal.x))
+                    self.setVector3(normalList, i, curNormal)
                     if uvwTag != None:
                         fidx = sharingFaces[i][0]
                         p = polygonIndices[fidx]
@@ -738,13 +1755,13 @@ class XML3DExporter:
                             LengthY = 1
                         uvw = self.modifytextureLenght ( LengthX, LengthY, fidx, uvwTag)
                         if i == p.a:
-                            texcoordList[i] = ("%g %g" % (uvw["a"].x,1.0-uvw["a"].y))
+                            self.setTexcoord(texcoordList, i, uvw["a"], atlasTransform)
                         elif i == p.b:
-                            texcoordList[i] = ("%g %g" % (uvw["b"].x,1.0-uvw["b"].y))
+                            self.setTexcoord(texcoordList, i, uvw["b"], atlasTransform)
                         elif i == p.c:
-                            texcoordList[i] = ("%g %g" % (uvw["c"].x,1.0-uvw["c"].y))
+                            self.setTexcoord(texcoordList, i, uvw["c"], atlasTransform)
                         else:
-                            texcoordList[i] = ("%g %g" % (uvw["d"].x,1.0-uvw["d"].y))
+                            self.setTexcoord(texcoordList, i, uvw["d"], atlasTransform)
 
                     for k in range(1, len(sharingFaces[i])):
                         fidx = sharingFaces[i][k]
@@ -752,13 +1769,13 @@ class XML3DExporter:
                         if uvwTag != None:
                             uvw = self.modifytextureLenght ( LengthX, LengthY, fidx, uvwTag)
                             if i == p.a:
-                                texcoordList.append("%g %g" % (uvw["a"].x,1.0-uvw["a"].y))
+                                self.setTexcoord(texcoordList, None, uvw["a"], atlasTransform)
                             elif i == p.b:
-                                texcoordList.append("%g %g" % (uvw["b"].x,1.0-uvw["b"].y))
+                                self.setTexcoord(texcoordList, None, uvw["b"], atlasTransform)
                             elif i == p.c:
-                                texcoordList.append("%g %g" % (uvw["c"].x,1.0-uvw["c"].y))
+                                self.setTexcoord(texcoordList, None, uvw["c"], atlasTransform)
                             else:
-                                texcoordList.append("%g %g" % (uvw["d"].x,1.0-uvw["d"].y))
+                                self.setTexcoord(texcoordList, None, uvw["d"], atlasTransform)
 
                         if i == p.a:
                             tmpNormal = normals[fidx * 4]
@@ -778,31 +1795,454 @@ class XML3DExporter:
                         vertices.append(vertices[i])
                         if tmpNormal == None:
                             print ("tmpNormal == None!!")
-                        normalList.append("%g %g %g " % (tmpNormal.z,tmpNormal.y,tmpNormal.x))
+                        self.setVector3(normalList, None, tmpNormal)
+                # Generated normals split the vertex only at creases and
+                # seams, every distinct normal and tex coord gets its own
+                # vertex. The first one keeps the index of the vertex.
+                else:
+                    if uvwTag != None:
+                        if LengthX == None:
+                            LengthX = 1
+                        if LengthY == None:
+                            LengthY = 1
+                    splits = []
+                    for fidx in sharingFaces[i]:
+                        p = polygonIndices[fidx]
+                        if i == p.a:
+                            corner = "a"
+                            tmpNormal = normals[fidx * 4]
+                        elif i == p.b:
+                            corner = "b"
+                            tmpNormal = normals[fidx * 4 + 1]
+                        elif i == p.c:
+                            corner = "c"
+                            tmpNormal = normals[fidx * 4 + 2]
+                        else:
+                            corner = "d"
+                            tmpNormal = normals[fidx * 4 + 3]
+                        if tmpNormal == None:
+                            print ("tmpNormal == None!!")
+                        tmpUVW = None
+                        if uvwTag != None:
+                            tmpUVW = self.modifytextureLenght ( LengthX, LengthY, fidx, uvwTag)[corner]
 
-        if len(vertices) > 0 and polyCount > 0:
-            indexList = []
-            vertexList = []
+                        index = None
+                        for splitNormal, splitUVW, splitIndex in splits:
+                            if self.isSameVector(splitNormal, tmpNormal) and (tmpUVW == None or self.isSameVector(splitUVW, tmpUVW)):
+                                index = splitIndex
+                                break
+                        if index == None and len(splits) == 0:
+                            index = i
+                            self.setVector3(normalList, i, tmpNormal)
+                            if uvwTag != None:
+                                self.setTexcoord(texcoordList, i, tmpUVW, atlasTransform)
+                            splits.append((tmpNormal, tmpUVW, index))
+                        elif index == None:
+                            index = len(vertices)
+                            vertices.append(vertices[i])
+                            self.setVector3(normalList, None, tmpNormal)
+                            if uvwTag != None:
+                                self.setTexcoord(texcoordList, None, tmpUVW, atlasTransform)
+                            splits.append((tmpNormal, tmpUVW, index))
+                        if index == i:
+                            continue
+
+                        # Split face
+                        if corner == "a":
+                            polygonIndices[fidx].a = index
+                        elif corner == "b":
+                            polygonIndices[fidx].b = index
+                        elif corner == "c":
+                            # the last corner of a triangle repeats the third one
+                            if p.c == p.d:
+                                polygonIndices[fidx].d = index
+                            polygonIndices[fidx].c = index
+                        else:
+                            polygonIndices[fidx].d = index
+
+        if len(vertices) == 0 or polyCount == 0:
+            return None
+
+        triangles = array.array('i')
+        vertexList = array.array('d')
+        bounds = None
+        sphere = None
+        if self.writeBounds:
+            minX, minY, minZ = vertices[0].z, vertices[0].y, vertices[0].x
+            maxX, maxY, maxZ = minX, minY, minZ
             for vertex in vertices:
-                vertexList.append("%g %g %g" % (vertex.z,vertex.y,vertex.x))
-            for i in range(0, polyCount):
-                p = polygonIndices[i]
-                indexList.append(str(p.a))
-                indexList.append(str(p.b))
-                indexList.append(str(p.c))
-                if p.c != p.d:
-                    indexList.append(str(p.a))
-                    indexList.append(str(p.c))
-                    indexList.append(str(p.d))
+                vertexList.extend((vertex.z, vertex.y, vertex.x))
+                minX, maxX = min(minX, vertex.z), max(maxX, vertex.z)
+                minY, maxY = min(minY, vertex.y), max(maxY, vertex.y)
+                minZ, maxZ = min(minZ, vertex.x), max(maxZ, vertex.x)
+            bounds = (minX, minY, minZ, maxX, maxY, maxZ)
+            cx, cy, cz = 0.5 * (minX + maxX), 0.5 * (minY + maxY), 0.5 * (minZ + maxZ)
+            radius = 0.0
+            for vertex in vertices:
+                radius = max(radius, (vertex.z - cx) ** 2 + (vertex.y - cy) ** 2 + (vertex.x - cz) ** 2)
+            sphere = (cx, cy, cz, math.sqrt(radius))
+        else:
+            for vertex in vertices:
+                vertexList.extend((vertex.z, vertex.y, vertex.x))
+        for i in range(0, polyCount):
+            p = polygonIndices[i]
+            triangles.extend((p.a, p.b, p.c))
+            if p.c != p.d:
+                triangles.extend((p.a, p.c, p.d))
+
+        if normals == None or len(normals) == 0:
+            normalList = None
+            texcoordList = None
+        elif uvwTag == None:
+            texcoordList = None
+        return (triangles, vertexList, normalList, texcoordList, bounds, sphere)
+
+    def writeBoundsData(self, parent, bounds, sphere, id = None):
+        """
+        Append bounding box and bounding sphere as XML3D data
+        @param parent: Element the data is appended to
+        @param bounds: (minX, minY, minZ, maxX, maxY, maxZ)
+        @param sphere: (centerX, centerY, centerZ, radius)
+        @param id: Optional. If given, the values are wrapped into a data
+        element with this id, otherwise they are appended to parent directly
+        """
+        if id != None:
+            data = self.doc.createDataElement(id)
+            parent.appendChild(data)
+            parent = data
+        parent.appendChild(self.createFloat3TextElement("bboxMin", "%g %g %g" % bounds[0:3]))
+        parent.appendChild(self.createFloat3TextElement("bboxMax", "%g %g %g" % bounds[3:6]))
+        parent.appendChild(self.createFloat4TextElement("boundingSphere", "%g %g %g %g" % sphere))
+
+    def computeSubtreeBounds(self, obj):
+        """
+        Bounding box of an object and all its descendants in the local
+        coordinate system of the object (before its own transformation is
+        applied). Instances contribute the bounds of the object they link to.
+        The results are cached in self.subtreeBounds.
+        @param obj: Cinema4D object of the raw scene
+        @return: (minX, minY, minZ, maxX, maxY, maxZ) in XML3D coordinates or
+        None if there is no geometry below obj
+        """
+        if obj.GetName() in self.subtreeBounds:
+            return self.subtreeBounds[obj.GetName()]
+
+        # children are handled before their parents by going backwards
+        walker = xml3dTraversal.Traversal(obj, None, False)
+        subtree = []
+        for current in walker:
+            if current.GetName() in self.subtreeBounds:
+                walker.skipChildren()
+            subtree.append(current)
+        subtree.reverse()
+
+        for current in subtree:
+            name = current.GetName()
+            if name in self.subtreeBounds:
+                continue
+            bounds = self.meshBounds.get(name)
+            if current.GetType() == c4d.Oinstance:
+                linkedObj = current[c4d.INSTANCEOBJECT_LINK]
+                while linkedObj != None and linkedObj.GetType() == c4d.Oinstance:
+                    linkedObj = linkedObj[c4d.INSTANCEOBJECT_LINK]
+                if linkedObj != None:
+                    bounds = xml3dMath.unionBounds(bounds, self.computeSubtreeBounds(linkedObj))
+            child = current.GetDown()
+            while child != None:
+                childBounds = self.subtreeBounds[child.GetName()]
+                if childBounds != None:
+                    childMatrix = xml3dMath.convertMatrix(self.matrixToTuple(child.GetMl()))
+                    bounds = xml3dMath.unionBounds(bounds, xml3dMath.transformBounds(childBounds, childMatrix))
+                child = child.GetNext()
+            self.subtreeBounds[name] = bounds
+        return self.subtreeBounds[obj.GetName()]
+
+    def writeGroupBounds(self, group, obj):
+        """
+        Append the world space bounds of the subtree of obj to its group as
+        data element 'bounds_NAME'
+        @param group: XML3D group written for obj
+        @param obj: Cinema4D object of the raw scene
+        """
+        bounds = self.computeSubtreeBounds(obj)
+        if bounds == None:
+            return
+        worldMatrix = xml3dMath.convertMatrix(self.matrixToTuple(obj.GetMg()))
+        bounds = xml3dMath.transformBounds(bounds, worldMatrix)
+        self.writeBoundsData(group, bounds, xml3dMath.boundsSphere(bounds), "bounds_%s" % self.getName(obj))
 
-            # Insert into document
-            group.appendChild(self.createIntTextElement("index", ' '.join(indexList)))
-            group.appendChild(self.createFloat3TextElement("position", ' '.join(vertexList)))
+    def createExternalContainer(self):
+        """
+        Create a stand-alone XML3D document for the data of a single mesh
+        @return: The xml3d root element of the new document
+        """
+        externalDoc = XML3DDocument()
+        root = externalDoc.createXml3dElement()
+        root.setAttribute("xmlns", "http://www.xml3d.org/2009/xml3d")
+        externalDoc.appendChild(root)
+        return root
+
+    def writeExternalData(self, parent, container, obj):
+        """
+        Write the data elements collected in an external container to
+        OUTPUTBASE_data/NAME.xml and reference it from a placeholder data
+        element in parent. The resource is recorded for the manifest together
+        with its world space bounding sphere.
+        @param parent: Parent object in graph
+        @param container: Root element returned by createExternalContainer()
+        @param obj: Mesh
+        """
+        name = self.getName(obj)
+        dataDirectory = self.outputBase + "_data"
+        if not os.path.isdir(dataDirectory):
+            os.makedirs(dataDirectory)
+        path = self.writeOutputDocument(container.ownerDocument, os.path.join(dataDirectory, name + ".xml"), "", " ", "\n")
+        container.ownerDocument.unlink()
+        if path == None:
+            raise IOError("Unable to write the data of %s" % name)
+
+        src = "%s/%s#data_%s" % (os.path.basename(dataDirectory), os.path.basename(path), name)
+        parent.appendChild(self.doc.createDataElement("data_" + name, None, None, src))
+        self.addExternalResource(obj, src, os.path.getsize(path))
+
+    def addExternalResource(self, obj, src, size):
+        """
+        Record the file with the data of a mesh for the manifest together
+        with the world space bounding sphere of the mesh
+        @param src: Reference to the file
+        @param size: Size of the file in bytes
+        """
+        mg = obj.GetMg()
+        center = mg * obj.GetMp()
+        rad = obj.GetRad()
+        radius = Vector(rad.x * mg.v1.GetLength(), rad.y * mg.v2.GetLength(), rad.z * mg.v3.GetLength()).GetLength()
+        self.externalResources.append({
+            "id"     : "data_" + self.getName(obj),
+            "src"    : src,
+            "bytes"  : size,
+            "center" : [center.z, center.y, center.x],
+            "radius" : radius })
+
+    def writeCompressedData(self, obj, triangles, vertexList, normalList, texcoordList):
+        """
+        Encode the arrays of a mesh into OUTPUTBASE_data/NAME.x3dc and log
+        the compressed size and the encoding throughput. The page has to
+        provide a decoder for the data element's source, see xml3dCodec.
+        @param obj: Mesh
+        @return: Data element referencing the file
+        """
+        name = self.getName(obj)
+        dataDirectory = self.outputBase + "_data"
+        if not os.path.isdir(dataDirectory):
+            os.makedirs(dataDirectory)
+        start = c4d.GeGetMilliSeconds()
+        payload = xml3dCodec.encodeMesh(triangles, vertexList, normalList, texcoordList, self.positionBits, self.normalBits)
+        elapsed = max(c4d.GeGetMilliSeconds() - start, 1)
+        raw = xml3dCodec.rawSize(triangles, vertexList, normalList, texcoordList)
+        print("Compressed %s: %d bytes of 32 bit arrays to %d bytes (%.1f%%), %.1f MB/s" % (name, raw, len(payload), 100.0 * len(payload) / raw, raw / (1048.576 * elapsed)))
+
+        path = os.path.join(dataDirectory, name + ".x3dc")
+        out = open(path, 'wb')
+        out.write(payload)
+        out.close()
+        if self.hashedNames:
+            path = self.hashOutputFile(path)
+        src = "%s/%s" % (os.path.basename(dataDirectory), os.path.basename(path))
+        if self.externalGeometry:
+            self.addExternalResource(obj, src, len(payload))
+        return self.doc.createDataElement(None, None, None, src)
+
+    def addSpatialEntry(self, id, obj, mg):
+        """
+        Record the world space bounding box of a mesh for the spatial index
+        @param id: Id of the group showing the mesh
+        @param obj: Polygon object
+        @param mg: World matrix the mesh is shown with
+        """
+        if not self.spatialIndex:
+            return
+        center = obj.GetMp()
+        rad = obj.GetRad()
+        low = [float("inf")] * 3
+        high = [float("-inf")] * 3
+        for sx in (-1.0, 1.0):
+            for sy in (-1.0, 1.0):
+                for sz in (-1.0, 1.0):
+                    p = mg * Vector(center.x + sx * rad.x, center.y + sy * rad.y, center.z + sz * rad.z)
+                    for c, v in enumerate((p.z, p.y, p.x)):
+                        low[c] = min(low[c], v)
+                        high[c] = max(high[c], v)
+        self.spatialIds.append(id)
+        self.spatialBoxes.extend(low + high)
+
+    def mergeSpatialEntries(self, id, start):
+        """
+        Replace the boxes recorded since entry start by their union
+        @param id: Id of the group containing the meshes of the boxes
+        @param start: Number of entries before the meshes were written
+        """
+        if len(self.spatialIds) <= start:
+            return
+        boxes = self.spatialBoxes[6 * start:]
+        low = [min(boxes[c::6]) for c in range(3)]
+        high = [max(boxes[c + 3::6]) for c in range(3)]
+        del self.spatialIds[start:]
+        del self.spatialBoxes[6 * start:]
+        self.spatialIds.append(id)
+        self.spatialBoxes.extend(low + high)
+
+    def getPlacedMatrix(self, obj, placement):
+        """
+        @param placement: See writeSceneGraph()
+        @return: World matrix obj is shown with
+        """
+        if placement == None:
+            return obj.GetMg()
+        return placement * obj.GetMg()
+
+    def writeSpatialIndex(self, filename):
+        """
+        Build the bounding volume hierarchy over the recorded meshes and write
+        it, see xml3dBvh
+        """
+        start = c4d.GeGetMilliSeconds()
+        count = xml3dBvh.writeIndex(filename, self.spatialIds, self.spatialBoxes)
+        print("Spatial index of %d meshes with %d nodes: %gms" % (len(self.spatialIds), count, c4d.GeGetMilliSeconds() - start))
+        self.spatialIds = []
+        self.spatialBoxes = []
+        if self.hashedNames:
+            self.hashOutputFile(filename)
+
+    def writeManifest(self, filename, sceneFilename):
+        """
+        Write the manifest of all external resources of one exported file.
+        The resources are ordered by their estimated visual importance, i.e.
+        the size of their bounding sphere seen from the default camera, so
+        that a viewer can fetch the most prominent meshes first.
+        @param filename: Name of the manifest file
+        @param sceneFilename: Name of the scene file the resources belong to
+        """
+        camera = self.defaultCameraPosition
+        for resource in self.externalResources:
+            if camera != None:
+                center = resource["center"]
+                distance = math.sqrt((center[0] - camera[0]) ** 2 + (center[1] - camera[1]) ** 2 + (center[2] - camera[2]) ** 2)
+            else:
+                distance = 1.0
+            resource["distance"] = distance
+            resource["importance"] = resource["radius"] / max(distance, 0.000001)
+        self.externalResources.sort(key=lambda resource: resource["importance"], reverse=True)
+
+        manifest = {
+            "scene"     : os.path.basename(sceneFilename),
+            "camera"    : camera,
+            "resources" : self.externalResources }
+        out = open(filename, 'w')
+        json.dump(manifest, out, indent=1)
+        out.close()
+        self.externalResources = []
+        if self.hashedNames:
+            self.hashOutputFile(filename)
+
+    def writeOutputDocument(self, doc, filename, indent = " ", addindent = " ", newl = "\n", background = False):
+        """
+        Write a document to a file of the export. With hashedNames the file
+        is renamed to its content hash name afterwards.
+        @param doc: Document to be written
+        @param filename: Logical name of the file
+        @param indent, addindent, newl: Formatting, see Document.writexml()
+        @param background: Optional. In a batch export, leave the writing to
+        the writer threads if the name of the file doesn't depend on its
+        content. The document must not be changed afterwards.
+        @return: Name of the written file or None if it can't be opened
+        """
+        if background and self.writer != None and not self.hashedNames and not self.boundedMemory:
+            self.writer.submit(doc, filename, indent, addindent, newl)
+            return filename
+        path = filename
+        if self.hashedNames:
+            path = filename + ".tmp"
+        try:
+            out = open(path, 'w')
+        except:
+            c4d.StatusSetText("Unable to open file")
+            print("Unable to open file %s" % path)
+            return None
+        doc.writexml(out, indent, addindent, newl)
+        out.close()
+        if self.hashedNames:
+            return self.hashOutputFile(path, filename)
+        return filename
+
+    def getOutputName(self, path):
+        """
+        @return: Path relative to the output directory, as used in URLs
+        """
+        return os.path.relpath(os.path.abspath(path), self.outputDirectory).replace(os.sep, "/")
 
-            if normals != None and len(normals) > 0:
-                group.appendChild(self.createFloat3TextElement("normal", ''.join(normalList)))
-                if uvwTag != None:
-                   group.appendChild(self.createFloat2TextElement("texcoord", ' '.join(texcoordList)))
+    def hashOutputFile(self, path, filename = None):
+        """
+        Rename a written file to NAME.HASH.EXT and record it for the file
+        manifest
+        @param path: Written file
+        @param filename: Optional. Logical name of the file if it is not path
+        @return: New name of the file
+        """
+        if filename == None:
+            filename = path
+        root, extension = os.path.splitext(filename)
+        hashedFilename = "%s.%s%s" % (root, xml3dTextures.hashFile(path)[:20], extension)
+        xml3dPatch.replaceFile(path, hashedFilename)
+        self.outputFiles[self.getOutputName(filename)] = self.getOutputName(hashedFilename)
+        return hashedFilename
+
+    def writeFileManifest(self, filename):
+        """
+        Write the mapping of logical file names to the content hash names of
+        all files of the export, including the processed textures. It is the
+        only file whose name doesn't change.
+        @param filename: Name of the manifest file
+        """
+        if self.texturePipeline != None:
+            for source in self.texturePipeline.urls:
+                name = "tex/" + os.path.basename(source)
+                if name not in self.outputFiles:
+                    self.outputFiles[name] = self.texturePipeline.urls[source]
+        out = open(filename, 'w')
+        json.dump({ "files" : self.outputFiles }, out, indent=1, sort_keys=True)
+        out.close()
+
+    def writeLevelsOfDetail(self, parent, obj, positions, triangles, vertexList, normalList, texcoordList):
+        """
+        Write simplified versions of a mesh as sibling data elements named
+        data_NAME_lod1, data_NAME_lod2, ... Every level has half the triangles
+        of the previous one and is simplified from it. The vertex attributes
+        are taken over from the full resolution mesh.
+        @param parent: Parent object in graph
+        @param obj: Mesh
+        @param positions: List of vertex positions in XML3D coordinates
+        @param triangles: Flat list of triangle indices
+        @param vertexList: Array of positions, three entries per vertex
+        @param normalList: Array of normals, three entries per vertex, or None
+        @param texcoordList: Array of texture coordinates, two entries per
+        vertex, or None
+        """
+        start_time = c4d.GeGetMilliSeconds()
+        numTriangles = len(triangles) // 3
+        for level in range(1, self.lodLevels + 1):
+            triangles = xml3dSimplify.simplifyMesh(positions, triangles, numTriangles >> level)
+            lodIndices, used = xml3dSimplify.compactMesh(triangles)
+
+            data = self.doc.createDataElement("data_%s_lod%d" % (self.getName(obj), level))
+            parent.appendChild(data)
+            data.appendChild(self.createIntTextElement("index", array.array('i', lodIndices)))
+            data.appendChild(self.createFloat3TextElement("position", self.gatherVertices(vertexList, used, 3)))
+            if normalList != None:
+                data.appendChild(self.createFloat3TextElement("normal", self.gatherVertices(normalList, used, 3)))
+            if texcoordList != None:
+                data.appendChild(self.createFloat2TextElement("texcoord", self.gatherVertices(texcoordList, used, 2)))
+        elapsed = c4d.GeGetMilliSeconds() - start_time
+        print("LOD %s: %d triangles, %d levels, %gms" % (self.getName(obj), numTriangles, self.lodLevels, elapsed))
     #
     ################################################################################################
 
@@ -815,6 +2255,7 @@ class XML3DExporter:
         active (self.cameraIdx == 0).
         @param parent: Parent object in graph
         @param obj: Camera object
+        @return: Reference to created XML3D group element
         """
         posStr = "0.0 0.0 0.0"
         oriStr = "0.0 -1.0 0.0 1.570796"
@@ -822,14 +2263,17 @@ class XML3DExporter:
         if self.cameraIdx == 0:
             cameraName = "defaultView"
             cameraActive = "true"
+            pos = obj.GetMg().off
+            self.defaultCameraPosition = [pos.z, pos.y, pos.x]
         else:
             cameraName = self.getName(obj)
             cameraActive = "false"
         self.cameraIdx += 1
         view = self.doc.createViewElement(cameraName, cameraActive, posStr, oriStr, "%g" % fov)
-        group = self.doc.createGroupElement("group_"+self.getName(obj), "true", "#t_%s" % self.getName(obj))
+        group = self.doc.createGroupElement("group_"+self.getName(obj), "true", self.getTransformReference(obj))
         group.appendChild(view)
         parent.appendChild(group)
+        return group
     #
     ################################################################################################
 
@@ -851,14 +2295,37 @@ class XML3DExporter:
 
         # Create group
         if writeTransform:
-            group = self.doc.createGroupElement("group_"+self.getName(obj), "true", "#t_%s" % self.getName(obj), "#shader_%s" % materialName)
+            group = self.doc.createGroupElement("group_"+self.getName(obj), "true", self.getTransformReference(obj), self.getShaderReference(materialName))
         else:
-            group = self.doc.createGroupElement("group_"+self.getName(obj), "true", None, "#shader_%s" % materialName)
+            group = self.doc.createGroupElement("group_"+self.getName(obj), "true", None, self.getShaderReference(materialName))
         mesh = self.doc.createMeshElement("mesh_%s" % self.getName(obj), "true", "triangles", "#data_"+self.getName(obj))
         group.appendChild(mesh)
         parent.appendChild(group)
         return group
 
+    def writePickProxy(self, group, obj):
+        """
+        Write the picking proxy of a mesh with mouse events into its group,
+        see xml3dHull. The event handlers stay on the group, the events of
+        the proxy bubble up to it. The mesh itself is not pickable anymore.
+        @param group: Group of the mesh, see writeMeshNew()
+        @param obj: Mesh object
+        """
+        points = array.array("d")
+        for point in obj.GetAllPoints():
+            self.setVector3(points, None, point)
+        positions, indices = xml3dHull.pickProxy(points, self.proxyMaxTriangles)
+        if len(indices) == 0:
+            return
+
+        group.firstChild.setAttribute("style", "pointer-events: none;")
+        proxyGroup = self.doc.createGroupElement("group_%s_pick" % self.getName(obj), "true", None, "#shader_pickProxy")
+        proxy = self.doc.createMeshElement("mesh_%s_pick" % self.getName(obj), "true", "triangles")
+        proxy.appendChild(self.createIntTextElement("index", array.array("i", indices)))
+        proxy.appendChild(self.createFloat3TextElement("position", array.array("d", positions)))
+        proxyGroup.appendChild(proxy)
+        group.appendChild(proxyGroup)
+
     def findTag(self, obj, type):
         """
         Iterate over all tags of an object and find a specific type.
@@ -902,7 +2369,7 @@ class XML3DExporter:
         @param parent: Parent object in graph
         @param obj: Light object
         """
-        group = self.doc.createGroupElement("group_%s" % self.getName(obj), "true", "#t_%s" % self.getName(obj), None)
+        group = self.doc.createGroupElement("group_%s" % self.getName(obj), "true", self.getTransformReference(obj), None)
         parent.appendChild(group)
 
         light = self.doc.createLightElement("light_%s" % self.getName(obj), "true", "#ls_%s" % self.getName(obj))
@@ -963,21 +2430,208 @@ class XML3DExporter:
             tag = tag.GetNext()
 
 
-    def writeParentGroups(self, parent, obj):
+    ################################################################################################
+    # INSTANCES
+
+    def resolveInstanceLink(self, obj):
         """
-        todo Add some comment here!
+        Follow the link chain of an instance object to the first object that is
+        not an instance. The result is cached for every instance on the chain,
+        so each chain is only walked and searched in the polygonized scene once.
+        @param obj: Instance object
+        @return: (linked object, polygonized object), both may be None
         """
-        if obj != None :
-            parentObj = obj.GetUp()
-            if parentObj != None :
-                parent = self.writeParentGroups(parent, parentObj)
-            group = self.doc.createGroupElement("group_"+self.getName(obj), "true", "#t_%s" % self.getName(obj), "#shader_%s" % self.getMaterialName(obj))
+        chain = []
+        linked = obj
+        while linked != None and linked.GetType() == c4d.Oinstance:
+            if linked.GetName() in self.instanceLinks:
+                break
+            chain.append(linked)
+            linked = linked[c4d.INSTANCEOBJECT_LINK]
+
+        if linked != None and linked.GetName() in self.instanceLinks:
+            result = self.instanceLinks[linked.GetName()]
+        elif linked != None:
+            result = (linked, self.polygonizedScene.SearchObject(linked.GetName()))
+        else:
+            result = (None, None)
+        for instance in chain:
+            self.instanceLinks[instance.GetName()] = result
+        return result
+
+    def batchInstance(self, rawObj):
+        """
+        Record the world transformation of an instance whose source is a single
+        polygon object. Instances with children or event tags are written as
+        groups as before.
+        @param rawObj: Instance object
+        @return: True if the instance was added to a batch
+        """
+        if rawObj.GetDown() != None or self.findTagByName(rawObj, "XML3DMouseEventTag") != None:
+            return False
+        linkedObj, polyObj = self.resolveInstanceLink(rawObj)
+        if linkedObj == None or linkedObj.GetDown() != None or polyObj == None or polyObj.GetType() != c4d.Opolygon:
+            return False
+
+        name = self.getName(polyObj)
+        if name not in self.instanceBatches:
+            self.instanceBatches[name] = (self.getMaterialName(polyObj), [])
+            self.instanceBatchOrder.append(name)
+        self.instanceBatches[name][1].append(self.matrixToTuple(rawObj.GetMg()))
+        return True
+
+    def writeInstanceBatches(self, parent):
+        """
+        Write one group per instanced mesh. The mesh references the shared
+        mesh data and adds the world transformations of all instances as
+        float4x4 array 'instanceTransforms'.
+        @param parent: Parent object in graph
+        """
+        for name in self.instanceBatchOrder:
+            materialName, matrices = self.instanceBatches[name]
+            group = self.doc.createGroupElement("instances_%s" % name, "true", None, self.getShaderReference(materialName))
+            mesh = self.doc.createMeshElement("mesh_instances_%s" % name, "true", "triangles")
+            mesh.appendChild(self.doc.createDataElement(None, None, None, "#data_%s" % name))
+            values = array.array('d')
+            for m in xml3dMath.convertMatrices(matrices):
+                values.extend(m)
+            mesh.appendChild(self.createFloat4x4TextElement("instanceTransforms", values))
+            group.appendChild(mesh)
+            parent.appendChild(group)
+            print("Batched %d instances of %s" % (len(matrices), name))
+        self.instanceBatches = {}
+        self.instanceBatchOrder = []
+
+    #
+    ################################################################################################
+
+    def writeParentGroups(self, parent, obj, groups = None):
+        """
+        Write a group for obj and for each of its ancestors, nested like the
+        hierarchy.
+        @param parent: Parent object in graph for the topmost ancestor
+        @param obj: Last object of the ancestor chain
+        @param groups: Optional dictionary mapping object names to already
+        written groups. Those groups are reused instead of written again,
+        new groups are added.
+        @return: Group of obj, to which the children of obj can be appended
+        """
+        chain = []
+        while obj != None:
+            if groups != None and obj.GetName() in groups:
+                parent = groups[obj.GetName()]
+                break
+            chain.append(obj)
+            obj = obj.GetUp()
+        chain.reverse()
+        for obj in chain:
+            group = self.doc.createGroupElement("group_"+self.getName(obj), "true", self.getTransformReference(obj), self.getShaderReference(self.getMaterialName(obj)))
             parent.appendChild(group)
             parent = group
+            if groups != None:
+                groups[obj.GetName()] = group
         return parent
 
+    def patchExport(self, filename, selectedObjects):
+        """
+        Replace the transforms, data, light shader and group elements of the
+        selected objects and their descendants and the shaders of their
+        materials in an existing export by the ones of the current document.
+        Objects are identified by their unique names, so the hierarchy must
+        not have been restructured since the file was exported. The watch
+        mode writes the elements to fragment files instead, see
+        writeWatchFragments().
+        @param filename: Existing export, written by a complete export
+        @param selectedObjects: Topmost selected objects
+        """
+        names = set()
+        for selectedObject in selectedObjects:
+            for obj in xml3dTraversal.walk(selectedObject, False):
+                names.add(self.getName(obj))
+
+        # only the outermost elements are replaced, they contain the others
+        replacements = {}
+        stack = [self.doc.documentElement]
+        while len(stack) > 0:
+            node = stack.pop()
+            if node.nodeType != node.ELEMENT_NODE:
+                continue
+            id = node.getAttribute("id")
+            prefix, separator, name = id.partition("_")
+            if prefix == "data":
+                name = re.sub("_lod[0-9]+$", "", name)
+            # groups of null objects and instances are named like the object
+            if id in names or prefix == "shader" or ((prefix == "t" or prefix == "data" or prefix == "ls" or prefix == "group") and name in names):
+                replacements[id] = node
+            else:
+                stack.extend(node.childNodes)
 
-    def writeSceneGraph(self, parent, rawObj, instanceObject, continueSameLevel = True):
+        start = c4d.GeGetMilliSeconds()
+        if self.patchIndices != None and self.watchIds != None:
+            missing = self.writeWatchFragments(replacements)
+        else:
+            missing = xml3dPatch.patchFile(filename, replacements)
+        self.patchedIds = [id for id in replacements if id not in missing]
+        self.patchMissing = missing
+        print("Patched %d elements in %gms" % (len(replacements) - len(missing), c4d.GeGetMilliSeconds() - start))
+        if len(missing) > 0:
+            print("Not found in %s, a complete export is needed for them: %s" % (filename, ", ".join(sorted(missing))))
+
+    def findSelectionRoots(self, selectedObjects):
+        """
+        Remove objects from a selection which are descendants of other
+        selected objects. They are exported as part of their ancestors anyway.
+        @param selectedObjects: List of objects
+        @return: List of topmost selected objects, in selection order
+        """
+        selectedNames = set()
+        for obj in selectedObjects:
+            if obj != None:
+                selectedNames.add(obj.GetName())
+        roots = []
+        for obj in selectedObjects:
+            if obj == None:
+                continue
+            parentObj = obj.GetUp()
+            while parentObj != None and parentObj.GetName() not in selectedNames:
+                parentObj = parentObj.GetUp()
+            if parentObj == None:
+                roots.append(obj)
+        return roots
+
+    def polygonizeObjects(self, names):
+        """
+        Polygonize clones of some objects of the raw scene only, for patching
+        a few changed objects of a large document into its export.
+        The objects are taken with their descendants and the objects their
+        instances link to, everything else of the scene is left out. The
+        clones keep their global placement, but generators depending on
+        objects left out see the document without them.
+        @param names: Names of the objects in the raw scene
+        @return: Polygonized document
+        """
+        objects = [obj for obj in xml3dTraversal.walk(self.rawScene.GetFirstObject()) if obj.GetName() in names]
+        taken = set(names)
+        pending = list(objects)
+        while len(pending) > 0:
+            for obj in xml3dTraversal.walk(pending.pop(), False):
+                linked = obj
+                while linked != None and linked.GetType() == c4d.Oinstance:
+                    linked = linked[c4d.INSTANCEOBJECT_LINK]
+                if linked != None and not linked.GetName() in taken:
+                    taken.add(linked.GetName())
+                    objects.append(linked)
+                    pending.append(linked)
+
+        partial = c4d.documents.BaseDocument()
+        for obj in reversed(self.findSelectionRoots(objects)):
+            clone = obj.GetClone()
+            partial.InsertObject(clone)
+            clone.SetMg(obj.GetMg())
+        return partial.Polygonize()
+
+
+    def writeSceneGraph(self, parent, rawObj, instanceObject, continueSameLevel = True, placement = None):
         """
         Main exporting loop. Traversing scene graph and invoking correct methods
         to export several objects. Special care needs to be taken for exporting
@@ -987,18 +2641,32 @@ class XML3DExporter:
         @param instanceObject: Are we facing a instanced object?
         @param continueSameLevel: Continue at same level in hierarchy or one
         level deeper
-        """
-        while rawObj != None:
+        @param placement: Matrix moving the objects from their place in the
+        document to the one they are shown at by an instance of a null
+        object, None outside of such instances
+        """
+        # the loop of xml3dTraversal.walk(), each pushed sibling keeps the
+        # parent element of its level
+        stack = []
+        first = rawObj
+        while rawObj is not None:
             # Update progress bar
             self.statusPercent = self.statusPercent + self.timeStep
             c4d.StatusSetBar(int(self.statusPercent * 100.0 + 0.5))
 
             # Export null object explicitely
             next = parent
-            if rawObj.GetType() == c4d.Onull:
+            # hidden objects kept for visible descendants are plain groups
+            if rawObj.GetName() in self.hiddenNames and not instanceObject:
                 next = self.writeNull(next, rawObj)
-                self.handleSpecialTags(next, rawObj)
+            elif rawObj.GetType() == c4d.Onull:
+                # folded null objects don't get a group of their own
+                if rawObj.GetName() not in self.removedGroups:
+                    next = self.writeNull(next, rawObj)
+                    self.handleSpecialTags(next, rawObj)
             # Export instance type
+            elif rawObj.GetType() == c4d.Oinstance and self.batchInstances and not instanceObject and self.batchInstance(rawObj):
+                pass
             elif rawObj.GetType() == c4d.Oinstance:
                 next = self.writeNull(next, rawObj)
                 self.handleSpecialTags(next, rawObj)
@@ -1007,6 +2675,7 @@ class XML3DExporter:
                 # Export polygon without transformation of polygon
                 if polyObj != None and polyObj.GetType() == c4d.Opolygon:
                     self.writeSceneGraph(next, linkedObj, True, False)
+                    self.addSpatialEntry(self.getName(rawObj), polyObj, self.getPlacedMatrix(rawObj, placement))
                 # Export first non-instance object without the transformations
                 # of instance types (already stored in this instance object)
                 elif linkedObj.GetType() == c4d.Oinstance:
@@ -1020,18 +2689,23 @@ class XML3DExporter:
                         # Handle polygon type
                         if polyObj != None and polyObj.GetType() == c4d.Opolygon:
                             self.writeSceneGraph(next, linkedObj, True, False)
+                            self.addSpatialEntry(self.getName(rawObj), polyObj, self.getPlacedMatrix(rawObj, placement))
                         # Handle null object
                         else:
                             linkedObj = linkedObj.GetDown()
                             while linkedObj != None:
                                 self.writeSceneGraph(next, linkedObj, True, False)
                                 linkedObj = linkedObj.GetNext()
-                # Export children of linked null object
+                # Export children of linked null object, the instance gets one
+                # box for all of their meshes
                 else:
+                    start = len(self.spatialIds)
+                    childPlacement = self.getPlacedMatrix(rawObj, placement) * ~linkedObj.GetMg()
                     linkedObj = linkedObj.GetDown()
                     while linkedObj != None:
-                        self.writeSceneGraph(next, linkedObj, False, False)
+                        self.writeSceneGraph(next, linkedObj, False, False, childPlacement)
                         linkedObj = linkedObj.GetNext()
+                    self.mergeSpatialEntries(self.getName(rawObj), start)
             # Export other types
             else:
                 obj = self.polygonizedScene.SearchObject(rawObj.GetName())
@@ -1039,6 +2713,11 @@ class XML3DExporter:
                     if obj.GetType() == c4d.Opolygon:
                         next = self.writeMeshNew(parent, obj, not instanceObject)
                         self.handleSpecialTags(next, rawObj)
+                        if self.pickProxies and self.findTagByName(rawObj, 'XML3DMouseEventTag') != None:
+                            self.writePickProxy(next, obj)
+                        # instances record the box of their own group
+                        if not instanceObject:
+                            self.addSpatialEntry("group_" + self.getName(obj), obj, self.getPlacedMatrix(obj, placement))
                     elif obj.GetType() == c4d.Olight:
                         next = self.writeLight(parent, obj)
                         self.handleSpecialTags(next, rawObj)
@@ -1047,14 +2726,49 @@ class XML3DExporter:
                         self.handleSpecialTags(next, rawObj)
                 else:
                     print ("Not found in polygonized scene: %s (Type: %s)" % (rawObj.GetName(), self.getTypeAsString(rawObj)))
-                    break
-
-            self.writeSceneGraph(next, rawObj.GetDown(), instanceObject)
-            if continueSameLevel:
-                rawObj = rawObj.GetNext()
+                    # neither the children nor the following siblings
+                    next = None
+
+            # groups shown by an instance depend on its position, and their
+            # ids are the ones of the original groups
+            if next != None and self.writeBounds and next != parent and not instanceObject and placement == None:
+                self.writeGroupBounds(next, rawObj)
+
+            sibling = None
+            child = None
+            if next != None:
+                if continueSameLevel or rawObj is not first:
+                    sibling = rawObj.GetNext()
+                child = rawObj.GetDown()
+            if child is not None:
+                if sibling is not None:
+                    stack.append((sibling, parent))
+                rawObj = child
+                parent = next
+            elif sibling is not None:
+                rawObj = sibling
+            elif stack:
+                rawObj, parent = stack.pop()
             else:
                 rawObj = None
 
+    def writeGroups(self, parent, selectedObjects, strategy, sameLevel, parentGroups):
+        """
+        Write the scene graph of the selected objects
+        @param parent: xml3d element
+        @param parentGroups: Groups of the ancestors written so far, see
+        writeParentGroups()
+        """
+        c4d.StatusSetText("Exporting scene graph...")
+        c4d.StatusSetBar(0)
+        for selectedObject in selectedObjects:
+            groupParent = parent
+            if strategy == self.XML3D_EXPORT_STRATEGY_TAGGED  or  strategy == self.XML3D_EXPORT_STRATEGY_SELECTED  or  strategy == self.XML3D_EXPORT_STRATEGY_TAGGED_S  or  strategy == self.XML3D_EXPORT_STRATEGY_PATCH:
+                if selectedObject != None :
+                    groupParent = self.writeParentGroups(parent, selectedObject.GetUp(), parentGroups)
+            self.writeSceneGraph(groupParent, selectedObject, False, sameLevel)
+        self.writeInstanceBatches(parent)
+
     def write(self, scene, width, height, embed, strategy):
         """
         Main function for exporting a scene
@@ -1067,8 +2781,24 @@ class XML3DExporter:
         thrown within the main exporting loop
         """
         start_time = c4d.GeGetMilliSeconds()
+        # a batch export brings its own writer
+        ownWriter = self.backgroundWriting and self.writer == None
+        if ownWriter:
+            self.writer = xml3dBatch.BackgroundWriter(1, self.writerQueueSize)
+        if self.traceMemory:
+            self.memoryLog = xml3dMemory.PhaseLog()
+            self.memoryLog.start()
         try:
             self.cameraIdx = 0
+            self.defaultCameraPosition = None
+            self.externalResources = []
+            self.meshBounds = {}
+            self.subtreeBounds = {}
+            self.documentPath = scene.GetDocumentPath()
+            self.atlasMaterials = {}
+            self.atlasUrls = {}
+            self.instanceLinks = {}
+            self.outputFiles = {}
             self.ambientWorld = Vector(0,0,0)
             c4d.StatusSetText("Find world ambient constant")
             self.findWorldAmbient(scene.GetFirstObject())
@@ -1078,22 +2808,53 @@ class XML3DExporter:
             # usage = 2   material was written to defs section
             self.usedMaterials = {}
 
-            # dictionary with original names of the objects
-            self.originalNames = {}
-
-            c4d.StatusSetText("Cloning scene")
-            # clone the scene to not disturb the original scene
-            self.rawScene = scene.GetClone()
-            # create some unique names and remove unnecessary spaces
-            self.numObjects   = self.createUniqueAndValidNames(self.rawScene.GetFirstObject(), "object", 0)
-            self.numMaterials = self.createUniqueAndValidNames(self.rawScene.GetFirstMaterial(), "material", 0)
-#            self.mangleObjectNames(self.rawScene.GetFirstObject())
-#            self.mangleObjectNames(self.rawScene.GetFirstMaterial())
+            patchNames = None
+            if self.patchIndices != None and self.watchRawScene != None:
+                c4d.StatusSetText("Cloning changed objects")
+                # the watch mode replaces the changed objects in the clone of
+                # its last complete export instead of cloning everything
+                self.rawScene = self.watchRawScene
+                patchNames = self.updateWatchScene(scene, self.patchIndices)
+                if patchNames == None:
+                    print("The changed objects don't match the last complete export")
+                    return False
+                self.logPhase("clone")
+            else:
+                # dictionary with original names of the objects
+                self.originalNames = {}
+
+                c4d.StatusSetText("Cloning scene")
+                # clone the scene to not disturb the original scene
+                self.rawScene = scene.GetClone()
+                self.logPhase("clone")
+                # create some unique names and remove unnecessary spaces
+                self.numObjects   = self.createUniqueAndValidNames(self.rawScene.GetFirstObject(), "object", 0)
+                self.numMaterials = self.createUniqueAndValidNames(self.rawScene.GetFirstMaterial(), "material", 0)
+#                self.mangleObjectNames(self.rawScene.GetFirstObject())
+#                self.mangleObjectNames(self.rawScene.GetFirstMaterial())
+
+                # the traversal indices of the watch mode refer to the complete scene
+                if self.patchIndices != None:
+                    patchNames = set([obj.GetName() for index, obj in enumerate(xml3dTraversal.walk(self.rawScene.GetFirstObject())) if index in self.patchIndices])
+                elif strategy == self.XML3D_EXPORT_STRATEGY_PATCH:
+                    patchNames = set([obj.GetName() for obj in self.rawScene.GetActiveObjects(0)])
+
+            self.hiddenNames = set()
+            self.linkedNames = set()
+            if self.skipHidden:
+                c4d.StatusSetText("Removing hidden objects")
+                self.pruneHiddenObjects(self.rawScene)
+                print("Skipped %d hidden objects with %d polygons" % (self.skippedObjects, self.skippedPolygons))
+                self.logPhase("hidden objects")
 
             # derive a polygonized scene now, after raw scene has been prepared
-            self.polygonizedScene = self.rawScene.Polygonize()
+            if patchNames != None:
+                self.polygonizedScene = self.polygonizeObjects(patchNames)
+            else:
+                self.polygonizedScene = self.rawScene.Polygonize()
             # create unique names again, since polygonization creates new names (with spaces)
             self.mangleObjectNames(self.polygonizedScene.GetFirstObject())
+            self.logPhase("polygonize")
 
             # get all active objects or the complete scene
             selectedObjects = []
@@ -1106,10 +2867,13 @@ class XML3DExporter:
                     print("No tagged objects found. Exporting nothing!")
                     return False
                 sameLevel = False
-            # export only selected objects
-            elif strategy == self.XML3D_EXPORT_STRATEGY_SELECTED:
+            # export only selected objects, or replace them in an existing export
+            elif strategy == self.XML3D_EXPORT_STRATEGY_SELECTED  or  strategy == self.XML3D_EXPORT_STRATEGY_PATCH:
                 taggedObjects.append(self.rawScene.GetFirstObject())
-                selectedObjects = self.rawScene.GetActiveObjects(0)
+                if self.patchIndices != None:
+                    selectedObjects = [obj for obj in xml3dTraversal.walk(self.rawScene.GetFirstObject()) if obj.GetName() in patchNames]
+                else:
+                    selectedObjects = self.rawScene.GetActiveObjects(0)
                 if selectedObjects == []:
                     print("No selected objects found. Exporting nothing!")
                     return False
@@ -1123,12 +2887,42 @@ class XML3DExporter:
                     return False
                 sameLevel = True
 
+            # find redundant transforms and groups, the exported roots are kept
+            # patched elements have to match the ones of a complete export
+            c4d.StatusSetText("Flattening hierarchy")
+            if sameLevel  or  strategy == self.XML3D_EXPORT_STRATEGY_PATCH:
+                self.prepareFlattening([])
+            elif strategy == self.XML3D_EXPORT_STRATEGY_SELECTED:
+                self.prepareFlattening(selectedObjects)
+            else:
+                self.prepareFlattening(taggedObjects)
+
             # create a good filename that ends with .xhtml
             basefilename = self.createProperFilename(self.filename)
             filename = basefilename
+            if strategy == self.XML3D_EXPORT_STRATEGY_PATCH  and  not os.path.isfile(basefilename):
+                print("No existing export %s to patch. Exporting nothing!" % basefilename)
+                return False
+            self.outputDirectory = os.path.dirname(os.path.abspath(basefilename))
+
+            # the texture stage is needed for content hash names of the textures
+            if self.processTextures  or  self.hashedNames:
+                textureDirectory = os.path.join(self.outputDirectory, "tex")
+                maxSize = 0
+                if self.processTextures:
+                    maxSize = self.textureMaxSize
+                if self.caches != None:
+                    self.texturePipeline = self.caches.getTexturePipeline(textureDirectory, "tex/", maxSize, self.resizeTexture)
+                else:
+                    self.texturePipeline = xml3dTextures.TexturePipeline(textureDirectory, "tex/", maxSize, self.resizeTexture)
+            else:
+                self.texturePipeline = None
 
-
-
+            if self.atlasTextures:
+                c4d.StatusSetText("Packing texture atlases")
+                atlasDirectory = os.path.join(os.path.dirname(os.path.abspath(basefilename)), "tex")
+                self.prepareAtlases(atlasDirectory, os.path.basename(re.sub(".xhtml$", "", basefilename)))
+            self.logPhase("preparation")
 
             c4d.StatusSetText("Starting export")
             for taggedObject in taggedObjects:
@@ -1143,16 +2937,15 @@ class XML3DExporter:
                     filename = "%s_%s.xhtml" % (re.sub(".xhtml", "", basefilename), self.originalNames[taggedObject.GetName()])
                 if strategy == self.XML3D_EXPORT_STRATEGY_TAGGED_S:
                     filename = "%s_%s_defs.inc" % (re.sub(".xhtml", "", basefilename), self.originalNames[taggedObject.GetName()])
-                # split files name
-                # open the file
-                try:
-                    out = open(filename, 'w')
-                except:
-                    c4d.StatusSetText("Unable to open file")
-                    print("Unable to open file %s" % filename)
-                    return False
+                # base name for files belonging to this export, e.g. external data
+                if strategy == self.XML3D_EXPORT_STRATEGY_TAGGED  or  strategy == self.XML3D_EXPORT_STRATEGY_TAGGED_S:
+                    self.outputBase = "%s_%s" % (re.sub(".xhtml", "", basefilename), self.originalNames[taggedObject.GetName()])
+                else:
+                    self.outputBase = re.sub(".xhtml$", "", basefilename)
 
                 self.doc = XML3DDocument()
+                self.spatialIds = []
+                self.spatialBoxes = []
 
 
                 # only create a defs section for TAGGED_S export
@@ -1180,49 +2973,76 @@ class XML3DExporter:
 
                 xml3dElem.appendChild(defElement)
 
+                # the ancestors shared by several selected objects are written once
+                if not sameLevel:
+                    selectedObjects = self.findSelectionRoots(selectedObjects)
+                writtenTransforms = set()
+                parentGroups = {}
+
                 # write all active objects to scene graph
                 c4d.StatusSetText("Exporting transformations and shaders...")
                 c4d.StatusSetBar(0)
                 for selectedObject in selectedObjects:
-                    if strategy == self.XML3D_EXPORT_STRATEGY_TAGGED  or  strategy == self.XML3D_EXPORT_STRATEGY_SELECTED  or  strategy == self.XML3D_EXPORT_STRATEGY_TAGGED_S:
+                    if strategy == self.XML3D_EXPORT_STRATEGY_TAGGED  or  strategy == self.XML3D_EXPORT_STRATEGY_SELECTED  or  strategy == self.XML3D_EXPORT_STRATEGY_TAGGED_S  or  strategy == self.XML3D_EXPORT_STRATEGY_PATCH:
                         if selectedObject != None :
-                            self.writeParentTransforms(defElement, selectedObject.GetUp())
+                            self.writeParentTransforms(defElement, selectedObject.GetUp(), writtenTransforms)
                     self.writeTransformsAndLightAndPolys(defElement, selectedObject, sameLevel)
+                self.writeMatrixTransforms()
+                if self.bakeAnimation:
+                    c4d.StatusSetText("Baking animation...")
+                    self.writeAnimations(defElement, selectedObjects, sameLevel)
+                self.logPhase("transforms and meshes %s" % os.path.basename(filename))
+
+                # the scene graph is the last user of the polygonized scene,
+                # written before the materials it can be released earlier
+                if strategy != self.XML3D_EXPORT_STRATEGY_TAGGED_S:
+                    self.writeGroups(xml3dElem, selectedObjects, strategy, sameLevel, parentGroups)
+                    self.logPhase("scene graph %s" % os.path.basename(filename))
+                    if taggedObject is taggedObjects[-1]:
+                        self.releasePolygonizedScene()
+                        self.logPhase("release polygonized document")
 
                 # write all materials
+                if self.texturePipeline != None:
+                    c4d.StatusSetText("Processing textures...")
+                    self.prepareTextures(self.rawScene.GetFirstMaterial())
                 c4d.StatusSetText("Exporting materials...")
                 c4d.StatusSetBar(0)
-                self.writeDefaultMaterial(defElement)
+                # the default shaders of the existing export stay as they are
+                if strategy != self.XML3D_EXPORT_STRATEGY_PATCH:
+                    self.writeDefaultMaterial(defElement)
                 self.writeMaterials(defElement, self.rawScene.GetFirstMaterial())
+                self.logPhase("materials %s" % os.path.basename(filename))
                 c4d.StatusSetText("Write exported data to disk")
                 
                 # write individual files for split files export
                 if strategy == self.XML3D_EXPORT_STRATEGY_TAGGED_S:
                     c4d.StatusSetText("Writing Defs")
-                    self.doc.writexml(out, " ", " ", "\n");
-                    out.close()
+                    if self.writeOutputDocument(self.doc, filename, background = True) == None:
+                        return False
+                    self.releaseDocument()
+                    self.logPhase("write %s" % os.path.basename(filename))
                    
                     # filename for groups part
                     filename = "%s_%s_group.inc" % (re.sub(".xhtml", "", basefilename), self.originalNames[taggedObject.GetName()])
-                    try:
-                        out = open(filename, 'w')
-                    except:
-                        c4d.StatusSetText("Unable to open file")
-                        print("Unable to open file %s" % filename)
-                        return False
 
                     self.doc = XML3DDocument()
                     xml3dElem = self.doc.createXml3dElement("groups")
                     self.doc.appendChild(xml3dElem)
-                    
-                # write scene graph
-                c4d.StatusSetText("Exporting scene graph...")
-                c4d.StatusSetBar(0)
-                for selectedObject in selectedObjects:
-                    if strategy == self.XML3D_EXPORT_STRATEGY_TAGGED  or  strategy == self.XML3D_EXPORT_STRATEGY_SELECTED  or  strategy == self.XML3D_EXPORT_STRATEGY_TAGGED_S:
-                        if selectedObject != None :
-                            xml3dElem = self.writeParentGroups(xml3dElem, selectedObject.GetUp())
-                    self.writeSceneGraph(xml3dElem, selectedObject, False, sameLevel)
+
+                    self.writeGroups(xml3dElem, selectedObjects, strategy, sameLevel, parentGroups)
+                    self.logPhase("scene graph %s" % os.path.basename(filename))
+
+                if strategy == self.XML3D_EXPORT_STRATEGY_PATCH:
+                    c4d.StatusSetText("Patching existing export")
+                    self.patchExport(filename, selectedObjects)
+                    self.releaseDocument()
+                    self.logPhase("patch %s" % os.path.basename(filename))
+                    continue
+
+                # the watch mode writes the changed elements of this export
+                if self.watch != None:
+                    self.watchIds = xml3dPatch.collectIds(self.doc.documentElement)
 
                 if embed == True:
                     c4d.StatusSetText("Export scripts")
@@ -1230,14 +3050,40 @@ class XML3DExporter:
 
                 # finish file groups
                 c4d.StatusSetText("Write exported data to disk")
-                self.doc.writexml(out, " ", " ", "\n");
-
-                out.close()
-
-                # ??????????? destroy the self.doc???
-
-
-
+                filename = self.writeOutputDocument(self.doc, filename, background = True)
+                if filename == None:
+                    return False
+                self.releaseDocument()
+                self.logPhase("write %s" % os.path.basename(filename))
+
+                # the manifest refers to the written scene file
+                if self.externalGeometry:
+                    c4d.StatusSetText("Write manifest")
+                    self.writeManifest(self.outputBase + "_manifest.json", filename)
+
+                if self.spatialIndex:
+                    c4d.StatusSetText("Write spatial index")
+                    self.writeSpatialIndex(self.outputBase + "_bvh.json")
+
+            # the cloned documents are not needed for the manifests, the
+            # watch mode keeps the raw one for its next runs
+            if self.watch != None:
+                self.watchRawScene = self.rawScene
+            self.releaseScenes()
+            self.logPhase("release documents")
+
+            # errors of the writer thread are raised here at the latest
+            if ownWriter:
+                c4d.StatusSetText("Waiting for files to be written")
+                writer = self.writer
+                self.writer = None
+                writer.close()
+                self.logPhase("background writing")
+
+            if self.hashedNames:
+                self.writeFileManifest(re.sub(".xhtml$", "", basefilename) + "_files.json")
+            if self.texturePipeline != None:
+                print("Textures: %d processed, %d reused from cache" % (self.texturePipeline.processed, self.texturePipeline.reused))
             elapsed = c4d.GeGetMilliSeconds() - start_time
             print("Exporting completed Comment by Joergi: %gms" % elapsed)
             c4d.StatusClear()
@@ -1247,4 +3093,359 @@ class XML3DExporter:
             traceback.print_exc(file=sys.stdout)
             print '-'*60
             return False
+        finally:
+            if ownWriter and self.writer != None:
+                # an error stopped the export, let the thread finish
+                try:
+                    self.writer.close()
+                except:
+                    pass
+                self.writer = None
+            self.releaseScenes()
+            if self.memoryLog != None:
+                self.memoryLog.stop()
+                for line in self.memoryLog.report():
+                    print(line)
+                self.memoryLog = None
         return True
+
+    def logPhase(self, name):
+        """
+        End a phase of the memory log, if it is enabled
+        """
+        if self.memoryLog != None:
+            self.memoryLog.phase(name)
+
+    def releaseDocument(self):
+        """
+        In bounded memory mode, free the written document. Its nodes refer to
+        each other and would stay until the next garbage collection.
+        """
+        if self.boundedMemory and self.doc != None:
+            self.doc.unlink()
+            self.doc = None
+
+    def releaseScenes(self):
+        """
+        Drop the cloned and the polygonized document and the objects of them
+        referenced by the exporter
+        """
+        self.rawScene = None
+        self.releasePolygonizedScene()
+
+    def releasePolygonizedScene(self):
+        """
+        Drop the polygonized document and the objects of it referenced by the
+        exporter, once the meshes and the scene graph are written
+        """
+        self.polygonizedScene = None
+        self.instanceLinks = {}
+
+    def writeBatch(self, scenes, width, height, embed, strategy):
+        """
+        Export several documents in one session, e.g. the variants of a
+        product. Each document is exported like by write() to
+        FILENAME_DOCUMENTNAME.xhtml. Meshes and textures with the same
+        content are processed once for all documents, and the finished
+        documents are written by threads while the next one is exported.
+        @param scenes: List of documents
+        @param width: Width of rendering area
+        @param height: Height of rendering area
+        @param embed: Embed into XHTML
+        @param strategy: Export strategy used for every document
+        @return: List with the result of write() for every document
+        """
+        filename = self.filename
+        baseFilename = re.sub(".xhtml$", "", self.createProperFilename(self.filename))
+        self.caches = xml3dBatch.ExportCaches()
+        self.writer = xml3dBatch.BackgroundWriter(self.writerThreads, self.writerQueueSize)
+        start_time = c4d.GeGetMilliSeconds()
+        results = []
+        names = set()
+        try:
+            for scene in scenes:
+                name = os.path.splitext(scene.GetDocumentName())[0]
+                if name in names:
+                    name = "%s_%d" % (name, len(results))
+                names.add(name)
+                self.filename = "%s_%s.xhtml" % (baseFilename, name)
+                results.append(self.write(scene, width, height, embed, strategy))
+            c4d.StatusSetText("Waiting for files to be written")
+            try:
+                self.writer.close()
+            except:
+                print("Writing the exported files failed")
+                print '-'*60
+                traceback.print_exc(file=sys.stdout)
+                print '-'*60
+                results = [False for result in results]
+        finally:
+            caches = self.caches
+            self.filename = filename
+            self.caches = None
+            self.writer = None
+        c4d.StatusClear()
+
+        elapsed = c4d.GeGetMilliSeconds() - start_time
+        saved = caches.getSavedTime()
+        meshes = caches.meshes
+        print("Batch export of %d documents: %gms" % (len(results), elapsed))
+        print("Meshes: %d processed, %d reused, %gms for content keys" % (meshes.misses, meshes.hits, meshes.overhead))
+        for pipeline in caches.texturePipelines.values():
+            print("Textures in %s: %d used by all documents, %d processed" % (pipeline.outputDirectory, len(pipeline.urls), pipeline.processed))
+        print("Estimated time saved compared with independent exports: %gms of %gms" % (saved, elapsed + saved))
+        return results
+
+    ############################################################################
+    # WATCH MODE
+
+    def getWatchSignatures(self, scene):
+        """
+        Signatures of the objects of a document for xml3dWatch.ChangeTracker.
+        The state of an object consists of the dirty counters of the object,
+        its tags and the materials it uses, which Cinema4D increases with
+        every change.
+        @param scene: Watched document
+        @return: List of (name, state) in traversal order
+        """
+        signatures = []
+        for obj in xml3dTraversal.walk(scene.GetFirstObject()):
+            state = [obj.GetType(), obj.GetDirty(c4d.DIRTYFLAGS_MATRIX | c4d.DIRTYFLAGS_DATA | c4d.DIRTYFLAGS_CACHE)]
+            for tag in obj.GetTags():
+                state.append(tag.GetDirty(c4d.DIRTYFLAGS_DATA))
+                if tag.GetType() == c4d.Ttexture:
+                    material = tag.GetMaterial()
+                    if material != None:
+                        state.append(material.GetDirty(c4d.DIRTYFLAGS_DATA))
+            signatures.append((obj.GetName(), tuple(state)))
+        return signatures
+
+    def startWatch(self, scene, width, height, embed):
+        """
+        Export a document completely and keep the export up to date. The
+        plugin reports the change events of the document with watch.notify()
+        and calls pollWatch() regularly. The caches and the clone of the
+        document stay between the runs, and a run for a few changed objects
+        clones and polygonizes them only. Their elements are written to
+        fragment files, the export itself is only rewritten by complete
+        exports and by stopWatch(). Every run writes OUTPUTBASE_changes.json,
+        which a page can poll to swap in the fragments.
+        @return: Result of the complete export
+        """
+        if self.hashedNames:
+            print("Content hash file names are not used in watch mode, the changed elements keep their files")
+            self.hashedNames = False
+        self.caches = xml3dBatch.ExportCaches()
+        self.watchScene = scene
+        self.watchSettings = (width, height, embed)
+        self.watchVersion = 0
+        self.watchFragments = {}
+        self.watch = xml3dWatch.WatchSession(lambda: self.getWatchSignatures(scene), self.watchExportAll, self.watchExportChanged)
+        self.watch.tracker.update(self.getWatchSignatures(scene))
+        return self.watchExportAll()
+
+    def stopWatch(self):
+        """
+        End the watch mode. The fragments written since the last complete
+        export are patched into it, so that it is up to date without them.
+        """
+        if self.watch == None:
+            return
+        filename = self.createProperFilename(self.filename)
+        directory = self.getWatchFragmentDirectory()
+        try:
+            if len(self.watchFragments) > 0 and os.path.isfile(filename):
+                replacements = {}
+                for id in self.watchFragments:
+                    replacements[id] = xml3dWatch.readFragment(os.path.join(directory, id + ".xml"))
+                xml3dPatch.patchFile(filename, replacements)
+                print("Patched %d changed elements into %s" % (len(replacements), filename))
+            self.watchFragments = {}
+            shutil.rmtree(directory, True)
+            self.writeWatchChanges(True, [])
+        finally:
+            self.watch = None
+            self.watchScene = None
+            self.watchRawScene = None
+            self.watchIds = None
+            self.caches = None
+
+    def pollWatch(self):
+        """
+        Export the changes of the watched document if it became quiet
+        """
+        result = self.watch.poll()
+        if result == -1:
+            print("Watch: exported the whole document, %dms after the last edit" % (1000.0 * self.watch.latency))
+        elif result != None:
+            print("Watch: exported %d changed objects, %dms after the last edit" % (result, 1000.0 * self.watch.latency))
+
+    def watchExportAll(self):
+        width, height, embed = self.watchSettings
+        self.patchIndices = None
+        self.watchRawScene = None
+        self.watchIds = None
+        result = self.write(self.watchScene, width, height, embed, self.XML3D_EXPORT_STRATEGY_COMPLETE)
+        # forget the meshes of objects which changed or were deleted
+        self.caches.meshes.prune()
+        if result:
+            # the complete export contains the fragments written so far
+            self.watchFragments = {}
+            shutil.rmtree(self.getWatchFragmentDirectory(), True)
+            self.writeWatchChanges(True, [])
+        return result
+
+    def watchExportChanged(self, indices):
+        """
+        @param indices: Traversal indices of the changed objects
+        @return: False if the objects could not be exported on their own
+        """
+        width, height, embed = self.watchSettings
+        self.patchIndices = set(indices)
+        self.patchMissing = set()
+        try:
+            result = self.write(self.watchScene, width, height, embed, self.XML3D_EXPORT_STRATEGY_PATCH)
+        finally:
+            self.patchIndices = None
+        if result == False or len(self.patchMissing) > 0:
+            # the kept clone may be partly updated, the complete export
+            # following makes a new one
+            self.watchRawScene = None
+            return False
+        self.writeWatchChanges(False, self.patchedIds)
+        return True
+
+    def updateWatchScene(self, scene, indices):
+        """
+        Replace the changed objects in the clone kept from the last complete
+        export by new clones of them. The new clones get the unique names the
+        complete export gave them, which follow from the traversal index as
+        long as the hierarchy is unchanged, else the watch exports the whole
+        document anyway.
+        @param scene: Watched document
+        @param indices: Traversal indices of the changed objects
+        @return: Set of the unique names of the changed objects and their
+        descendants or None if the kept clone doesn't match the document,
+        e.g. because a changed object was hidden in the last export
+        """
+        objects = list(xml3dTraversal.walk(scene.GetFirstObject()))
+        names = set()
+        materials = {}
+        links = []
+        replaced = []
+        end = 0
+        for index in sorted(indices):
+            # the descendants of an object follow it in traversal order and
+            # are cloned with it
+            if index < end:
+                continue
+            if index >= len(objects):
+                return None
+            obj = objects[index]
+            subtree = list(xml3dTraversal.walk(obj, False))
+            end = index + len(subtree)
+            old = self.rawScene.SearchObject(self.getUniqueName("object", index, obj.GetName()))
+            if old == None:
+                return None
+            clone = obj.GetClone()
+            for offset, cloneObj in enumerate(xml3dTraversal.walk(clone, False)):
+                self.createUniqueAndValidName(cloneObj, "object", index + offset)
+                names.add(cloneObj.GetName())
+                if not self.relinkWatchClone(subtree[offset], cloneObj, materials, links):
+                    return None
+            replaced.append((old, clone))
+
+        # instances linking to replaced objects are linked again by name
+        # once the new clones are in place
+        for obj in xml3dTraversal.walk(self.rawScene.GetFirstObject()):
+            if obj.GetType() == c4d.Oinstance and obj.GetName() not in names:
+                linkedObj = obj[c4d.INSTANCEOBJECT_LINK]
+                if linkedObj != None and linkedObj.GetName() in names:
+                    links.append((obj, linkedObj.GetName()))
+        for old, clone in replaced:
+            clone.InsertBefore(old)
+            old.Remove()
+        for obj, linkedName in links:
+            obj[c4d.INSTANCEOBJECT_LINK] = self.rawScene.SearchObject(linkedName)
+
+        # the objects of the kept clone use its materials, they get the
+        # settings of the document
+        for documentMaterial, material in materials.values():
+            name = material.GetName()
+            documentMaterial.CopyTo(material, c4d.COPYFLAGS_0)
+            material.SetName(name)
+        return names
+
+    def relinkWatchClone(self, documentObj, cloneObj, materials, links):
+        """
+        Point the instance link and the texture tags of an object cloned by
+        updateWatchScene() from the watched document to the objects and
+        materials of the kept clone. They are taken from the object of the
+        kept clone with the same name, which must link to objects and
+        materials with the same original names as the document.
+        @param documentObj: Object of the watched document
+        @param cloneObj: Its clone, already renamed
+        @param materials: Dictionary collecting the used materials by unique
+        name as (material of the document, material of the kept clone)
+        @param links: List collecting (instance, unique name of the linked
+        object), the linked object may be replaced as well
+        @return: False if the links don't match the kept clone
+        """
+        documentTags = [tag for tag in documentObj.GetTags() if tag.GetType() == c4d.Ttexture]
+        oldObj = self.rawScene.SearchObject(cloneObj.GetName())
+        if oldObj == None:
+            # removed as hidden by the last export, fine if nothing is linked
+            return len(documentTags) == 0 and documentObj.GetType() != c4d.Oinstance
+        if documentObj.GetType() == c4d.Oinstance:
+            if oldObj.GetType() != c4d.Oinstance:
+                return False
+            linkedObj = oldObj[c4d.INSTANCEOBJECT_LINK]
+            documentLinked = documentObj[c4d.INSTANCEOBJECT_LINK]
+            if linkedObj == None or documentLinked == None or self.originalNames.get(linkedObj.GetName()) != documentLinked.GetName():
+                return False
+            links.append((cloneObj, linkedObj.GetName()))
+        cloneTags = [tag for tag in cloneObj.GetTags() if tag.GetType() == c4d.Ttexture]
+        oldTags = [tag for tag in oldObj.GetTags() if tag.GetType() == c4d.Ttexture]
+        if len(oldTags) != len(documentTags):
+            return False
+        for documentTag, cloneTag, oldTag in zip(documentTags, cloneTags, oldTags):
+            documentMaterial = documentTag.GetMaterial()
+            material = oldTag.GetMaterial()
+            if documentMaterial == None and material == None:
+                continue
+            if documentMaterial == None or material == None or self.originalNames.get(material.GetName()) != documentMaterial.GetName():
+                return False
+            cloneTag.SetMaterial(material)
+            materials[material.GetName()] = (documentMaterial, material)
+        return True
+
+    def getWatchFragmentDirectory(self):
+        """
+        @return: Directory OUTPUTBASE_fragments of the fragment files
+        """
+        return re.sub(".xhtml$", "", self.createProperFilename(self.filename)) + "_fragments"
+
+    def writeWatchFragments(self, replacements):
+        """
+        Write the elements of a watch run to the fragment files
+        OUTPUTBASE_fragments/ID.xml instead of patching them into the export,
+        which would mean rewriting all of it for every edit
+        @param replacements: Dictionary mapping ids to elements
+        @return: Set of the ids which are not in the last complete export,
+        nothing is written then
+        """
+        missing = set([id for id in replacements if id not in self.watchIds])
+        if len(missing) > 0:
+            return missing
+        directory = self.getWatchFragmentDirectory()
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        for id, element in replacements.items():
+            xml3dWatch.writeFragment(os.path.join(directory, id + ".xml"), element)
+            self.watchFragments[id] = "%s/%s.xml" % (os.path.basename(directory), id)
+        return missing
+
+    def writeWatchChanges(self, full, ids):
+        self.watchVersion += 1
+        baseFilename = re.sub(".xhtml$", "", self.createProperFilename(self.filename))
+        xml3dWatch.writeChangeLog(baseFilename + "_changes.json", self.watchVersion, full, ids, self.watchFragments)
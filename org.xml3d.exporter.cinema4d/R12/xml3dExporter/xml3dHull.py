@@ -0,0 +1,332 @@
+######################################################################################
+#
+#  xml3dHull.py
+#
+#  Cinema4D to XML3D exporter plugin
+#
+#  Copyright (C) 2010 Saarland University
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+#####################################################################################
+
+"""
+Convex picking proxies for meshes with mouse events.
+
+The browser tests the triangles of a pickable mesh on every mouse move. A
+proxy with a few dozen triangles around the mesh is picked instead.
+
+The proxy is the convex hull of the vertices of the mesh which lie farthest
+along a set of directions spread evenly over the sphere. A hull of v
+vertices has at most 2v - 4 triangles, so the number of directions bounds
+the number of triangles. Finding the extreme vertices takes one pass over
+an evenly spaced sample of the vertices per direction, the hull of the few
+extreme vertices is built incrementally. The directions are stretched like the bounding box of the
+mesh, so that long and thin meshes get as many vertices at their ends as
+along their sides.
+
+The hull of the extreme vertices misses small caps of the mesh between the
+directions. It is scaled about its center until every vertex of the mesh
+is inside, so a click on the mesh always hits the proxy. For that, the
+vertices are sorted into a grid once, and a face is only tested against
+the vertices of the cells which reach beyond it. If the mesh is flat, the
+limit is below 12 triangles or the scaled hull is larger than the bounding
+box, the proxy is the bounding box.
+
+Running the module directly prints a small benchmark and checks every
+vertex against every face of the proxies.
+"""
+
+import math
+
+BOX_TRIANGLES = 12
+# vertices searched for the extreme ones, the scaling makes up for the ones
+# left out
+SAMPLE_VERTICES = 20000
+# cells per axis of the grid the vertices are sorted into for the scaling
+GRID_CELLS = 32
+
+# the six sides of the box with corner i at (i & 1, i & 2, i & 4),
+# counter-clockwise seen from the outside
+_BOX_SIDES = ((0, 4, 6, 2), (1, 3, 7, 5), (0, 1, 5, 4), (2, 6, 7, 3), (0, 2, 3, 1), (4, 5, 7, 6))
+
+def directions(count):
+    """
+    @return: count unit vectors spread evenly over the sphere (Fibonacci
+    lattice)
+    """
+    result = []
+    angle = math.pi * (3.0 - math.sqrt(5.0))
+    for i in range(count):
+        y = 1.0 - (2.0 * i + 1.0) / count
+        r = math.sqrt(max(0.0, 1.0 - y * y))
+        result.append((r * math.cos(angle * i), y, r * math.sin(angle * i)))
+    return result
+
+def _farthest(xs, ys, zs, direction):
+    """
+    @return: (index, distance) of the vertex farthest along direction
+    """
+    dx, dy, dz = direction
+    dots = [x * dx + y * dy + z * dz for x, y, z in zip(xs, ys, zs)]
+    farthest = max(dots)
+    return dots.index(farthest), farthest
+
+def extremePoints(positions, dirs):
+    """
+    @param positions: Flat sequence with three coordinates per vertex
+    @param dirs: Directions, see directions()
+    @return: Sorted indices of the vertices farthest along each direction
+    """
+    xs = positions[0::3]
+    ys = positions[1::3]
+    zs = positions[2::3]
+    return sorted(set([_farthest(xs, ys, zs, d)[0] for d in dirs]))
+
+def _sub(a, b):
+    return (a[0] - b[0], a[1] - b[1], a[2] - b[2])
+
+def _cross(a, b):
+    return (a[1] * b[2] - a[2] * b[1], a[2] * b[0] - a[0] * b[2], a[0] * b[1] - a[1] * b[0])
+
+def _dot(a, b):
+    return a[0] * b[0] + a[1] * b[1] + a[2] * b[2]
+
+def _length(a):
+    return math.sqrt(_dot(a, a))
+
+def convexHull(points, epsilon):
+    """
+    Incremental convex hull, quadratic in the number of points, meant for the
+    few points returned by extremePoints()
+    @param points: List of (x, y, z)
+    @param epsilon: Points closer to a face than this are considered inside
+    @return: List of triangles (a, b, c) indexing points, counter-clockwise
+    seen from the outside, or None if the points are flat
+    """
+    if len(points) < 4:
+        return None
+    # start with a tetrahedron as large as possible
+    a = min(range(len(points)), key=lambda i: points[i])
+    b = max(range(len(points)), key=lambda i: _length(_sub(points[i], points[a])))
+    ab = _sub(points[b], points[a])
+    if _length(ab) <= epsilon:
+        return None
+    distance = lambda i: _length(_cross(ab, _sub(points[i], points[a]))) / _length(ab)
+    c = max(range(len(points)), key=distance)
+    if distance(c) <= epsilon:
+        return None
+    normal = _cross(ab, _sub(points[c], points[a]))
+    normal = [n / _length(normal) for n in normal]
+    height = lambda i: abs(_dot(normal, _sub(points[i], points[a])))
+    d = max(range(len(points)), key=height)
+    if height(d) <= epsilon:
+        return None
+    inside = [sum([points[i][k] for i in (a, b, c, d)]) / 4.0 for k in range(3)]
+
+    def face(i, j, k):
+        # (i, j, k, normal, offset), flipped so that the inside point is behind
+        n = _cross(_sub(points[j], points[i]), _sub(points[k], points[i]))
+        length = _length(n)
+        n = (n[0] / length, n[1] / length, n[2] / length)
+        offset = _dot(n, points[i])
+        if _dot(n, inside) > offset:
+            return (i, k, j, (-n[0], -n[1], -n[2]), -offset)
+        return (i, j, k, n, offset)
+
+    faces = [face(a, b, c), face(a, b, d), face(a, c, d), face(b, c, d)]
+    for p in range(len(points)):
+        if p in (a, b, c, d):
+            continue
+        point = points[p]
+        visible = [f for f in faces if _dot(f[3], point) - f[4] > epsilon]
+        if len(visible) == 0:
+            continue
+        edges = set()
+        for f in visible:
+            edges.update(((f[0], f[1]), (f[1], f[2]), (f[2], f[0])))
+        # the horizon keeps the orientation of the faces removed behind it
+        faces = [f for f in faces if not f in visible]
+        faces.extend([face(i, j, p) for i, j in edges if not (j, i) in edges])
+    return [f[:3] for f in faces]
+
+def _scale(positions, points, triangles, center):
+    """
+    Smallest factor by which the hull has to be scaled about center so that
+    every vertex is inside. The vertices are sorted into a grid of cells. A
+    face is tested against the vertices of the cells whose box reaches
+    beyond the face, scaled by the factor found so far, only.
+    @param positions: Flat sequence with three coordinates per vertex
+    @param points: Vertices of the hull
+    @param triangles: Faces of the hull, see convexHull()
+    @return: Factor, at least 1
+    """
+    xs = positions[0::3]
+    ys = positions[1::3]
+    zs = positions[2::3]
+    low = [min(xs), min(ys), min(zs)]
+    size = max([max(xs) - low[0], max(ys) - low[1], max(zs) - low[2]])
+    # the largest coordinate falls into the last cell
+    factors = [(GRID_CELLS - 0.5) / max(high - l, 1e-7 * size) for high, l in zip((max(xs), max(ys), max(zs)), low)]
+    fx, fy, fz = factors
+    lx, ly, lz = low
+    cells = [int((x - lx) * fx) + GRID_CELLS * (int((y - ly) * fy) + GRID_CELLS * int((z - lz) * fz)) for x, y, z in zip(xs, ys, zs)]
+    occupied = sorted(set(cells))
+    cx = [lx + (cell % GRID_CELLS + 0.5) / fx for cell in occupied]
+    cy = [ly + (cell // GRID_CELLS % GRID_CELLS + 0.5) / fy for cell in occupied]
+    cz = [lz + (cell // (GRID_CELLS * GRID_CELLS) + 0.5) / fz for cell in occupied]
+    # half the size of a cell, and a margin for the rounding of the cells
+    half = [0.5 / f + 1e-9 * size for f in factors]
+    members = None
+
+    scale = 1.0
+    for a, b, c in triangles:
+        nx, ny, nz = _cross(_sub(points[b], points[a]), _sub(points[c], points[a]))
+        base = nx * center[0] + ny * center[1] + nz * center[2]
+        inner = nx * points[a][0] + ny * points[a][1] + nz * points[a][2] - base
+        if inner <= 0.0:
+            continue
+        reach = abs(nx) * half[0] + abs(ny) * half[1] + abs(nz) * half[2]
+        threshold = base + scale * inner - reach
+        suspect = [cell for cell, x, y, z in zip(occupied, cx, cy, cz) if x * nx + y * ny + z * nz > threshold]
+        if len(suspect) == 0:
+            continue
+        if members == None:
+            members = dict([(cell, []) for cell in occupied])
+            for i, cell in enumerate(cells):
+                members[cell].append(i)
+        farthest = max([xs[i] * nx + ys[i] * ny + zs[i] * nz for cell in suspect for i in members[cell]])
+        scale = max(scale, (farthest - base) / inner)
+    return scale
+
+def boxProxy(positions):
+    """
+    @return: (positions, indices) of the bounding box, 8 vertices and 12
+    triangles, flat if the mesh is
+    """
+    low = [min(positions[c::3]) for c in range(3)]
+    high = [max(positions[c::3]) for c in range(3)]
+    corners = []
+    for i in range(8):
+        corners.extend((high[0] if i & 1 else low[0], high[1] if i & 2 else low[1], high[2] if i & 4 else low[2]))
+    indices = []
+    for a, b, c, d in _BOX_SIDES:
+        indices.extend((a, b, c, a, c, d))
+    return corners, indices
+
+def pickProxy(positions, maxTriangles):
+    """
+    @param positions: Flat sequence with three coordinates per vertex
+    @param maxTriangles: Upper limit of the triangles of the proxy, a box is
+    used below 12 triangles
+    @return: (positions, indices) of the proxy, positions as flat list, the
+    triangles counter-clockwise seen from the outside
+    """
+    if len(positions) < 3:
+        return [], []
+    if maxTriangles < BOX_TRIANGLES:
+        return boxProxy(positions)
+    extent = [max(positions[c::3]) - min(positions[c::3]) for c in range(3)]
+    scale = [1.0 / max(e, 1e-7 * max(extent)) for e in extent]
+    dirs = [(x * scale[0], y * scale[1], z * scale[2]) for x, y, z in directions((maxTriangles + 4) // 2)]
+    step = 3 * max(1, len(positions) // (3 * SAMPLE_VERTICES))
+    sample = [positions[i + c] for i in range(0, len(positions) - 2, step) for c in range(3)]
+    candidates = extremePoints(sample, dirs)
+    points = [tuple(sample[3 * i : 3 * i + 3]) for i in candidates]
+    triangles = convexHull(points, 1e-7 * max(extent))
+    if triangles == None:
+        return boxProxy(positions)
+
+    # keep the vertices of the hull only
+    used = sorted(set([i for triangle in triangles for i in triangle]))
+    remap = dict([(old, new) for new, old in enumerate(used)])
+    points = [points[i] for i in used]
+    triangles = [[remap[i] for i in triangle] for triangle in triangles]
+
+    # scale about the center until every vertex is behind every face
+    center = [sum([p[c] for p in points]) / len(points) for c in range(3)]
+    scale = _scale(positions, points, triangles, center)
+    result = []
+    for point in points:
+        result.extend([center[c] + scale * (point[c] - center[c]) for c in range(3)])
+    indices = [i for triangle in triangles for i in triangle]
+    box = boxProxy(positions)
+    if volume(result, indices) >= volume(*box):
+        return box
+    return result, indices
+
+def volume(positions, indices):
+    """
+    @return: Volume of a closed mesh, negative if it is turned inside out
+    """
+    total = 0.0
+    for t in range(0, len(indices), 3):
+        a, b, c = [tuple(positions[3 * i : 3 * i + 3]) for i in indices[t : t + 3]]
+        total += _dot(a, _cross(b, c))
+    return total / 6.0
+
+if __name__ == "__main__":
+    import time
+    import random
+
+    rand = random.Random(1)
+
+    def blob(count):
+        # a lumpy, stretched sphere
+        positions = []
+        for i in range(count):
+            x, y, z = rand.gauss(0.0, 1.0), rand.gauss(0.0, 1.0), rand.gauss(0.0, 1.0)
+            r = (1.0 + 0.1 * math.sin(5.0 * x)) / math.sqrt(x * x + y * y + z * z)
+            positions.extend((300.0 * x * r, 100.0 * y * r, 50.0 * z * r))
+        return positions
+
+    def outside(positions, indices, points):
+        # largest distance of a vertex outside the proxy, relative to its
+        # size, every vertex against every face
+        xs = points[0::3]
+        ys = points[1::3]
+        zs = points[2::3]
+        worst = 0.0
+        for t in range(0, len(indices), 3):
+            a, b, c = [tuple(positions[3 * i : 3 * i + 3]) for i in indices[t : t + 3]]
+            n = _cross(_sub(b, a), _sub(c, a))
+            nx, ny, nz = [v / _length(n) for v in n]
+            worst = max(worst, _farthest(xs, ys, zs, (nx, ny, nz))[1] - _dot((nx, ny, nz), a))
+        size = max([max(positions[c::3]) - min(positions[c::3]) for c in range(3)])
+        return worst / size
+
+    print("%9s %6s %10s %10s %9s %12s %12s" % ("vertices", "limit", "triangles", "ms", "ns/vert", "vol/box", "outside"))
+    for count in (10000, 100000, 1000000):
+        positions = blob(count)
+        boxPositions, boxIndices = boxProxy(positions)
+        boxVolume = volume(boxPositions, boxIndices)
+        assert boxVolume > 0.0
+        for limit in (12, 32, 64, 128):
+            start = time.time()
+            proxyPositions, indices = pickProxy(positions, limit)
+            elapsed = time.time() - start
+            triangles = len(indices) // 3
+            assert triangles <= limit
+            ratio = volume(proxyPositions, indices) / boxVolume
+            assert ratio > 0.0
+            distance = outside(proxyPositions, indices, positions)
+            assert distance < 1e-9
+            print("%9d %6d %10d %10.1f %9.1f %12.3f %12.2e" % (count, limit, triangles, 1000.0 * elapsed, 1e9 * elapsed / count,
+                  ratio, distance))
+
+    # a flat mesh gets a flat box
+    flat = [rand.uniform(-1.0, 1.0) if c != 1 else 0.0 for i in range(1000) for c in range(3)]
+    proxyPositions, indices = pickProxy(flat, 64)
+    assert len(indices) == 3 * BOX_TRIANGLES
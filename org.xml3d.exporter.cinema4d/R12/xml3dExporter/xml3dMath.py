@@ -0,0 +1,129 @@
+######################################################################################
+#
+#  xml3dMath.py
+#
+#  Cinema4D to XML3D exporter plugin
+#
+#  Copyright (C) 2010 Saarland University
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+#####################################################################################
+
+"""
+Matrix helpers working on plain tuples, so that they don't depend on the
+Cinema4D module.
+
+Cinema4D matrices are given as 12-tuples (off, v1, v2, v3) in the Cinema4D
+coordinate system. XML3D matrices are 16-tuples in column-major order. The
+coordinate systems differ by swapping the x and z axis, which is what the
+exporter does for every position ("%g %g %g" % (pos.z, pos.y, pos.x)).
+"""
+
+IDENTITY = (1.0, 0.0, 0.0, 0.0,
+            0.0, 1.0, 0.0, 0.0,
+            0.0, 0.0, 1.0, 0.0,
+            0.0, 0.0, 0.0, 1.0)
+
+def convertMatrix(m):
+    """
+    Convert a single Cinema4D matrix to XML3D's coordinate convention
+    @param m: Cinema4D matrix as (off.x, off.y, off.z, v1.x, ..., v3.z)
+    @return: XML3D matrix as column-major 16-tuple
+    """
+    ox, oy, oz, ax, ay, az, bx, by, bz, cx, cy, cz = m
+    return (cz, cy, cx, 0.0,
+            bz, by, bx, 0.0,
+            az, ay, ax, 0.0,
+            oz, oy, ox, 1.0)
+
+def convertMatrices(matrices):
+    """
+    Convert a list of Cinema4D matrices in one go
+    @param matrices: List of 12-tuples, see convertMatrix()
+    @return: List of column-major 16-tuples
+    """
+    return [convertMatrix(m) for m in matrices]
+
+def isIdentity(m, epsilon = 0.00001):
+    """
+    Check whether a XML3D matrix is the identity
+    @param m: Column-major 16-tuple
+    @param epsilon: Tolerance for each component
+    @return: True if m does not change any point
+    """
+    for i in range(16):
+        if abs(m[i] - IDENTITY[i]) > epsilon:
+            return False
+    return True
+
+def formatMatrix(m):
+    """
+    Format a matrix as text of a float4x4 element
+    @param m: Column-major 16-tuple
+    @return: String
+    """
+    return "%g %g %g %g %g %g %g %g %g %g %g %g %g %g %g %g" % tuple(m)
+
+def unionBounds(a, b):
+    """
+    Union of two axis aligned bounding boxes
+    @param a: (minX, minY, minZ, maxX, maxY, maxZ) or None for an empty box
+    @param b: Second box or None
+    @return: Box containing both
+    """
+    if a == None:
+        return b
+    if b == None:
+        return a
+    return (min(a[0], b[0]), min(a[1], b[1]), min(a[2], b[2]),
+            max(a[3], b[3]), max(a[4], b[4]), max(a[5], b[5]))
+
+def transformBounds(bounds, m):
+    """
+    Axis aligned box containing a transformed box (Arvo's method)
+    @param bounds: (minX, minY, minZ, maxX, maxY, maxZ) or None
+    @param m: Column-major 16-tuple
+    @return: Transformed box or None
+    """
+    if bounds == None:
+        return None
+    lo = [m[12], m[13], m[14]]
+    hi = [m[12], m[13], m[14]]
+    for row in range(3):
+        for col in range(3):
+            e = m[col * 4 + row]
+            a = e * bounds[col]
+            b = e * bounds[col + 3]
+            if a < b:
+                lo[row] += a
+                hi[row] += b
+            else:
+                lo[row] += b
+                hi[row] += a
+    return (lo[0], lo[1], lo[2], hi[0], hi[1], hi[2])
+
+def boundsSphere(bounds):
+    """
+    Bounding sphere of an axis aligned box
+    @return: (centerX, centerY, centerZ, radius)
+    """
+    cx = 0.5 * (bounds[0] + bounds[3])
+    cy = 0.5 * (bounds[1] + bounds[4])
+    cz = 0.5 * (bounds[2] + bounds[5])
+    dx = bounds[3] - cx
+    dy = bounds[4] - cy
+    dz = bounds[5] - cz
+    return (cx, cy, cz, (dx * dx + dy * dy + dz * dz) ** 0.5)
@@ -0,0 +1,164 @@
+######################################################################################
+#
+#  xml3dMemory.py
+#
+#  Cinema4D to XML3D exporter plugin
+#
+#  Copyright (C) 2010 Saarland University
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+#####################################################################################
+
+"""
+Memory log of the phases of an export.
+
+The memory is measured with tracemalloc, which counts what Python allocates:
+the minidom documents, the mesh arrays and the caches. The documents held by
+Cinema4D are not included. tracemalloc needs Python 3.4, before Python 3.9
+the peak of a phase is the peak since the log was started.
+
+Without tracemalloc, like in the Python 2.6 of Cinema4D R12, the memory of
+the whole process is logged instead, which includes Cinema4D and its
+documents. The peak is the peak since the process started, so only a
+phase which raises it shows up. On Windows the retained memory is the
+working set, elsewhere only the peak is known.
+"""
+
+import sys
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+try:
+    import ctypes
+except ImportError:
+    ctypes = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+MEGABYTE = 1024.0 * 1024.0
+
+def _windowsMemory():
+    class ProcessMemoryCounters(ctypes.Structure):
+        _fields_ = [("cb", ctypes.c_ulong),
+                    ("PageFaultCount", ctypes.c_ulong),
+                    ("PeakWorkingSetSize", ctypes.c_size_t),
+                    ("WorkingSetSize", ctypes.c_size_t),
+                    ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                    ("PagefileUsage", ctypes.c_size_t),
+                    ("PeakPagefileUsage", ctypes.c_size_t)]
+    counters = ProcessMemoryCounters()
+    counters.cb = ctypes.sizeof(counters)
+    process = ctypes.windll.kernel32.GetCurrentProcess()
+    if not ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+        return None
+    return counters.PeakWorkingSetSize, counters.WorkingSetSize
+
+def processMemory():
+    """
+    @return: (peak, current) memory of the process in bytes, current is None
+    if the platform doesn't report it. None if neither is available.
+    """
+    if sys.platform == "win32":
+        if ctypes == None:
+            return None
+        try:
+            return _windowsMemory()
+        except (AttributeError, OSError):
+            return None
+    if resource == None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on Mac OS X, kilobytes on Linux
+    if sys.platform != "darwin":
+        peak *= 1024
+    return peak, None
+
+class PhaseLog:
+    """
+    Peak and retained memory at the end of every phase
+    """
+    def __init__(self):
+        self.phases = []
+        self.traced = tracemalloc != None
+        self.available = self.traced or processMemory() != None
+        self.started = False
+
+    def start(self):
+        if not self.traced:
+            return
+        # don't stop a trace started by someone else
+        self.started = not tracemalloc.is_tracing()
+        if self.started:
+            tracemalloc.start()
+        self.resetPeak()
+
+    def resetPeak(self):
+        if self.traced and hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+
+    def phase(self, name):
+        """
+        End a phase, the next one starts right away
+        """
+        if self.traced:
+            current, peak = tracemalloc.get_traced_memory()
+            self.phases.append((name, peak, current))
+            self.resetPeak()
+        elif self.available:
+            peak, current = processMemory()
+            self.phases.append((name, peak, current))
+
+    def stop(self):
+        if self.started:
+            tracemalloc.stop()
+            self.started = False
+
+    def report(self):
+        """
+        @return: Lines for the export log
+        """
+        if not self.available:
+            return ["Memory log needs tracemalloc or the memory of the process, neither is available in Python %s" % sys.version.split()[0]]
+        lines = []
+        if not self.traced:
+            lines.append("No tracemalloc in Python %s, memory of the process, peak since it started" % sys.version.split()[0])
+        lines.append("%-40s %12s %12s" % ("phase", "peak MB", "retained MB"))
+        for name, peak, current in self.phases:
+            if current == None:
+                lines.append("%-40s %12.1f %12s" % (name, peak / MEGABYTE, "-"))
+            else:
+                lines.append("%-40s %12.1f %12.1f" % (name, peak / MEGABYTE, current / MEGABYTE))
+        return lines
+
+if __name__ == "__main__":
+    log = PhaseLog()
+    log.start()
+    data = [float(i) for i in range(1000000)]
+    log.phase("allocate")
+    data = None
+    log.phase("release")
+    log.stop()
+    for line in log.report():
+        print(line)
@@ -0,0 +1,213 @@
+######################################################################################
+#
+#  xml3dNormals.py
+#
+#  Cinema4D to XML3D exporter plugin
+#
+#  Copyright (C) 2010 Saarland University
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+#####################################################################################
+
+"""
+Smooth normals with a crease angle for meshes without a Phong tag.
+
+The normals are computed per polygon corner, in the layout of
+CreatePhongNormals(): four normals per polygon, the fourth one of a triangle
+repeats the third one. The exporter then splits the vertices whose corners
+got different normals, as it does for the normals of a Phong tag.
+
+An edge shared by two polygons is a crease if the angle between their
+normals is larger than the crease angle. The corners around a vertex which
+are connected without crossing a crease form a group, and all corners of a
+group get the sum of the normals of their polygons. The face normal
+(c - a) x (d - b) is twice the area of the polygon, so larger polygons
+weigh more. Edges with more than two polygons are paired in the order of
+the polygons.
+
+The face normals are computed a column of coordinates at a time, the groups
+with a union find over the corners. Running the module directly prints a
+small benchmark.
+"""
+
+import math
+import array
+
+CREASE_ANGLE = 80.0
+
+def faceNormals(points, polygons):
+    """
+    @param points: Flat sequence with x, y, z of every point
+    @param polygons: Flat sequence with the indices a, b, c, d of every
+    polygon, triangles have c == d
+    @return: (x, y, z) arrays with the area weighted normal of every polygon
+    """
+    xs = points[0::3]
+    ys = points[1::3]
+    zs = points[2::3]
+    corners = list(zip(polygons[0::4], polygons[1::4], polygons[2::4], polygons[3::4]))
+    nx = array.array("d", [(ys[c] - ys[a]) * (zs[d] - zs[b]) - (zs[c] - zs[a]) * (ys[d] - ys[b]) for a, b, c, d in corners])
+    ny = array.array("d", [(zs[c] - zs[a]) * (xs[d] - xs[b]) - (xs[c] - xs[a]) * (zs[d] - zs[b]) for a, b, c, d in corners])
+    nz = array.array("d", [(xs[c] - xs[a]) * (ys[d] - ys[b]) - (ys[c] - ys[a]) * (xs[d] - xs[b]) for a, b, c, d in corners])
+    return nx, ny, nz
+
+def _normalized(xs, ys, zs):
+    lengths = [math.sqrt(x * x + y * y + z * z) for x, y, z in zip(xs, ys, zs)]
+    scales = [1.0 / l if l > 0.0 else 0.0 for l in lengths]
+    return ([x * s for x, s in zip(xs, scales)], [y * s for y, s in zip(ys, scales)], [z * s for z, s in zip(zs, scales)])
+
+def cornerNormals(points, polygons, creaseAngle = CREASE_ANGLE):
+    """
+    @param points: See faceNormals()
+    @param polygons: See faceNormals()
+    @param creaseAngle: Largest angle in degrees between the polygons of a
+    smooth edge
+    @return: array.array with x, y, z of the normal of every corner, four
+    corners per polygon. The normal of a group without area is 0.
+    """
+    count = len(polygons) // 4
+    fx, fy, fz = faceNormals(points, polygons)
+    ux, uy, uz = _normalized(fx, fy, fz)
+    limit = math.cos(math.radians(creaseAngle))
+    numPoints = len(points) // 3
+
+    # join the corners of the smooth edges
+    parent = list(range(4 * count))
+    def find(c):
+        while parent[c] != c:
+            parent[c] = parent[parent[c]]
+            c = parent[c]
+        return c
+
+    # edge key -> (polygon, first point, corner of it, corner of the second)
+    edges = {}
+    for f in range(count):
+        base = 4 * f
+        sides = 3 if polygons[base + 2] == polygons[base + 3] else 4
+        for k in range(sides):
+            u = polygons[base + k]
+            v = polygons[base + (k + 1) % sides]
+            key = u * numPoints + v if u < v else v * numPoints + u
+            other = edges.pop(key, None)
+            if other == None:
+                edges[key] = (f, u, base + k, base + (k + 1) % sides)
+                continue
+            g, w, cw, cx = other
+            if ux[f] * ux[g] + uy[f] * uy[g] + uz[f] * uz[g] < limit:
+                continue
+            if w != u:
+                cw, cx = cx, cw
+            for a, b in ((base + k, cw), (base + (k + 1) % sides, cx)):
+                a = find(a)
+                b = find(b)
+                if a != b:
+                    parent[a] = b
+
+    # sum the face normals of every group in its root
+    roots = [find(c) for c in range(4 * count)]
+    sx = [0.0] * (4 * count)
+    sy = [0.0] * (4 * count)
+    sz = [0.0] * (4 * count)
+    for c in range(4 * count):
+        r = roots[c]
+        f = c >> 2
+        sx[r] += fx[f]
+        sy[r] += fy[f]
+        sz[r] += fz[f]
+    nx, ny, nz = _normalized(sx, sy, sz)
+
+    # the unused fourth corner of a triangle repeats the third one
+    for f in range(count):
+        base = 4 * f
+        if polygons[base + 2] == polygons[base + 3]:
+            roots[base + 3] = roots[base + 2]
+    result = array.array("d", [0.0]) * (12 * count)
+    result[0::3] = array.array("d", [nx[r] for r in roots])
+    result[1::3] = array.array("d", [ny[r] for r in roots])
+    result[2::3] = array.array("d", [nz[r] for r in roots])
+    return result
+
+if __name__ == "__main__":
+    import time
+
+    def box(n):
+        # cube with n x n quads per side, the sides share their border points
+        points = []
+        polygons = []
+        index = {}
+        def point(p):
+            if not p in index:
+                index[p] = len(points) // 3
+                points.extend(p)
+            return index[p]
+        for axis in range(3):
+            for side in (-n, n):
+                for i in range(n):
+                    for j in range(n):
+                        corners = []
+                        for di, dj in ((0, 0), (1, 0), (1, 1), (0, 1)):
+                            p = [0, 0, 0]
+                            p[axis] = side
+                            p[(axis + 1) % 3] = 2 * (i + di) - n
+                            p[(axis + 2) % 3] = 2 * (j + dj) - n
+                            corners.append(point(tuple(p)))
+                        if side < 0:
+                            corners.reverse()
+                        polygons.extend(corners)
+        return [float(v) for v in points], polygons
+
+    def sphere(n):
+        # quads with triangles at the poles, n rings of 2n quads
+        points = [0.0, -1.0, 0.0]
+        for ring in range(1, n):
+            theta = math.pi * ring / n
+            for k in range(2 * n):
+                phi = math.pi * k / n
+                points.extend((math.sin(theta) * math.cos(phi), -math.cos(theta), math.sin(theta) * math.sin(phi)))
+        points.extend((0.0, 1.0, 0.0))
+        top = len(points) // 3 - 1
+        at = lambda ring, k: 1 + (ring - 1) * 2 * n + k % (2 * n)
+        polygons = []
+        for k in range(2 * n):
+            polygons.extend((0, at(1, k), at(1, k + 1), at(1, k + 1)))
+            polygons.extend((top, at(n - 1, k + 1), at(n - 1, k), at(n - 1, k)))
+            for ring in range(1, n - 1):
+                polygons.extend((at(ring, k), at(ring + 1, k), at(ring + 1, k + 1), at(ring, k + 1)))
+        return points, polygons
+
+    def splitCount(polygons, normals):
+        # vertices after the exporter split the ones with different normals
+        return len(set([(polygons[c], tuple([round(v, 4) for v in normals[3 * c : 3 * c + 3]])) for c in range(len(polygons))]))
+
+    points, polygons = box(4)
+    normals = cornerNormals(points, polygons)
+    assert splitCount(polygons, normals) == 6 * 5 * 5
+    assert all([sum([normals[3 * c + k] * points[3 * polygons[c] + k] for k in range(3)]) > 0.0 for c in range(len(polygons))])
+    normals = cornerNormals(points, polygons, 100.0)
+    assert splitCount(polygons, normals) == len(points) // 3
+
+    print("%10s %10s %12s %10s %12s %14s" % ("triangles", "points", "split points", "seconds", "us/triangle", "triangles/s"))
+    for n in (50, 200, 500, 1000):
+        points, polygons = sphere(n)
+        triangles = sum([1 if polygons[i + 2] == polygons[i + 3] else 2 for i in range(0, len(polygons), 4)])
+        start = time.time()
+        normals = cornerNormals(points, polygons)
+        elapsed = time.time() - start
+        # the smooth sphere doesn't need any split, all normals point outwards
+        assert all([normals[3 * c] * points[3 * polygons[c]] + normals[3 * c + 1] * points[3 * polygons[c] + 1] +
+                    normals[3 * c + 2] * points[3 * polygons[c] + 2] > 0.99 for c in range(0, len(polygons), 97)])
+        split = splitCount(polygons, normals) if n <= 200 else len(points) // 3
+        print("%10d %10d %12d %10.2f %12.2f %14.0f" % (triangles, len(points) // 3, split, elapsed, 1e6 * elapsed / triangles, triangles / elapsed))
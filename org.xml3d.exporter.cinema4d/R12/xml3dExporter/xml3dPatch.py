@@ -0,0 +1,207 @@
+######################################################################################
+#
+#  xml3dPatch.py
+#
+#  Cinema4D to XML3D exporter plugin
+#
+#  Copyright (C) 2010 Saarland University
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+#####################################################################################
+
+"""
+Replacement of single elements in an existing export without loading it.
+
+The file is read twice as a byte stream. The first pass runs expat over it
+and records the byte offsets of the elements to be replaced, the second one
+copies the bytes between them and writes the new elements instead. Nothing
+but the offsets is kept in memory, so the time depends on the size of the
+file only. The result is written to a temporary file which is renamed over
+the original one.
+
+The module does not depend on Cinema4D, the new elements are minidom nodes.
+"""
+
+import os
+import xml.parsers.expat
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+BLOCK_SIZE = 1 << 20
+
+class _Scanner:
+    """
+    expat handlers collecting the spans of the outermost elements with one
+    of the given ids
+    """
+    def __init__(self, parser, ids):
+        self.parser = parser
+        self.ids = ids
+        self.depth = 0
+        self.current = None
+        self.spans = []
+
+    def start(self, name, attributes):
+        if self.current == None:
+            id = attributes.get("id")
+            if id != None and id in self.ids:
+                self.current = (id, self.parser.CurrentByteIndex, self.depth)
+        self.depth += 1
+
+    def end(self, name):
+        self.depth -= 1
+        if self.current != None and self.current[2] == self.depth:
+            id, start, depth = self.current
+            self.spans.append((id, start, self.parser.CurrentByteIndex, depth))
+            self.current = None
+
+def findElements(path, ids):
+    """
+    Find the elements of a file by their ids. Elements inside of a found
+    element are not reported.
+    @param path: File name
+    @param ids: Set or dictionary of ids
+    @return: List of (id, start, end, depth) in file order. start is the
+    byte offset of the start tag. end is the offset of the end tag or, for
+    empty elements, the offset behind the element.
+    """
+    parser = xml.parsers.expat.ParserCreate()
+    scanner = _Scanner(parser, ids)
+    parser.StartElementHandler = scanner.start
+    parser.EndElementHandler = scanner.end
+    f = open(path, 'rb')
+    try:
+        parser.ParseFile(f)
+    finally:
+        f.close()
+    return scanner.spans
+
+def collectIds(element):
+    """
+    Ids of an element and of all elements below it, e.g. of a document
+    before it is written
+    @param element: minidom element
+    @return: Set of ids
+    """
+    ids = set()
+    stack = [element]
+    while len(stack) > 0:
+        node = stack.pop()
+        if node.nodeType != node.ELEMENT_NODE:
+            continue
+        id = node.getAttribute("id")
+        if id != "":
+            ids.add(id)
+        stack.extend(node.childNodes)
+    return ids
+
+def serialize(element, indent, addindent, newl):
+    """
+    Format an element like Document.writexml() would at the given level
+    @param indent: Indentation of the element
+    @return: Bytes without the leading indentation and the final newline
+    """
+    buffer = StringIO()
+    element.writexml(buffer, indent, addindent, newl)
+    text = buffer.getvalue()[len(indent):]
+    if newl != "" and text.endswith(newl):
+        text = text[:-len(newl)]
+    if not isinstance(text, bytes):
+        text = text.encode("utf-8")
+    return text
+
+def _copy(source, target, length):
+    while length > 0:
+        block = source.read(min(length, BLOCK_SIZE))
+        if not block:
+            break
+        target.write(block)
+        length -= len(block)
+
+def _skipEndTag(source, offset):
+    """
+    @return: Offset behind the end tag starting at offset. If there is no end
+    tag, the element was empty and offset is returned.
+    """
+    source.seek(offset)
+    if source.read(2) != b"</":
+        return offset
+    offset += 2
+    while True:
+        block = source.read(256)
+        if not block:
+            raise ValueError("Unterminated end tag")
+        position = block.find(b">")
+        if position >= 0:
+            return offset + position + 1
+        offset += len(block)
+
+def replaceFile(source, target):
+    """
+    Move source over target. os.rename() cannot replace existing files on
+    Windows before Python 3.3, there target is removed first.
+    """
+    if hasattr(os, "replace"):
+        os.replace(source, target)
+        return
+    try:
+        os.rename(source, target)
+    except OSError:
+        os.remove(target)
+        os.rename(source, target)
+
+def patchFile(path, replacements, indent = " ", addindent = " ", newl = "\n"):
+    """
+    Replace elements of an XML file by the elements with the same ids
+    @param path: File name, the file is replaced when all elements are written
+    @param replacements: Dictionary mapping ids to minidom elements
+    @param indent, addindent, newl: Formatting the file was written with,
+    see Document.writexml()
+    @return: Set of the ids not found in the file
+    """
+    spans = findElements(path, replacements)
+    temporary = path + ".patch"
+    source = open(path, 'rb')
+    try:
+        try:
+            target = open(temporary, 'wb')
+            try:
+                position = 0
+                for id, start, end, depth in spans:
+                    source.seek(position)
+                    _copy(source, target, start - position)
+                    target.write(serialize(replacements[id], indent + addindent * depth, addindent, newl))
+                    position = _skipEndTag(source, end)
+                source.seek(position)
+                _copy(source, target, os.path.getsize(path) - position)
+            finally:
+                target.close()
+        finally:
+            source.close()
+        replaceFile(temporary, path)
+    except:
+        # the original file is untouched, don't leave the partial copy behind
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+    missing = set(replacements)
+    for span in spans:
+        missing.discard(span[0])
+    return missing
@@ -0,0 +1,254 @@
+######################################################################################
+#
+#  xml3dSimplify.py
+#
+#  Cinema4D to XML3D exporter plugin
+#
+#  Copyright (C) 2010 Saarland University
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+#####################################################################################
+
+"""
+Quadric error metric mesh simplification for the level-of-detail export.
+
+The simplification works on the arrays extracted by the exporter: a list of
+(x, y, z) positions and a flat list of triangle indices. Edges are collapsed
+into one of their end points (half-edge collapse), so the surviving vertices
+keep their normals and texture coordinates and no new vertices are created.
+Edges on the border of the index topology, e.g. texture seams where the
+exporter split vertices, are protected by additional constraint planes.
+
+Running the module directly prints a small benchmark on synthetic meshes.
+"""
+
+import heapq
+import math
+
+BOUNDARY_WEIGHT = 1000.0
+
+def _plane(p0, p1, p2):
+    """
+    Plane through three points
+    @return: (a, b, c, d, area) with normalized (a, b, c) or None if the
+    triangle is degenerate
+    """
+    ux, uy, uz = p1[0] - p0[0], p1[1] - p0[1], p1[2] - p0[2]
+    vx, vy, vz = p2[0] - p0[0], p2[1] - p0[1], p2[2] - p0[2]
+    nx, ny, nz = uy * vz - uz * vy, uz * vx - ux * vz, ux * vy - uy * vx
+    length = math.sqrt(nx * nx + ny * ny + nz * nz)
+    if length == 0.0:
+        return None
+    nx, ny, nz = nx / length, ny / length, nz / length
+    return (nx, ny, nz, -(nx * p0[0] + ny * p0[1] + nz * p0[2]), 0.5 * length)
+
+def _addPlane(q, a, b, c, d, weight):
+    """
+    Add the weighted fundamental quadric of a plane to q
+    """
+    q[0] += weight * a * a
+    q[1] += weight * a * b
+    q[2] += weight * a * c
+    q[3] += weight * a * d
+    q[4] += weight * b * b
+    q[5] += weight * b * c
+    q[6] += weight * b * d
+    q[7] += weight * c * c
+    q[8] += weight * c * d
+    q[9] += weight * d * d
+
+def _error(q, r, p):
+    """
+    Evaluate the sum of two quadrics at point p
+    """
+    x, y, z = p
+    return (q[0] + r[0]) * x * x + 2.0 * (q[1] + r[1]) * x * y + 2.0 * (q[2] + r[2]) * x * z + 2.0 * (q[3] + r[3]) * x + \
+           (q[4] + r[4]) * y * y + 2.0 * (q[5] + r[5]) * y * z + 2.0 * (q[6] + r[6]) * y + \
+           (q[7] + r[7]) * z * z + 2.0 * (q[8] + r[8]) * z + (q[9] + r[9])
+
+def _normal(p0, p1, p2):
+    ux, uy, uz = p1[0] - p0[0], p1[1] - p0[1], p1[2] - p0[2]
+    vx, vy, vz = p2[0] - p0[0], p2[1] - p0[1], p2[2] - p0[2]
+    return (uy * vz - uz * vy, uz * vx - ux * vz, ux * vy - uy * vx)
+
+def simplifyMesh(positions, triangles, targetTriangleCount):
+    """
+    Reduce the number of triangles of a mesh by collapsing the edges with the
+    smallest quadric error first.
+    @param positions: List of (x, y, z) tuples
+    @param triangles: Flat list of vertex indices, three per triangle
+    @param targetTriangleCount: Stop as soon as this number is reached
+    @return: Flat list of triangle indices referencing the original positions
+    """
+    numVertices = len(positions)
+    numFaces = len(triangles) // 3
+    faces = [ [triangles[3 * i], triangles[3 * i + 1], triangles[3 * i + 2]] for i in range(numFaces) ]
+    alive = [True] * numFaces
+    vertexFaces = [ set() for i in range(numVertices) ]
+    quadrics = [ [0.0] * 10 for i in range(numVertices) ]
+
+    # Accumulate area weighted plane quadrics and count edge usage
+    edgeFaces = {}
+    for f in range(numFaces):
+        face = faces[f]
+        for k in range(3):
+            vertexFaces[face[k]].add(f)
+            a, b = face[k], face[(k + 1) % 3]
+            if a > b:
+                a, b = b, a
+            edgeFaces.setdefault((a, b), []).append(f)
+        plane = _plane(positions[face[0]], positions[face[1]], positions[face[2]])
+        if plane != None:
+            a, b, c, d, area = plane
+            for k in range(3):
+                _addPlane(quadrics[face[k]], a, b, c, d, area)
+
+    # Constrain border edges with planes perpendicular to the adjacent face
+    for edge in edgeFaces:
+        adjacent = edgeFaces[edge]
+        if len(adjacent) != 1:
+            continue
+        face = faces[adjacent[0]]
+        p0, p1 = positions[edge[0]], positions[edge[1]]
+        n = _normal(positions[face[0]], positions[face[1]], positions[face[2]])
+        ex, ey, ez = p1[0] - p0[0], p1[1] - p0[1], p1[2] - p0[2]
+        cx, cy, cz = ey * n[2] - ez * n[1], ez * n[0] - ex * n[2], ex * n[1] - ey * n[0]
+        length = math.sqrt(cx * cx + cy * cy + cz * cz)
+        if length == 0.0:
+            continue
+        cx, cy, cz = cx / length, cy / length, cz / length
+        weight = BOUNDARY_WEIGHT * (ex * ex + ey * ey + ez * ez)
+        d = -(cx * p0[0] + cy * p0[1] + cz * p0[2])
+        _addPlane(quadrics[edge[0]], cx, cy, cz, d, weight)
+        _addPlane(quadrics[edge[1]], cx, cy, cz, d, weight)
+
+    version = [0] * numVertices
+    removed = [False] * numVertices
+
+    def collapseCandidate(a, b):
+        qa, qb = quadrics[a], quadrics[b]
+        costToA = _error(qa, qb, positions[a])
+        costToB = _error(qa, qb, positions[b])
+        if costToA < costToB:
+            return (costToA, b, a, version[b], version[a])
+        return (costToB, a, b, version[a], version[b])
+
+    heap = [collapseCandidate(edge[0], edge[1]) for edge in edgeFaces]
+    heapq.heapify(heap)
+
+    def collapseFlips(src, dst):
+        target = positions[dst]
+        for f in vertexFaces[src]:
+            face = faces[f]
+            if dst in face:
+                continue
+            old = [positions[v] for v in face]
+            new = [target if v == src else positions[v] for v in face]
+            n0 = _normal(old[0], old[1], old[2])
+            n1 = _normal(new[0], new[1], new[2])
+            if n0[0] * n1[0] + n0[1] * n1[1] + n0[2] * n1[2] <= 0.0:
+                return True
+        return False
+
+    liveFaces = numFaces
+    while liveFaces > targetTriangleCount and len(heap) > 0:
+        cost, src, dst, srcVersion, dstVersion = heapq.heappop(heap)
+        if removed[src] or removed[dst] or version[src] != srcVersion or version[dst] != dstVersion:
+            continue
+        shared = vertexFaces[src] & vertexFaces[dst]
+        if len(shared) == 0 or collapseFlips(src, dst):
+            continue
+
+        # Collapse src into dst
+        for f in vertexFaces[src]:
+            face = faces[f]
+            if f in shared:
+                alive[f] = False
+                liveFaces -= 1
+                for v in face:
+                    if v != src:
+                        vertexFaces[v].discard(f)
+            else:
+                face[face.index(src)] = dst
+                vertexFaces[dst].add(f)
+        vertexFaces[src] = set()
+        removed[src] = True
+        qs, qd = quadrics[src], quadrics[dst]
+        for k in range(10):
+            qd[k] += qs[k]
+
+        # All edges at dst changed their cost
+        version[dst] += 1
+        neighbors = set()
+        for f in vertexFaces[dst]:
+            neighbors.update(faces[f])
+        neighbors.discard(dst)
+        for v in neighbors:
+            heapq.heappush(heap, collapseCandidate(dst, v))
+
+    result = []
+    for f in range(numFaces):
+        if alive[f]:
+            result.extend(faces[f])
+    return result
+
+def compactMesh(triangles):
+    """
+    Renumber the vertices referenced by a triangle list
+    @param triangles: Flat list of vertex indices
+    @return: (triangles, usedVertices) where triangles references positions in
+    usedVertices and usedVertices lists the original vertex indices
+    """
+    remap = {}
+    usedVertices = []
+    result = []
+    for v in triangles:
+        if v not in remap:
+            remap[v] = len(usedVertices)
+            usedVertices.append(v)
+        result.append(remap[v])
+    return result, usedVertices
+
+def _gridMesh(resolution):
+    """
+    Synthetic height field with resolution x resolution quads
+    """
+    positions = []
+    for j in range(resolution + 1):
+        for i in range(resolution + 1):
+            x = float(i) / resolution
+            y = float(j) / resolution
+            positions.append((x, 0.1 * math.sin(6.0 * x) * math.cos(4.0 * y), y))
+    triangles = []
+    for j in range(resolution):
+        for i in range(resolution):
+            a = j * (resolution + 1) + i
+            b = a + 1
+            c = a + resolution + 1
+            d = c + 1
+            triangles.extend((a, c, b, b, c, d))
+    return positions, triangles
+
+if __name__ == "__main__":
+    import time
+    print("%10s %10s %10s %14s" % ("triangles", "target", "seconds", "us/triangle"))
+    for resolution in (25, 50, 100, 200):
+        positions, triangles = _gridMesh(resolution)
+        numTriangles = len(triangles) // 3
+        start = time.time()
+        result = simplifyMesh(positions, triangles, numTriangles // 4)
+        elapsed = time.time() - start
+        print("%10d %10d %10.3f %14.2f" % (numTriangles, len(result) // 3, elapsed, 1000000.0 * elapsed / numTriangles))
@@ -0,0 +1,200 @@
+######################################################################################
+#
+#  xml3dTextures.py
+#
+#  Cinema4D to XML3D exporter plugin
+#
+#  Copyright (C) 2010 Saarland University
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+#####################################################################################
+
+"""
+Texture stage of the exporter. Every source image is stored once in the
+output texture folder under a name derived from its content and the
+processing settings, so identical images referenced under different names
+are written only once. An index file in the texture folder maps
+(source hash, settings) to the output file; images found there are not
+processed again.
+
+The module does not depend on Cinema4D. Downscaling is done by a callable
+given by the exporter.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+from multiprocessing.pool import ThreadPool
+
+CACHE_INDEX = ".texcache.json"
+
+def hashFile(path, blockSize = 1 << 20):
+    """
+    SHA-1 of the content of a file
+    @param path: File name
+    @param blockSize: Number of bytes read at once
+    @return: Hex digest
+    """
+    sha = hashlib.sha1()
+    f = open(path, 'rb')
+    try:
+        block = f.read(blockSize)
+        while block:
+            sha.update(block)
+            block = f.read(blockSize)
+    finally:
+        f.close()
+    return sha.hexdigest()
+
+def resolveTexturePath(filename, searchPaths):
+    """
+    Find the image file a bitmap shader refers to
+    @param filename: File name as stored in the shader, absolute or relative
+    @param searchPaths: Directories tried for relative names, e.g. the
+    document folder and its 'tex' subfolder
+    @return: Absolute path or None if the file does not exist
+    """
+    if filename == None or filename == "":
+        return None
+    if os.path.isabs(filename):
+        if os.path.isfile(filename):
+            return filename
+        filename = os.path.basename(filename)
+    for directory in searchPaths:
+        if directory == None or directory == "":
+            continue
+        path = os.path.join(directory, filename)
+        if os.path.isfile(path):
+            return os.path.abspath(path)
+    return None
+
+class TexturePipeline:
+    """
+    Collects the texture files of an export and writes them to the output
+    texture folder.
+    """
+    def __init__(self, outputDirectory, urlPrefix = "tex/", maxSize = 0, resize = None, workers = 4):
+        """
+        @param outputDirectory: Texture folder of the export
+        @param urlPrefix: Prefix of the URLs written into the scene
+        @param maxSize: Maximum width and height of the output images, 0
+        keeps the original size
+        @param resize: Callable resize(source, target, maxSize) returning
+        True if it wrote a downscaled image to target and False if the image
+        has to be copied unchanged
+        @param workers: Number of worker threads for hashing and copying
+        """
+        self.outputDirectory = outputDirectory
+        self.urlPrefix = urlPrefix
+        self.maxSize = maxSize
+        self.resize = resize
+        self.workers = workers
+        self.urls = {}
+        self.pending = []
+        self.processed = 0
+        self.reused = 0
+        self.index = {}
+        self.loadIndex()
+
+    def loadIndex(self):
+        """
+        Read the on-disk cache index of the output folder
+        """
+        path = os.path.join(self.outputDirectory, CACHE_INDEX)
+        if os.path.isfile(path):
+            try:
+                f = open(path, 'r')
+                self.index = json.load(f)
+                f.close()
+            except ValueError:
+                self.index = {}
+
+    def storeIndex(self):
+        """
+        Write the on-disk cache index of the output folder
+        """
+        f = open(os.path.join(self.outputDirectory, CACHE_INDEX), 'w')
+        json.dump(self.index, f, indent=1)
+        f.close()
+
+    def add(self, source):
+        """
+        Register a texture file for processing
+        @param source: Absolute path of the image
+        """
+        if source not in self.urls and source not in self.pending:
+            self.pending.append(source)
+
+    def getUrl(self, source):
+        """
+        @param source: Path given to add() before process() was called
+        @return: URL of the processed image or None if it is unknown
+        """
+        return self.urls.get(source)
+
+    def cacheKey(self, sourceHash):
+        """
+        Key of the cache index, depends on the image content and settings
+        """
+        return hashlib.sha1(("%s:%d" % (sourceHash, self.maxSize)).encode("ascii")).hexdigest()
+
+    def process(self):
+        """
+        Hash all pending images in parallel, then downscale or copy those not
+        found in the cache index. Copying runs on the worker threads, the
+        resize callable is only called from the calling thread.
+        """
+        if len(self.pending) == 0:
+            return
+        if not os.path.isdir(self.outputDirectory):
+            os.makedirs(self.outputDirectory)
+
+        sources = self.pending
+        self.pending = []
+        pool = ThreadPool(self.workers)
+        try:
+            hashes = pool.map(hashFile, sources)
+
+            copies = []
+            written = set()
+            for i in range(len(sources)):
+                source = sources[i]
+                key = self.cacheKey(hashes[i])
+                name = self.index.get(key)
+                if name != None and os.path.isfile(os.path.join(self.outputDirectory, name)):
+                    self.reused += 1
+                else:
+                    name = key[:20] + os.path.splitext(source)[1].lower()
+                    target = os.path.join(self.outputDirectory, name)
+                    if target not in written and not os.path.isfile(target):
+                        if self.maxSize > 0 and self.resize != None and self.resize(source, target, self.maxSize):
+                            self.processed += 1
+                        else:
+                            copies.append((source, target))
+                    written.add(target)
+                    self.index[key] = name
+                self.urls[source] = self.urlPrefix + name
+
+            pool.map(_copy, copies)
+            self.processed += len(copies)
+        finally:
+            pool.close()
+            pool.join()
+        self.storeIndex()
+
+def _copy(job):
+    shutil.copyfile(job[0], job[1])
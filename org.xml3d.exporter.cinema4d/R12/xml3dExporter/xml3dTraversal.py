@@ -0,0 +1,269 @@
+######################################################################################
+#
+#  xml3dTraversal.py
+#
+#  Cinema4D to XML3D exporter plugin
+#
+#  Copyright (C) 2010 Saarland University
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+#####################################################################################
+
+"""
+Traversal of Cinema4D hierarchies (objects, materials) with an explicit
+stack instead of recursion, so the depth of a hierarchy is not limited by
+Python's recursion limit.
+
+The walk visits the objects in the same order as the recursive passes of the
+exporter did:
+
+    while obj != None:
+        visit(obj)
+        recurse(obj.GetDown())
+        obj = obj.GetNext()
+
+Only GetDown() and GetNext() are used, so the module doesn't depend on
+Cinema4D. Running it directly compares it with the recursive version.
+
+The stack only pays off for deep hierarchies: on wide trees every object
+costs a generator step (walk) or a generator step plus the bookkeeping of
+the context (Traversal), which the recursion doesn't have. Passes over the
+whole scene therefore use walk() when they need neither context nor
+skipping, and the scene graph pass, which needs both, runs the same loop
+as walk() inline with the context kept next to the stack. Traversal is
+meant for the remaining passes over small parts of a scene. The loops
+compare with 'is' instead of '==' since that doesn't call into the
+compared objects.
+"""
+
+class Traversal:
+    """
+    Pre-order iterator over an object, its following siblings and all their
+    descendants. While an object is being processed, the iterator provides
+    its depth and the context given by its parent, and the caller may set
+    the context for its children or skip parts of the hierarchy:
+
+        walker = Traversal(obj, parentElement)
+        for obj in walker:
+            element = write(walker.context, obj)
+            walker.setChildContext(element)
+    """
+    def __init__(self, first, context = None, continueSameLevel = True):
+        """
+        @param first: First object, may be None
+        @param context: Context of the objects on the first level
+        @param continueSameLevel: Visit the siblings following first, else
+        only first and its descendants
+        """
+        self.stack = []
+        if first != None:
+            self.stack.append((first, 0, context))
+        self.continueSameLevel = continueSameLevel
+        self.current = None
+        self.depth = 0
+        self.context = context
+        self.childContext = context
+        self.visitChildren = True
+        self.visitSiblings = True
+
+    def setChildContext(self, context):
+        """
+        Set the context of the children of the current object. By default they
+        get the context of the current object.
+        """
+        self.childContext = context
+
+    def skipChildren(self):
+        """
+        Don't descend into the current object
+        """
+        self.visitChildren = False
+
+    def skipSiblings(self):
+        """
+        Don't visit the siblings following the current object, like a break
+        in the sibling loop of a recursive pass
+        """
+        self.visitSiblings = False
+
+    def __iter__(self):
+        stack = self.stack
+        continueSameLevel = self.continueSameLevel
+        while stack:
+            obj, depth, context = stack.pop()
+            self.current = obj
+            self.depth = depth
+            self.context = context
+            self.childContext = context
+            self.visitChildren = True
+            self.visitSiblings = True
+            yield obj
+            # The sibling is pushed first, so the subtree of the current
+            # object is finished before the sibling is visited
+            if self.visitSiblings and (depth > 0 or continueSameLevel):
+                sibling = obj.GetNext()
+                if sibling is not None:
+                    stack.append((sibling, depth, context))
+            if self.visitChildren:
+                child = obj.GetDown()
+                if child is not None:
+                    stack.append((child, depth + 1, self.childContext))
+        self.current = None
+
+def walk(first, continueSameLevel = True):
+    """
+    Faster pre-order generator for passes which need neither context nor
+    skipping
+    @param first: First object, may be None
+    @param continueSameLevel: Visit the siblings following first
+    """
+    if first is None:
+        return
+    if not continueSameLevel:
+        yield first
+        first = first.GetDown()
+    # only the siblings of objects with children are pushed
+    stack = []
+    push = stack.append
+    pop = stack.pop
+    obj = first
+    while obj is not None:
+        yield obj
+        sibling = obj.GetNext()
+        child = obj.GetDown()
+        if child is not None:
+            if sibling is not None:
+                push(sibling)
+            obj = child
+        elif sibling is not None:
+            obj = sibling
+        elif stack:
+            obj = pop()
+        else:
+            obj = None
+
+class _Node(object):
+    """
+    Minimal object hierarchy for the benchmark, a new-style class like the
+    Cinema4D types
+    """
+    def __init__(self):
+        self.down = None
+        self.next = None
+
+    def GetDown(self):
+        return self.down
+
+    def GetNext(self):
+        return self.next
+
+def _tree(depth, fanout):
+    """
+    Complete tree, returns the root and the number of nodes
+    """
+    root = _Node()
+    count = 1
+    if depth > 0:
+        previous = None
+        for i in range(fanout):
+            child, n = _tree(depth - 1, fanout)
+            count += n
+            if previous == None:
+                root.down = child
+            else:
+                previous.next = child
+            previous = child
+    return root, count
+
+def _chain(depth):
+    """
+    Hierarchy with one child per level
+    """
+    root = _Node()
+    node = root
+    for i in range(depth - 1):
+        node.down = _Node()
+        node = node.down
+    return root, depth
+
+def _countRecursive(obj):
+    count = 0
+    while obj is not None:
+        count += 1
+        count += _countRecursive(obj.GetDown())
+        obj = obj.GetNext()
+    return count
+
+def _countWalk(obj):
+    count = 0
+    for obj in walk(obj):
+        count += 1
+    return count
+
+def _countInline(obj):
+    # the loop of writeSceneGraph(), with the depth as context
+    count = 0
+    stack = []
+    depth = 0
+    while obj is not None:
+        count += 1
+        sibling = obj.GetNext()
+        child = obj.GetDown()
+        if child is not None:
+            if sibling is not None:
+                stack.append((sibling, depth))
+            obj = child
+            depth += 1
+        elif sibling is not None:
+            obj = sibling
+        elif stack:
+            obj, depth = stack.pop()
+        else:
+            obj = None
+    return count
+
+def _countTraversal(obj):
+    count = 0
+    walker = Traversal(obj)
+    for obj in walker:
+        walker.setChildContext(walker.depth)
+        count += 1
+    return count
+
+def _time(count, function, root):
+    """
+    Best of five runs in ms
+    """
+    import time
+    best = None
+    for i in range(5):
+        start = time.time()
+        assert function(root) == count
+        elapsed = 1000.0 * (time.time() - start)
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+if __name__ == "__main__":
+    print("%-14s %10s %14s %10s %10s %14s" % ("hierarchy", "objects", "recursive ms", "walk ms", "inline ms", "Traversal ms"))
+    for label, (root, count) in (("tree 4^8", _tree(8, 4)), ("tree 10^5", _tree(5, 10)),
+                                 ("chain 500", _chain(500)), ("chain 20000", _chain(20000))):
+        try:
+            recursive = "%14.2f" % _time(count, _countRecursive, root)
+        except RuntimeError:
+            recursive = "%14s" % "too deep"
+        print("%-14s %10d %s %10.2f %10.2f %14.2f" % (label, count, recursive, _time(count, _countWalk, root),
+                                                     _time(count, _countInline, root), _time(count, _countTraversal, root)))
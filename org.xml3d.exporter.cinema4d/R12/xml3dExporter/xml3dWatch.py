@@ -0,0 +1,222 @@
+######################################################################################
+#
+#  xml3dWatch.py
+#
+#  Cinema4D to XML3D exporter plugin
+#
+#  Copyright (C) 2010 Saarland University
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+#####################################################################################
+
+"""
+Change detection of the watch mode.
+
+Cinema4D sends a change event for every edit, for most of them many times
+and often for edits which don't affect the export, like a changed
+selection. A WatchSession collects the events with a Debouncer, and when
+the document has been quiet for a moment, it compares the signatures of all
+objects with the ones of the previous run. Only the changed objects are
+exported again. If objects were added, removed or moved, their names and
+the hierarchy of the export don't match the document anymore and the whole
+document is exported.
+
+The changed elements are not patched into the export file, which would be
+rewritten completely for every edit. Each one is written to a fragment file
+of its own and listed in the change log, see writeChangeLog(). They are
+patched into the export once when the watch ends.
+
+The module does not depend on Cinema4D: the signatures and the exports are
+functions passed to the session. The tests replay edits with a stand-in
+clock, watchbench.py measures the latency on a large scene.
+"""
+
+import json
+import time
+import xml.dom.minidom
+
+import xml3dPatch
+
+XML3D_NAMESPACE = "http://www.xml3d.org/2009/xml3d"
+
+class Debouncer:
+    """
+    Turns bursts of events into a single action, taken when no event came
+    in for delay seconds
+    """
+    def __init__(self, delay, clock = time.time):
+        self.delay = delay
+        self.clock = clock
+        self.pending = False
+        self.last = 0.0
+
+    def trigger(self):
+        self.pending = True
+        self.last = self.clock()
+
+    def ready(self):
+        """
+        @return: True if events are pending and the last one is older than
+        the delay
+        """
+        return self.pending and self.clock() - self.last >= self.delay
+
+    def reset(self):
+        self.pending = False
+
+class ChangeTracker:
+    """
+    Compares the signatures of the objects of a document between runs
+    """
+    def __init__(self):
+        self.signatures = None
+
+    def update(self, signatures):
+        """
+        @param signatures: List with one (name, state) per object in
+        traversal order. state is any comparable value which changes when
+        the object has to be exported again.
+        @return: None if the hierarchy changed, which includes the first
+        call, otherwise the list of the indices of the changed objects
+        """
+        previous = self.signatures
+        self.signatures = signatures
+        if previous == None or len(previous) != len(signatures):
+            return None
+        changed = []
+        for index in range(len(signatures)):
+            if signatures[index] != previous[index]:
+                if signatures[index][0] != previous[index][0]:
+                    return None
+                changed.append(index)
+        return changed
+
+    def reset(self):
+        """
+        Make the next update report a changed hierarchy
+        """
+        self.signatures = None
+
+class WatchSession:
+    """
+    Debounced re-export of the changed objects of a document
+    """
+    def __init__(self, collect, exportAll, exportChanged, delay = 0.25, clock = time.time):
+        """
+        @param collect: Function returning the signatures of the objects, see
+        ChangeTracker.update()
+        @param exportAll: Function exporting the whole document, returns
+        False if it failed
+        @param exportChanged: Function exporting the objects with the given
+        indices into the existing export, returns False if that was not
+        possible and the whole document has to be exported
+        @param delay: Seconds without events before exporting
+        """
+        self.collect = collect
+        self.exportAll = exportAll
+        self.exportChanged = exportChanged
+        self.clock = clock
+        self.debouncer = Debouncer(delay, clock)
+        self.tracker = ChangeTracker()
+        self.events = 0
+        self.fullRuns = 0
+        self.partialRuns = 0
+        self.skippedRuns = 0
+        self.latency = 0.0
+
+    def notify(self):
+        """
+        Report a change event of the document
+        """
+        self.events += 1
+        self.debouncer.trigger()
+
+    def poll(self):
+        """
+        Export the changes if the document became quiet. Called regularly,
+        e.g. by a timer.
+        @return: None if nothing was exported, otherwise the number of
+        exported objects or -1 for the whole document
+        """
+        if not self.debouncer.ready():
+            return None
+        self.debouncer.reset()
+        edited = self.debouncer.last
+        changed = self.tracker.update(self.collect())
+        if changed != None and len(changed) == 0:
+            self.skippedRuns += 1
+            return None
+        if changed != None and self.exportChanged(changed) != False:
+            self.partialRuns += 1
+            result = len(changed)
+        else:
+            if self.exportAll() == False:
+                # start over with a complete export at the next change
+                self.tracker.reset()
+            self.fullRuns += 1
+            result = -1
+        # time from the last edit until the files were written
+        self.latency = self.clock() - edited
+        return result
+
+def writeChangeLog(path, version, full, ids, fragments = None):
+    """
+    Write the side channel polled by a page showing the export: a JSON file
+    with a version which increases with every run, whether the whole export
+    was replaced, the ids of the elements replaced by this run and the
+    fragment files of all elements replaced since the last complete export.
+    A page loads the export, then the fragments listed, and swaps in the
+    fragments of the ids of every new version. The file is replaced
+    atomically, a reader never sees a partial file.
+    @param fragments: Dictionary mapping ids to the URLs of their fragment
+    files relative to the export
+    """
+    if fragments == None:
+        fragments = {}
+    temporary = path + ".tmp"
+    out = open(temporary, "w")
+    try:
+        json.dump({ "version" : version, "full" : full, "ids" : sorted(ids), "fragments" : fragments }, out, indent=1, sort_keys=True)
+    finally:
+        out.close()
+    xml3dPatch.replaceFile(temporary, path)
+
+def writeFragment(path, element, newl = "\n"):
+    """
+    Write a replaced element to a file of its own, in the XML3D namespace so
+    that a page can parse it and swap it in. The file is replaced
+    atomically.
+    @param element: minidom element, gets the namespace attribute
+    """
+    element.setAttribute("xmlns", XML3D_NAMESPACE)
+    temporary = path + ".tmp"
+    out = open(temporary, "wb")
+    try:
+        out.write(xml3dPatch.serialize(element, "", " ", newl))
+        out.write(newl.encode("utf-8"))
+    finally:
+        out.close()
+    xml3dPatch.replaceFile(temporary, path)
+
+def readFragment(path):
+    """
+    Read an element written by writeFragment(), without the namespace
+    attribute, e.g. for patching it into the export when the watch ends
+    @return: minidom element
+    """
+    element = xml.dom.minidom.parse(path).documentElement
+    element.removeAttribute("xmlns")
+    return element
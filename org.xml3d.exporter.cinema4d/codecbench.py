@@ -0,0 +1,106 @@
+################################################################################
+#
+#  codecbench.py
+#
+#  Size, error and speed of the compressed geometry encoding
+#
+#  Copyright (C) 2010  Saarland University
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+################################################################################
+"""
+Encodes synthetic meshes with xml3dCodec at several precisions and prints
+the size compared with 32 bit arrays, the encoding throughput and the
+largest position and normal errors after decoding. The meshes and the error
+measures are shared with tests/test_codec.py.
+
+Usage: python codecbench.py
+"""
+import os
+import sys
+import math
+import time
+import array
+import random
+
+exporterDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'R12', 'xml3dExporter')
+sys.path.append(exporterDir)
+from xml3dCodec import encodeMesh, decodeMesh, octahedralDecode, rawSize
+
+def sphereMesh(rings, segments, radius, center = (0.0, 0.0, 0.0)):
+    """
+    UV sphere with shared vertices, like the exporter writes meshes
+    """
+    positions = array.array("d")
+    normals = array.array("d")
+    texcoords = array.array("d")
+    for r in range(rings + 1):
+        theta = math.pi * r / rings
+        for s in range(segments + 1):
+            phi = 2.0 * math.pi * s / segments
+            n = (math.sin(theta) * math.cos(phi), math.cos(theta), math.sin(theta) * math.sin(phi))
+            normals.extend(n)
+            positions.extend([center[c] + radius * n[c] for c in range(3)])
+            texcoords.extend((float(s) / segments, float(r) / rings))
+    indices = array.array("i")
+    for r in range(rings):
+        for s in range(segments):
+            a = r * (segments + 1) + s
+            b = a + segments + 1
+            indices.extend((a, b, a + 1, a + 1, b, b + 1))
+    return indices, positions, normals, texcoords
+
+def randomMesh(count, seed = 1):
+    """
+    Unconnected random vertices and triangles, the worst case for the
+    difference coding
+    """
+    rand = random.Random(seed)
+    positions = array.array("d", [rand.uniform(-50.0, 50.0) for i in range(3 * count)])
+    normals = octahedralDecode(array.array("d", [rand.uniform(-1.0, 1.0) for i in range(2 * count)]))
+    texcoords = array.array("d", [rand.uniform(-2.0, 2.0) for i in range(2 * count)])
+    indices = array.array("i", [rand.randrange(count) for i in range(6 * count)])
+    return indices, positions, normals, texcoords
+
+def maxError(a, b):
+    return max([abs(a[i] - b[i]) for i in range(len(a))])
+
+def maxAngle(a, b):
+    """
+    Largest angle in radians between the unit vectors of a and b
+    """
+    angle = 0.0
+    for i in range(0, len(a), 3):
+        dot = a[i] * b[i] + a[i + 1] * b[i + 1] + a[i + 2] * b[i + 2]
+        angle = max(angle, math.acos(max(-1.0, min(1.0, dot))))
+    return angle
+
+if __name__ == "__main__":
+    meshes = [("sphere 64x128", sphereMesh(64, 128, 10.0)), ("sphere 256x512", sphereMesh(256, 512, 10.0)),
+              ("random 20k", randomMesh(20000))]
+    print("%-16s %5s %5s %10s %10s %8s %8s %12s %10s" % ("mesh", "pos", "norm", "raw", "encoded", "ratio", "MB/s", "pos error", "angle"))
+    for label, mesh in meshes:
+        indices, positions, normals, texcoords = mesh
+        raw = rawSize(indices, positions, normals, texcoords)
+        for positionBits, normalBits in ((11, 8), (14, 8), (16, 16), (20, 16)):
+            start = time.time()
+            data = encodeMesh(indices, positions, normals, texcoords, positionBits, normalBits)
+            elapsed = time.time() - start
+            decoded = decodeMesh(data)
+            positionError = maxError(positions, decoded[1])
+            angle = maxAngle(normals, decoded[2])
+            print("%-16s %5d %5d %10d %10d %7.1f%% %8.2f %12.2e %9.3fd" % (label, positionBits, normalBits, raw, len(data),
+                  100.0 * len(data) / raw, raw / (1048576.0 * max(elapsed, 1e-6)), positionError, math.degrees(angle)))
@@ -0,0 +1,104 @@
+################################################################################
+#
+#  elementbench.py
+#
+#  Cost of building the elements of an XML3D document
+#
+#  Copyright (C) 2010  Saarland University
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+################################################################################
+"""
+Builds group elements with the exporter's xml3d module and with the layout
+of the former hand-written element classes, which kept every attribute in a
+field and in a DOM attribute node, and reports time and memory per element.
+Every variant runs in a process of its own, so that the memory of one run
+doesn't hide the other.
+
+Usage: python elementbench.py [count]
+"""
+import os
+import sys
+import time
+import subprocess
+from xml.dom.minidom import Element
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+exporterDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'R12', 'xml3dExporter')
+sys.path.append(exporterDir)
+from xml3d import XML3DDocument
+
+class LegacyGroupElement(Element):
+    """
+    Layout of the former hand-written element classes
+    """
+    _id = None
+    _visible = None
+    _transform = None
+    _shader = None
+
+    def __init__(self, doc, id_, visible_, transform_, shader_):
+        Element.__init__(self, "group")
+        self.ownerDocument = doc
+        self._id = id_
+        self._visible = visible_
+        self._transform = transform_
+        self._shader = shader_
+        for name, value in (("id", id_), ("visible", visible_), ("transform", transform_), ("shader", shader_)):
+            if not (value == None):
+                self.setAttribute(name, value)
+
+def run(count, legacy):
+    """
+    Build count group elements and print time and memory
+    """
+    import resource
+
+    doc = XML3DDocument()
+    root = doc.createDefsElement()
+    if tracemalloc != None:
+        tracemalloc.start()
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.time()
+    for i in range(count):
+        if legacy:
+            e = LegacyGroupElement(doc, "group_%d" % i, "true", "#t_%d" % i, "#shader_0")
+        else:
+            e = doc.createGroupElement("group_%d" % i, "true", "#t_%d" % i, "#shader_0")
+        root.appendChild(e)
+    elapsed = time.time() - start
+    if tracemalloc != None:
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+    else:
+        memory = 1024 * (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before)
+    print("%-10s %10d %12.2f %14.1f %12.1f" % (legacy and "legacy" or "table", count, elapsed, 1000000.0 * elapsed / count, float(memory) / count))
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2:
+        run(int(sys.argv[1]), sys.argv[2] == "legacy")
+    else:
+        count = 1000000
+        if len(sys.argv) > 1:
+            count = int(sys.argv[1])
+        print("%-10s %10s %12s %14s %12s" % ("elements", "count", "seconds", "us/element", "bytes/element"))
+        for variant in ("legacy", "table"):
+            sys.stdout.flush()
+            subprocess.call([sys.executable, __file__, str(count), variant])
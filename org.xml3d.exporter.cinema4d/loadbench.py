@@ -0,0 +1,279 @@
+################################################################################
+#
+#  loadbench.py
+#
+#  Client side load cost of exported scenes
+#
+#  Copyright (C) 2010  Saarland University
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+################################################################################
+"""
+Measures what an exported scene costs the client: the number of bytes (raw
+and gzip compressed), the time to parse all files with expat and with
+ElementTree and the time to decode the numeric arrays into numbers.
+
+Every scene is rewritten in four output modes, pretty printed or compact and
+with the mesh data inline or in external files like the exporter's external
+geometry option writes them. The scenes are the checked-in sample outputs
+(or the files given on the command line) and synthetic scenes generated with
+the exporter's xml3d module.
+
+Usage: python loadbench.py [--repeat N] [scene.xhtml]+
+"""
+import sys
+import os
+import glob
+import gzip
+import array
+import random
+import timeit
+import xml.parsers.expat
+import xml.etree.ElementTree as ElementTree
+from xml.dom import minidom
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+from io import BytesIO
+
+exporterDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'R12', 'xml3dExporter')
+sys.path.append(exporterDir)
+from xml3d import XML3DDocument
+
+XML3D_NAMESPACE = "http://www.xml3d.org/2009/xml3d"
+NUMERIC_TAGS = {'float': 'd', 'float2': 'd', 'float3': 'd', 'float4': 'd', 'float4x4': 'd', 'int': 'i'}
+SYNTHETIC_SCENES = (('synthetic 20x1k', 20, 1000), ('synthetic 4x50k', 4, 50000))
+
+def localName(tag):
+    return tag.rsplit('}', 1)[-1]
+
+def serialize(node, pretty):
+    """
+    @return: UTF-8 encoded document, pretty printed like the exporter
+    writes it or without any formatting whitespace
+    """
+    buffer = StringIO()
+    if pretty:
+        node.writexml(buffer, " ", " ", "\n")
+    else:
+        node.writexml(buffer, "", "", "")
+    text = buffer.getvalue()
+    if not isinstance(text, bytes):
+        text = text.encode('utf-8')
+    return text
+
+def normalize(node):
+    """
+    Remove the formatting whitespace of a parsed document, so it can be
+    written again in any mode
+    """
+    stack = [node]
+    while len(stack) > 0:
+        node = stack.pop()
+        for child in list(node.childNodes):
+            if child.nodeType == child.TEXT_NODE:
+                if child.data.strip() == "":
+                    node.removeChild(child)
+                elif node.localName in NUMERIC_TAGS:
+                    child.data = child.data.strip()
+            elif child.nodeType == child.ELEMENT_NODE:
+                stack.append(child)
+
+def createExternalDocument():
+    external = minidom.Document()
+    root = external.createElement('xml3d')
+    root.setAttribute('xmlns', XML3D_NAMESPACE)
+    external.appendChild(root)
+    return external, root
+
+def externalize(doc, baseName):
+    """
+    Move the mesh data of a document into separate documents. Data elements
+    are replaced by a data element referencing them, the arrays of meshes
+    with inline data (written by older versions) are moved into a data
+    element referenced by the mesh.
+    @return: Dictionary mapping the file names to the new documents
+    """
+    files = {}
+    for data in doc.getElementsByTagName('data'):
+        id = data.getAttribute('id')
+        if not id.startswith('data_') or len(data.getElementsByTagName('*')) == 0:
+            continue
+        external, root = createExternalDocument()
+        placeholder = doc.createElement('data')
+        placeholder.setAttribute('id', id)
+        name = "%s_data/%s.xml" % (baseName, id[5:])
+        placeholder.setAttribute('src', "%s#%s" % (name, id))
+        data.parentNode.replaceChild(placeholder, data)
+        root.appendChild(data)
+        files[name] = external
+    for mesh in doc.getElementsByTagName('mesh'):
+        arrays = [child for child in mesh.childNodes if child.nodeType == child.ELEMENT_NODE and child.localName in NUMERIC_TAGS]
+        if len(arrays) == 0:
+            continue
+        external, root = createExternalDocument()
+        id = "data_" + mesh.getAttribute('id').replace('mesh_', '', 1)
+        data = external.createElement('data')
+        data.setAttribute('id', id)
+        root.appendChild(data)
+        for child in arrays:
+            data.appendChild(child)
+        name = "%s_data/%s.xml" % (baseName, id[5:])
+        mesh.setAttribute('src', "%s#%s" % (name, id))
+        files[name] = external
+    return files
+
+def outputModes(source, baseName):
+    """
+    @param source: Content of an exported file
+    @return: List of (mode, {file name: content})
+    """
+    modes = []
+    for external in (False, True):
+        doc = minidom.parseString(source)
+        normalize(doc)
+        documents = {baseName + '.xhtml': doc}
+        if external:
+            documents.update(externalize(doc, baseName))
+        for pretty in (True, False):
+            files = {}
+            for name in documents:
+                files[name] = serialize(documents[name], pretty)
+            mode = "%s %s" % (('compact', 'pretty')[pretty], ('inline', 'external')[external])
+            modes.append((mode, files))
+        for name in documents:
+            documents[name].unlink()
+    return modes
+
+def syntheticScene(meshes, vertices, seed = 1):
+    """
+    Scene of random meshes with positions, normals, texture coordinates and
+    about two triangles per vertex, written like the exporter does
+    """
+    rand = random.Random(seed)
+    doc = XML3DDocument()
+    xml3dElem = doc.createXml3dElement("scene")
+    xml3dElem.setAttribute("xmlns", XML3D_NAMESPACE)
+    doc.appendChild(xml3dElem)
+    defs = doc.createDefsElement()
+    xml3dElem.appendChild(defs)
+    for m in range(meshes):
+        name = "object_%d" % m
+        data = doc.createDataElement("data_" + name)
+        for tag, createElement, size, typecode in (
+                ('index', doc.createIntElement, 6, 'i'),
+                ('position', doc.createFloat3Element, 3, 'd'),
+                ('normal', doc.createFloat3Element, 3, 'd'),
+                ('texcoord', doc.createFloat2Element, 2, 'd')):
+            if typecode == 'i':
+                values = array.array('i', [rand.randrange(vertices) for i in range(size * vertices)])
+            else:
+                values = array.array('d', [round(rand.uniform(-100.0, 100.0), 4) for i in range(size * vertices)])
+            element = createElement(None, tag)
+            element.appendChild(doc.createNumericArray(values))
+            data.appendChild(element)
+        defs.appendChild(data)
+        group = doc.createGroupElement("group_" + name, "true")
+        group.appendChild(doc.createMeshElement("mesh_" + name, "true", "triangles", "#data_" + name))
+        xml3dElem.appendChild(group)
+    text = serialize(doc, True)
+    doc.unlink()
+    return text
+
+def gzipSize(content):
+    buffer = BytesIO()
+    f = gzip.GzipFile(fileobj=buffer, mode='wb', mtime=0)
+    f.write(content)
+    f.close()
+    return len(buffer.getvalue())
+
+def parseExpat(files):
+    for name in files:
+        parser = xml.parsers.expat.ParserCreate()
+        parser.Parse(files[name], True)
+
+def parseElementTree(files):
+    return [ElementTree.fromstring(files[name]) for name in files]
+
+def decodeArrays(trees):
+    """
+    @return: Number of decoded values
+    """
+    count = 0
+    for tree in trees:
+        for element in tree.iter():
+            typecode = NUMERIC_TAGS.get(localName(element.tag))
+            if typecode != None and element.text:
+                if typecode == 'i':
+                    values = array.array('i', [int(v) for v in element.text.split()])
+                else:
+                    values = array.array('d', [float(v) for v in element.text.split()])
+                count += len(values)
+    return count
+
+def best(function, repeat):
+    """
+    @return: Shortest time of repeat calls in milliseconds and the result
+    """
+    shortest = None
+    for i in range(repeat):
+        start = timeit.default_timer()
+        result = function()
+        elapsed = timeit.default_timer() - start
+        if shortest == None or elapsed < shortest:
+            shortest = elapsed
+    return 1000.0 * shortest, result
+
+def measure(files, repeat):
+    raw = 0
+    compressed = 0
+    for name in files:
+        raw += len(files[name])
+        compressed += gzipSize(files[name])
+    expatTime, ignored = best(lambda: parseExpat(files), repeat)
+    treeTime, trees = best(lambda: parseElementTree(files), repeat)
+    decodeTime, count = best(lambda: decodeArrays(trees), repeat)
+    return (len(files), raw, compressed, expatTime, treeTime, decodeTime, count)
+
+if __name__ == "__main__":
+    repeat = 3
+    arguments = sys.argv[1:]
+    if len(arguments) >= 2 and arguments[0] == '--repeat':
+        repeat = int(arguments[1])
+        arguments = arguments[2:]
+    if len(arguments) == 0:
+        arguments = sorted(glob.glob(os.path.join(exporterDir, 'sampleOutputs', '*.xhtml')))
+
+    scenes = []
+    for path in arguments:
+        f = open(path, 'rb')
+        scenes.append((os.path.basename(path), f.read()))
+        f.close()
+    for label, meshes, vertices in SYNTHETIC_SCENES:
+        scenes.append((label, syntheticScene(meshes, vertices)))
+
+    header = "%-28s %-17s %5s %11s %10s %9s %9s %9s %9s %10s"
+    row = "%-28s %-17s %5d %11d %10d %9.2f %9.2f %9.2f %9.1f %10d"
+    print(header % ("scene", "mode", "files", "bytes", "gzip", "expat ms", "etree ms", "decode ms", "MB/s", "numbers"))
+    for label, source in scenes:
+        baseName = os.path.splitext(label)[0].replace(' ', '_')
+        for mode, files in outputModes(source, baseName):
+            result = measure(files, repeat)
+            total = result[3] + result[4] + result[5]
+            throughput = result[1] / (1000.0 * max(total, 0.001))
+            print(row % ((label, mode) + result[:6] + (throughput, result[6])))
@@ -0,0 +1,100 @@
+################################################################################
+#
+#  test_codec.py
+#
+#  Round trip tests of the compressed mesh encoding
+#
+#  Copyright (C) 2010  Saarland University
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+################################################################################
+import os
+import sys
+import array
+
+import pytest
+
+# the meshes and error measures are the ones of the benchmark, which also
+# puts the exporter directory on the path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from codecbench import sphereMesh, randomMesh, maxError, maxAngle
+import xml3dCodec
+from xml3dCodec import encodeMesh, decodeMesh, tolerance, normalTolerance, TEXCOORD_BITS
+
+def rounding(values):
+    # error of the double precision arithmetic of the decoder, a few units
+    # in the last place of the largest value
+    return 4.0 * sys.float_info.epsilon * max([abs(v) for v in values])
+
+MESHES = [("sphere", sphereMesh(32, 64, 10.0)), ("random", randomMesh(5000)),
+          ("far sphere", sphereMesh(16, 32, 0.5, (10000.37, -2500.11, 0.25)))]
+BITS = [(11, 8), (14, 8), (16, 16), (20, 16), (32, 16)]
+
+@pytest.mark.parametrize("label, mesh", MESHES)
+@pytest.mark.parametrize("positionBits, normalBits", BITS)
+def test_round_trip_within_tolerance(label, mesh, positionBits, normalBits):
+    indices, positions, normals, texcoords = mesh
+    data = encodeMesh(indices, positions, normals, texcoords, positionBits, normalBits)
+    decodedIndices, decodedPositions, decodedNormals, decodedTexcoords = decodeMesh(data)
+    assert list(decodedIndices) == list(indices)
+    assert maxError(positions, decodedPositions) <= tolerance(positions, 3, positionBits) + rounding(positions)
+    assert maxAngle(normals, decodedNormals) <= normalTolerance(normalBits)
+    assert maxError(texcoords, decodedTexcoords) <= tolerance(texcoords, 2, TEXCOORD_BITS) + rounding(texcoords)
+
+def test_small_mesh_far_from_origin():
+    # a unit cube at x = 10000.37, the bounds of the header are rounded to
+    # steps of about 0.001 there, 30 quantization steps
+    positions = array.array("d")
+    for i in range(8):
+        positions.extend((10000.37 + (i & 1), 0.3 + ((i >> 1) & 1), -0.7 + ((i >> 2) & 1)))
+    positions.extend((10000.5, 0.9, -0.1))
+    indices = array.array("i", [0, 1, 2, 2, 1, 3, 4, 5, 8])
+    decoded = decodeMesh(encodeMesh(indices, positions, None, None, 14))
+    limit = tolerance(positions, 3, 14)
+    assert limit < 3.1e-5
+    assert maxError(positions, decoded[1]) <= limit + rounding(positions)
+
+def test_bounds_contain_values():
+    values = array.array("d", [10000.3, -0.1, 0.1, -10000.3, 1e-3, 0.0])
+    minimum, maximum = xml3dCodec._bounds(values, 3)
+    for c in range(3):
+        assert minimum[c] <= min(values[c::3])
+        assert maximum[c] >= max(values[c::3])
+        assert xml3dCodec.HEADER.unpack(xml3dCodec.HEADER.pack(b"X3DC", 1, 0, 0, 0, 0, 0, 0, *(minimum + maximum + [0.0] * 4)))[8 + c] == minimum[c]
+
+def test_optional_sections():
+    indices, positions, normals, texcoords = sphereMesh(4, 8, 1.0)
+    decodedIndices, decodedPositions, decodedNormals, decodedTexcoords = decodeMesh(encodeMesh(indices, positions))
+    assert decodedNormals == None
+    assert decodedTexcoords == None
+    assert len(decodedPositions) == len(positions)
+
+def test_flat_mesh():
+    positions = array.array("d", [1.0, 2.0, 3.0] * 4)
+    decoded = decodeMesh(encodeMesh(array.array("i", [0, 1, 2, 1, 2, 3]), positions))
+    assert list(decoded[1]) == list(positions)
+
+def test_indices():
+    indices = array.array("i", [0, 5, 3, 100000, 2, 2, 70000, 0])
+    data = xml3dCodec.encodeIndices(indices)
+    assert list(xml3dCodec.decodeIndices(data, len(indices))) == list(indices)
+    with pytest.raises(ValueError):
+        xml3dCodec.decodeIndices(data, len(indices) + 1)
+
+def test_not_an_encoded_mesh():
+    data = encodeMesh(array.array("i", [0, 1, 2]), array.array("d", [0.0] * 9))
+    with pytest.raises(ValueError):
+        decodeMesh(b"XXXX" + data[4:])
@@ -0,0 +1,63 @@
+################################################################################
+#
+#  test_patch.py
+#
+#  Tests of the in-place replacement of exported elements
+#
+#  Copyright (C) 2010  Saarland University
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+################################################################################
+import os
+import sys
+from xml.dom import minidom
+
+import pytest
+
+exporterDir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'R12', 'xml3dExporter')
+sys.path.append(exporterDir)
+import xml3dPatch
+
+SCENE = '<xml3d>\n <group id="a">\n  <group id="t_b"/>\n </group>\n <data id="data_c">1 2 3</data>\n</xml3d>\n'
+
+def element(text):
+    return minidom.parseString(text).documentElement
+
+def test_patch_replaces_elements(tmpdir):
+    path = str(tmpdir.join("scene.xhtml"))
+    open(path, "w").write(SCENE)
+    missing = xml3dPatch.patchFile(path, { "a" : element('<group id="a"/>'), "data_c" : element('<data id="data_c">4</data>'), "t_x" : element('<group id="t_x"/>') })
+    assert missing == set(["t_x"])
+    document = minidom.parse(path)
+    groups = [node.getAttribute("id") for node in document.getElementsByTagName("group")]
+    assert groups == ["a"]
+    assert document.getElementsByTagName("data")[0].firstChild.data.strip() == "4"
+    assert not os.path.exists(path + ".patch")
+
+def test_collect_ids():
+    ids = xml3dPatch.collectIds(minidom.parseString(SCENE).documentElement)
+    assert ids == set(["a", "t_b", "data_c"])
+
+def test_patch_failure_keeps_file(tmpdir, monkeypatch):
+    path = str(tmpdir.join("scene.xhtml"))
+    open(path, "w").write(SCENE)
+    def fail(*args):
+        raise IOError("disk full")
+    monkeypatch.setattr(xml3dPatch, "serialize", fail)
+    with pytest.raises(IOError):
+        xml3dPatch.patchFile(path, { "a" : element('<group id="a"/>') })
+    assert open(path).read() == SCENE
+    assert not os.path.exists(path + ".patch")
@@ -0,0 +1,194 @@
+################################################################################
+#
+#  test_watch.py
+#
+#  Tests of the change detection of the watch mode
+#
+#  Copyright (C) 2010  Saarland University
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+################################################################################
+import os
+import sys
+import json
+
+exporterDir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'R12', 'xml3dExporter')
+sys.path.append(exporterDir)
+from xml.dom import minidom
+from xml3dWatch import Debouncer, ChangeTracker, WatchSession, writeChangeLog, writeFragment, readFragment
+import xml3dPatch
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+    def __call__(self):
+        return self.now
+
+class Document:
+    """
+    Objects with a state each and the exports done by a session
+    """
+    def __init__(self, count):
+        self.names = ["object_%d" % i for i in range(count)]
+        self.states = [0] * count
+        self.full = 0
+        self.changed = []
+        self.fullResult = True
+        self.changedResult = True
+    def collect(self):
+        return list(zip(self.names, self.states))
+    def exportAll(self):
+        self.full += 1
+        return self.fullResult
+    def exportChanged(self, indices):
+        self.changed.append(list(indices))
+        return self.changedResult
+
+def createSession(document, clock):
+    session = WatchSession(document.collect, document.exportAll, document.exportChanged, 0.25, clock)
+    session.tracker.update(document.collect())
+    return session
+
+def test_debouncer_waits_for_quiet():
+    clock = Clock()
+    debouncer = Debouncer(0.25, clock)
+    assert not debouncer.ready()
+    debouncer.trigger()
+    clock.now += 0.2
+    assert not debouncer.ready()
+    debouncer.trigger()
+    clock.now += 0.2
+    assert not debouncer.ready()
+    clock.now += 0.05
+    assert debouncer.ready()
+    debouncer.reset()
+    assert not debouncer.ready()
+    clock.now += 1.0
+    assert not debouncer.ready()
+
+def test_tracker_reports_changed_indices():
+    tracker = ChangeTracker()
+    assert tracker.update([("a", 1), ("b", 1), ("c", 1)]) == None
+    assert tracker.update([("a", 1), ("b", 1), ("c", 1)]) == []
+    assert tracker.update([("a", 2), ("b", 1), ("c", 3)]) == [0, 2]
+
+def test_tracker_reports_changed_hierarchy():
+    tracker = ChangeTracker()
+    tracker.update([("a", 1), ("b", 1)])
+    assert tracker.update([("a", 1), ("b", 1), ("c", 1)]) == None
+    assert tracker.update([("a", 1), ("c", 1), ("b", 1)]) == None
+    assert tracker.update([("a", 1), ("c", 1), ("b", 1)]) == []
+    tracker.reset()
+    assert tracker.update([("a", 1), ("c", 1), ("b", 1)]) == None
+
+def test_session_exports_changed_objects_once_per_burst():
+    clock = Clock()
+    document = Document(100)
+    session = createSession(document, clock)
+    document.states[42] += 1
+    for event in range(5):
+        session.notify()
+        assert session.poll() == None
+        clock.now += 0.02
+    clock.now += 0.1
+    assert session.poll() == None
+    clock.now += 0.2
+    assert session.poll() == 1
+    assert document.changed == [[42]]
+    assert document.full == 0
+    assert session.events == 5
+    assert session.partialRuns == 1
+    assert abs(session.latency - 0.32) < 1e-9
+    clock.now += 1.0
+    assert session.poll() == None
+    assert document.changed == [[42]]
+
+def test_session_skips_events_without_changes():
+    clock = Clock()
+    document = Document(10)
+    session = createSession(document, clock)
+    session.notify()
+    clock.now += 0.5
+    assert session.poll() == None
+    assert session.skippedRuns == 1
+    assert document.changed == []
+    assert document.full == 0
+
+def test_session_exports_all_after_hierarchy_change():
+    clock = Clock()
+    document = Document(10)
+    session = createSession(document, clock)
+    document.names.append("object_new")
+    document.states.append(0)
+    session.notify()
+    clock.now += 0.5
+    assert session.poll() == -1
+    assert document.full == 1
+    assert document.changed == []
+
+def test_session_exports_all_if_patching_fails():
+    clock = Clock()
+    document = Document(10)
+    session = createSession(document, clock)
+    document.changedResult = False
+    document.states[3] += 1
+    session.notify()
+    clock.now += 0.5
+    assert session.poll() == -1
+    assert document.changed == [[3]]
+    assert document.full == 1
+    assert session.fullRuns == 1
+
+def test_session_starts_over_after_failed_export():
+    clock = Clock()
+    document = Document(10)
+    session = createSession(document, clock)
+    document.names.reverse()
+    document.fullResult = False
+    session.notify()
+    clock.now += 0.5
+    assert session.poll() == -1
+    # the next change exports everything again, even without a new change
+    # of the hierarchy
+    document.fullResult = True
+    document.states[0] += 1
+    session.notify()
+    clock.now += 0.5
+    assert session.poll() == -1
+    assert document.full == 2
+    assert document.changed == []
+
+def test_change_log(tmpdir):
+    path = str(tmpdir.join("scene_changes.json"))
+    writeChangeLog(path, 3, False, ["t_b", "data_a"])
+    writeChangeLog(path, 4, False, ["t_b"], { "t_b" : "scene_fragments/t_b.xml" })
+    log = json.load(open(path))
+    assert log == { "version" : 4, "full" : False, "ids" : ["t_b"], "fragments" : { "t_b" : "scene_fragments/t_b.xml" } }
+    writeChangeLog(path, 5, True, [])
+    assert json.load(open(path))["fragments"] == {}
+    assert not os.path.exists(path + ".tmp")
+
+def test_fragment_round_trip(tmpdir):
+    path = str(tmpdir.join("data_a.xml"))
+    element = minidom.parseString('<data id="data_a"><float3 name="position">1 2 3</float3></data>').documentElement
+    writeFragment(path, element)
+    written = minidom.parse(path).documentElement
+    assert written.namespaceURI == "http://www.xml3d.org/2009/xml3d"
+    read = readFragment(path)
+    assert not read.hasAttribute("xmlns")
+    assert read.getAttribute("id") == "data_a"
+    assert read.getElementsByTagName("float3")[0].firstChild.data == "1 2 3"
+    assert not os.path.exists(path + ".tmp")
@@ -0,0 +1,136 @@
+################################################################################
+#
+#  watchbench.py
+#
+#  Edit to file latency of the watch mode
+#
+#  Copyright (C) 2010  Saarland University
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+################################################################################
+"""
+Replays edits of single objects of a large exported scene through a watch
+session with the real clock, the way the plugin drives it: every edit sends
+a burst of change events 20ms apart, and the session is polled every 100ms.
+The changed data element is written to a fragment file and the change log
+is updated like the exporter does it, the scene file stays as it is. The
+time from the last event of an edit until both files are on disk is
+reported, split into the debounce wait, the change detection and the
+writing.
+
+Cloning and polygonizing the changed objects in Cinema4D comes on top of
+these numbers, the plugin prints the complete latency of every run.
+
+Usage: python watchbench.py [objects] [vertices per object]
+"""
+import os
+import sys
+import time
+import array
+import random
+import shutil
+import tempfile
+
+from loadbench import syntheticScene
+from xml3d import XML3DDocument
+import xml3dWatch
+import xml3dPatch
+
+EDITS = 10
+DELAY = 0.25
+POLL_INTERVAL = 0.1
+
+def replacementData(name, vertices, rand):
+    doc = XML3DDocument()
+    data = doc.createDataElement("data_" + name)
+    element = doc.createFloat3Element(None, "position")
+    element.appendChild(doc.createNumericArray(array.array('d', [round(rand.uniform(-100.0, 100.0), 4) for i in range(3 * vertices)])))
+    data.appendChild(element)
+    return data
+
+def run(objects, vertices):
+    rand = random.Random(1)
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, "scene.xhtml")
+        out = open(path, 'wb')
+        out.write(syntheticScene(objects, vertices))
+        out.close()
+
+        names = ["object_%d" % i for i in range(objects)]
+        states = [0] * objects
+        timing = { "detection" : 0.0, "write" : 0.0 }
+        version = [0]
+        fragmentDirectory = os.path.join(directory, "scene_fragments")
+        os.mkdir(fragmentDirectory)
+        fragments = {}
+
+        def collect():
+            start = time.time()
+            signatures = list(zip(names, states))
+            timing["detection"] += time.time() - start
+            return signatures
+
+        def exportChanged(indices):
+            start = time.time()
+            ids = []
+            for index in indices:
+                id = "data_" + names[index]
+                xml3dWatch.writeFragment(os.path.join(fragmentDirectory, id + ".xml"), replacementData(names[index], vertices, rand))
+                fragments[id] = "scene_fragments/%s.xml" % id
+                ids.append(id)
+            version[0] += 1
+            xml3dWatch.writeChangeLog(os.path.join(directory, "scene_changes.json"), version[0], False, ids, fragments)
+            timing["write"] += time.time() - start
+            return True
+
+        session = xml3dWatch.WatchSession(collect, lambda: False, exportChanged, DELAY)
+        session.tracker.update(collect())
+        latencies = []
+        for edit in range(EDITS):
+            states[rand.randrange(objects)] += 1
+            for event in range(5):
+                session.notify()
+                time.sleep(0.02)
+            while session.poll() == None:
+                time.sleep(POLL_INTERVAL)
+            latencies.append(session.latency)
+        assert session.partialRuns == EDITS and session.fullRuns == 0
+
+        size = os.path.getsize(path)
+        latency = sum(latencies) / EDITS
+        detection = timing["detection"] / (EDITS + 1)
+        write = timing["write"] / EDITS
+        print("%8d %9d %10.1f %10.0f %10.0f %10.1f %10.1f" % (objects, vertices, size / 1e6, 1000.0 * latency,
+              1000.0 * (latency - detection - write), 1000.0 * detection, 1000.0 * write))
+
+        # stopping the watch patches the fragments into the scene file once
+        start = time.time()
+        replacements = {}
+        for id in fragments:
+            replacements[id] = xml3dWatch.readFragment(os.path.join(fragmentDirectory, id + ".xml"))
+        assert len(xml3dPatch.patchFile(path, replacements)) == 0
+        print("%8s %9s %10s %10s   stop: %d fragments patched in %.0fms" % ("", "", "", "", len(replacements), 1000.0 * (time.time() - start)))
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == "__main__":
+    print("%8s %9s %10s %10s %10s %10s %10s" % ("objects", "vertices", "MB", "latency", "wait", "detection", "write"))
+    if len(sys.argv) > 2:
+        run(int(sys.argv[1]), int(sys.argv[2]))
+    else:
+        for objects, vertices in ((1000, 100), (10000, 100), (100, 10000)):
+            run(objects, vertices)